@@ -0,0 +1,57 @@
+# %% Imports
+import xarray
+
+from functions.sites import load_sites, fan_out
+from functions.store import write_maps
+from functions.telemetry import span, record_array
+from functions.trends import trend_maps
+
+# %% Define paths
+data_path = "data/processed/{}_ndvi_temperature.nc"
+save_path = "data/processed/{}_trends.nc"
+
+# %% Define the options of the trends
+# Variables of the cubes, methods of functions.trends.trend_maps() and if the
+# monthly climatology is removed before the trends
+variables = ["NDVI", "Surface Temperature"]
+methods = ["ols", "theil_sen", "mann_kendall"]
+seasonal = True
+
+# %% Function to calculate the trend maps of one site
+def site_trends(site: dict) -> str:
+    lagoon = site["key"]
+
+    # Read data, the images of stage 3 are saved in the order of the folder
+    with span("read netcdf", site=lagoon):
+        data = xarray.open_dataset(data_path.format(lagoon), decode_coords="all")
+        data = data.sortby("time").load()
+
+    maps = {}
+
+    # Calculate the trends of every pixel by tiles in parallel
+    for variable in variables:
+        cube = data[variable].transpose("time", "latitude", "longitude").values
+        record_array(f"{variable} cube", cube)
+
+        with span(f"{variable} trends", site=lagoon):
+            trends = trend_maps(cube, data["time"].values, methods, seasonal)
+
+        for name, values in trends.items():
+            maps[f"{variable} {name}"] = values
+
+    # Save the maps with the coordinates and the CRS of the cube
+    attrs = {
+        "description": "Per-pixel trends of NDVI and Surface Temperature from 1996 to 2021",
+        "slope units": "units of the variable by year",
+        "deseasonalized": int(seasonal),
+    }
+
+    return write_maps(maps, data, save_path.format(lagoon), attrs, lagoon)
+
+# %% Calculate the trends of the sites one by one, every site uses all the
+# CPUs for its tiles
+if __name__ == "__main__":
+    sites = load_sites()
+    saved = fan_out(site_trends, sites, processes=1)
+
+    print(f"{len(saved)} of {len(sites)} sites processed")
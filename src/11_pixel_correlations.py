@@ -0,0 +1,81 @@
+# %% Imports
+import numpy as np
+import pandas as pd
+
+import xarray
+
+from functions.sites import load_sites, fan_out
+from functions.store import read_table, write_maps
+from functions.telemetry import span, record_array
+from functions.trends import deseasonalize
+from functions.lagged import monthly_grid, correlation_maps, regression_maps
+
+# %% Define paths
+data_path = "data/processed/{}_ndvi_temperature.nc"
+drivers_path = "data/processed/hydrological_spectral_mean_data.parquet"
+save_path = "data/processed/{}_correlations.nc"
+
+# %% Define the options of the correlations
+# Lags in months that the drivers lead NDVI, lags of the regression (as the
+# shifts of 7_prepare_lm_data.py) and if the monthly climatology is removed
+lags = range(13)
+regression_lags = {"Precipitation": 2, "Discharge": 1}
+seasonal = True
+
+# %% Function to calculate the correlation and regression maps of one site
+def site_correlations(site: dict) -> str:
+    lagoon = site["key"]
+
+    # Read data, the images of stage 3 are saved in the order of the folder
+    with span("read netcdf", site=lagoon):
+        data = xarray.open_dataset(data_path.format(lagoon), decode_coords="all")
+        data = data.sortby("time").load()
+
+    # The lags are counted in steps, so the cube goes on every month between
+    # the first and the last image, NaN in the months without images
+    cube = data["NDVI"].transpose("time", "latitude", "longitude").values
+    months, cube = monthly_grid(cube, data["time"].values)
+    record_array("NDVI cube", cube)
+
+    # Drivers of the site (the variables available and the SOI) aligned with
+    # the months of the cube, NaN in the months without data
+    with span("read drivers", site=lagoon):
+        names = [v for v in site["variables"] if v != "NDVI"] + ["SOI"]
+        table = read_table(drivers_path, columns=names, lagoons=[lagoon])
+
+        table.index = table["Time"].values.astype("datetime64[M]")
+        table = table[~table.index.duplicated()].reindex(months)
+
+        drivers = {name: table[name].to_numpy("float64", na_value=np.nan) for name in names}
+
+    if seasonal:
+        cube = deseasonalize(cube, months)
+        drivers = {name: deseasonalize(x, months) for name, x in drivers.items()}
+
+    # Correlate every pixel with the lagged drivers and regress it over all
+    # drivers together
+    with span("correlation maps", site=lagoon):
+        maps = correlation_maps(cube, drivers, lags)
+
+    with span("regression maps", site=lagoon):
+        regression = regression_maps(cube, drivers, regression_lags)
+
+    maps.update({f"regression {name}": values for name, values in regression.items()})
+
+    # Save the maps with the coordinates and the CRS of the cube
+    attrs = {
+        "description": "Per-pixel lagged correlation and regression of NDVI over its drivers",
+        "lag units": "months that the driver leads NDVI",
+        "regression lags": str({name: regression_lags.get(name, 0) for name in names}),
+        "deseasonalized": int(seasonal),
+    }
+
+    return write_maps(maps, data, save_path.format(lagoon), attrs, lagoon)
+
+# %% Calculate the maps of all sites in parallel, the products of matrices
+# of every site already use several threads
+if __name__ == "__main__":
+    sites = load_sites()
+    saved = fan_out(site_correlations, sites)
+
+    print(f"{len(saved)} of {len(sites)} sites processed")
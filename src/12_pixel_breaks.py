@@ -0,0 +1,53 @@
+# %% Imports
+import xarray
+
+from functions.sites import load_sites, fan_out
+from functions.store import write_maps
+from functions.telemetry import span, record_array
+from functions.breaks import break_maps
+
+# %% Define paths
+data_path = "data/processed/{}_ndvi_temperature.nc"
+save_path = "data/processed/{}_breaks.nc"
+
+# %% Define the options of the breaks
+# Harmonics of the annual cycle, fraction of the dates at every side of a
+# break and one of every how many months is tested as break
+order = 2
+trim = 0.15
+every = 1
+
+# %% Function to find the NDVI breaks of one site
+def site_breaks(site: dict) -> str:
+    lagoon = site["key"]
+
+    # Read data, the images of stage 3 are saved in the order of the folder
+    with span("read netcdf", site=lagoon):
+        data = xarray.open_dataset(data_path.format(lagoon), decode_coords="all")
+        data = data.sortby("time").load()
+
+    cube = data["NDVI"].transpose("time", "latitude", "longitude").values
+    record_array("NDVI cube", cube)
+
+    # Find the most likely break of every pixel
+    with span("break maps", site=lagoon):
+        maps = break_maps(cube, data["time"].values, order, trim, every)
+
+    # Save the maps with the coordinates and the CRS of the cube
+    attrs = {
+        "description": "Per-pixel break of the NDVI: date, change of level and slope and significance",
+        "break_time units": "decimal years",
+        "slope_change units": "NDVI by year",
+        "harmonics": order,
+    }
+
+    return write_maps(
+        {f"NDVI {name}": values for name, values in maps.items()}, data, save_path.format(lagoon), attrs, lagoon
+    )
+
+# %% Find the breaks of all sites in parallel
+if __name__ == "__main__":
+    sites = load_sites()
+    saved = fan_out(site_breaks, sites)
+
+    print(f"{len(saved)} of {len(sites)} sites processed")
@@ -0,0 +1,43 @@
+# %% Imports
+import xarray
+
+from functions.sites import load_sites, fan_out
+from functions.store import save_netcdf
+from functions.telemetry import span
+from functions.climatology import monthly_climatology
+
+# %% Define paths
+data_path = "data/processed/{}_ndvi_temperature.nc"
+save_path = "data/processed/{}_climatology.nc"
+
+# %% Define the options of the climatology
+variables = ["NDVI", "Surface Temperature"]
+percentiles = [10, 50, 90]
+
+# %% Function to calculate the climatology of one site
+def site_climatology(site: dict) -> str:
+    lagoon = site["key"]
+
+    # Open data without loading it, the climatology reads a month at a time
+    data = xarray.open_dataset(data_path.format(lagoon), decode_coords="all")
+
+    with span("climatology", site=lagoon):
+        climatology = monthly_climatology(data, variables, percentiles)
+
+    # Save the climatology with the CRS of the cube
+    attrs = {
+        "description": "Per-pixel climatology of NDVI and Surface Temperature by calendar month",
+        "Surface Temperature units": "°C",
+    }
+    save_netcdf(climatology, save_path.format(lagoon), attrs, lagoon)
+
+    data.close()
+
+    return save_path.format(lagoon)
+
+# %% Calculate the climatology of all sites in parallel
+if __name__ == "__main__":
+    sites = load_sites()
+    saved = fan_out(site_climatology, sites)
+
+    print(f"{len(saved)} of {len(sites)} sites processed")
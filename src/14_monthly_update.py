@@ -0,0 +1,60 @@
+# %% Imports
+import os
+import pandas as pd
+
+from functions.store import read_table
+from functions.sites import load_sites
+from functions.telemetry import span
+from functions.incremental import (
+    new_state, same_options, update, load_state, save_state, correlation_matrix, regression, anomalies,
+)
+
+# %% Define paths
+data_path = "data/processed/hydrological_spectral_mean_data.parquet"
+state_path = "data/processed/{}_monthly_state.json"
+
+# %% Define the options of the update
+# Months that the drivers lead NDVI (as 7_prepare_lm_data.py) and if the
+# statistics are built again from all the months
+lags = {"Precipitation": 2, "Discharge": 1}
+rebuild = False
+
+sites = load_sites()
+
+# %% Add the new months of every lagoon to its statistics
+for lagoon, site in sites.items():
+    variables = [v for v in site["variables"] if v != "NDVI"] + ["SOI", "NDVI"]
+    path = state_path.format(lagoon)
+
+    state = load_state(path) if os.path.exists(path) and not rebuild else None
+
+    # A state of other variables or lags can't be updated, its statistics
+    # are built again from all the months
+    if state is not None and not same_options(state, variables, lags):
+        print(f"{lagoon}: the variables or the lags changed, the statistics are built again")
+        state = None
+
+    if state is None:
+        state = new_state(variables, lags)
+
+    # Only the months after the last month added are read
+    start = None if state["last"] is None else (pd.Period(state["last"], freq="M") + 1).start_time
+    new = read_table(data_path, columns=variables, lagoons=[lagoon], start=start)
+
+    with span("update statistics", site=lagoon, months=len(new)):
+        for row in new.itertuples(index=False):
+            update(state, row.Time, {v: getattr(row, v) for v in variables})
+
+    save_state(state, path)
+
+    print(f"\n{lagoon.capitalize()}: {len(new)} new months, last month {state['last']}")
+
+    # Anomalies of the last month, correlations and regression of the
+    # anomalies of all months
+    if len(new):
+        print("Anomalies of the last month [std]:", anomalies(state, new.Time.iloc[-1], new.iloc[-1]).round(2), sep="\n")
+
+    print("Correlation of the anomalies:", correlation_matrix(state).round(2), sep="\n")
+
+    model = regression(state)
+    print(f"Regression of the NDVI anomalies (R² = {model.attrs['r2']:0.3f}, {model.attrs['months']} months):", model, sep="\n")
@@ -0,0 +1,160 @@
+# %% Imports
+import numpy as np
+import pandas as pd
+
+import xarray
+
+from functions.sites import load_sites, fan_out
+from functions.store import write_table, save_netcdf
+from functions.telemetry import span
+from functions.clustering import minibatch_kmeans, assign
+
+# %% Define paths
+data_path = "data/processed/{}_ndvi_temperature.nc"
+climatology_path = "data/processed/{}_climatology.nc"
+trends_path = "data/processed/{}_trends.nc"
+correlations_path = "data/processed/{}_correlations.nc"
+
+save_path = "data/processed/{}_clusters.nc"
+save_table_path = "data/processed/cluster_mean_data.parquet"
+
+# %% Define the options of the clusters
+# Number of clusters by forest, pixels read from disk at a time and
+# passes of the mini-batch k-means
+k = 5
+chunk_pixels = 65536
+epochs = 5
+
+# Variables of the series by cluster with their names in the tables
+variables = {"NDVI": "NDVI", "Surface Temperature": "Temperature"}
+
+# %% Functions to read the features by rows of the images
+def row_chunks(nx: int, ny: int) -> list[slice]:
+    rows = max(1, chunk_pixels // nx)
+    return [slice(y0, min(y0 + rows, ny)) for y0 in range(0, ny, rows)]
+
+
+def read_features(products: dict[str, xarray.Dataset], rows: slice) -> np.ndarray:
+    # Monthly climatology of the NDVI, its amplitude, its trend and its
+    # correlation with the precipitation, as (pixels, features)
+    profile = products["climatology"]["NDVI mean"].isel(latitude=rows).values
+    profile = profile.reshape(12, -1).T
+
+    amplitude = profile.max(axis=1) - profile.min(axis=1)
+    trend = products["trends"]["NDVI ols_slope"].isel(latitude=rows).values.ravel()
+    correlation = products["correlations"]["Precipitation correlation"].isel(latitude=rows).values.ravel()
+
+    return np.column_stack([profile, amplitude, trend, correlation]).astype("float64")
+
+# %% Function to cluster the pixels of one site
+def site_clusters(site: dict) -> pd.DataFrame:
+    lagoon = site["key"]
+
+    # Open the products without loading them, they are read by rows
+    products = {
+        "climatology": xarray.open_dataset(climatology_path.format(lagoon)),
+        "trends": xarray.open_dataset(trends_path.format(lagoon)),
+        "correlations": xarray.open_dataset(correlations_path.format(lagoon)),
+    }
+    data = xarray.open_dataset(data_path.format(lagoon), decode_coords="all")
+
+    ny, nx = data.sizes["latitude"], data.sizes["longitude"]
+    chunks = row_chunks(nx, ny)
+
+    # Mean and standard deviation of the features, to give them the same weight
+    with span("feature statistics", site=lagoon):
+        n, total, squares = 0, 0.0, 0.0
+
+        for rows in chunks:
+            features = read_features(products, rows)
+            features = features[np.isfinite(features).all(axis=1)]
+
+            n += len(features)
+            total = total + features.sum(axis=0)
+            squares = squares + (features ** 2).sum(axis=0)
+
+        mean = total / n
+        scale = np.sqrt(squares / n - mean ** 2)
+        scale[scale == 0] = 1.0
+
+    def batches():
+        for rows in chunks:
+            features = read_features(products, rows)
+            yield (features[np.isfinite(features).all(axis=1)] - mean) / scale
+
+    with span("minibatch kmeans", site=lagoon):
+        centers = minibatch_kmeans(batches, k, epochs)
+
+    # Number the clusters from the lowest to the highest mean NDVI
+    order = np.argsort(centers[:, :12].mean(axis=1))
+    centers = centers[order]
+
+    # Label every pixel and add its series to the sums of its cluster
+    labels = np.full((ny, nx), -1, dtype=np.int16)
+    sums = {v: np.zeros((data.sizes["time"], k)) for v in variables}
+    counts = {v: np.zeros((data.sizes["time"], k)) for v in variables}
+
+    with span("labels and series", site=lagoon):
+        for rows in chunks:
+            features = read_features(products, rows)
+            valid = np.isfinite(features).all(axis=1)
+
+            label = np.full(len(features), -1)
+            label[valid] = assign((features[valid] - mean) / scale, centers)[0]
+            labels[rows] = label.reshape(-1, nx)
+
+            members = (label[:, None] == np.arange(k)).astype("float64")
+
+            for v in variables:
+                cube = data[v].isel(latitude=rows).transpose("time", "latitude", "longitude").values
+                cube = cube.reshape(cube.shape[0], -1)
+
+                sums[v] += np.nan_to_num(cube) @ members
+                counts[v] += np.isfinite(cube) @ members
+
+    # Mean series of every cluster
+    with np.errstate(invalid="ignore", divide="ignore"):
+        series = {v: sums[v] / counts[v] for v in variables}
+
+    # Save the labels and the series with the coordinates and the CRS of the cube
+    clusters = xarray.Dataset(
+        {
+            "cluster": (("latitude", "longitude"), labels),
+            **{f"{v} mean": (("time", "k"), series[v].astype(np.float32)) for v in variables},
+            "centers": (("k", "feature"), (centers * scale + mean).astype(np.float32)),
+        },
+        coords={
+            "latitude": data["latitude"], "longitude": data["longitude"], "time": data["time"],
+            "k": np.arange(k), "feature": [f"NDVI month {m}" for m in range(1, 13)] + ["amplitude", "trend", "precipitation correlation"],
+        },
+    )
+    clusters["cluster"].encoding["_FillValue"] = -1
+    attrs = {
+        "description": "Phenology clusters of the forest pixels and the mean series by cluster",
+        "features": "NDVI climatology, amplitude, OLS trend and lagged correlation with precipitation",
+    }
+    save_netcdf(clusters.sortby("time"), save_path.format(lagoon), attrs, lagoon)
+
+    # Series by cluster as columns of a table by month, with the dates at
+    # the end of the month like the other tables
+    table = pd.DataFrame(
+        {f"{name} {i}": series[v][:, i] for v, name in variables.items() for i in range(k)},
+        index=data["time"].values,
+    )
+    table.index = table.index.to_period("M").to_timestamp(how="end").normalize()
+    table = table.groupby(level=0).mean()
+
+    for dataset in [data, *products.values()]:
+        dataset.close()
+
+    return table.rename_axis("Time").reset_index().assign(Lagoon=lagoon)
+
+# %% Cluster the pixels of all sites in parallel and save the series by
+# cluster of all sites in a table
+if __name__ == "__main__":
+    sites = load_sites()
+    tables = fan_out(site_clusters, sites)
+
+    write_table(pd.concat(tables.values()), save_table_path)
+
+    print(f"{len(tables)} of {len(sites)} sites processed")
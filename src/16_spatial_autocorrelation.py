@@ -0,0 +1,78 @@
+# %% Imports
+import warnings
+import numpy as np
+
+import xarray
+
+from functions.sites import load_sites, fan_out
+from functions.store import write_maps
+from functions.telemetry import span
+from functions.spatial import lisa, morans_i, morans_i_series, QUADRANTS
+
+# %% Define paths
+data_path = "data/processed/{}_ndvi_temperature.nc"
+save_path = "data/processed/{}_lisa.nc"
+
+# %% Define the options of the spatial autocorrelation
+# Neighbours of the pixels, permutations of the LISA and pseudo p-value of
+# the significant clusters
+variables = ["NDVI", "Surface Temperature"]
+kind = "queen"
+permutations = 999
+significance = 0.05
+
+# %% Function to calculate the spatial autocorrelation of one site
+def site_autocorrelation(site: dict) -> str:
+    lagoon = site["key"]
+
+    # Read data, the images of stage 3 are saved in the order of the folder
+    with span("read netcdf", site=lagoon):
+        data = xarray.open_dataset(data_path.format(lagoon), decode_coords="all")
+        data = data.sortby("time").load()
+
+    maps, series, attrs = {}, {}, {}
+
+    for variable in variables:
+        cube = data[variable].transpose("time", "latitude", "longitude").values
+
+        # Clusters of the mean map, the permutations run in parallel
+        with span(f"{variable} lisa", site=lagoon):
+            # The pixels without data give an empty slice warning
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                field = np.nanmean(cube, axis=0)
+
+            local = lisa(field, kind, permutations=permutations, significance=significance)
+            result = morans_i(field, kind)
+
+        for name, values in local.items():
+            maps[f"{variable} mean {name}"] = values
+
+        attrs[f"{variable} mean Moran's I"] = result["I"]
+        attrs[f"{variable} mean Moran's I pvalue"] = result["pvalue"]
+
+        # Global autocorrelation of every image
+        with span(f"{variable} moran series", site=lagoon):
+            moran = morans_i_series(cube, kind)
+
+        series[f"{variable} Moran's I"] = (("time",), moran["I"].astype(np.float32))
+        series[f"{variable} Moran's I pvalue"] = (("time",), moran["pvalue"].astype(np.float32))
+
+    # Save the maps with the coordinates and the CRS of the cube
+    attrs = attrs | {
+        "description": "Local and global Moran's I of NDVI and Surface Temperature",
+        "weights": f"{kind} contiguity, row-standardized",
+        "quadrants": str(QUADRANTS | {0: "not significant"}),
+        "permutations": permutations,
+        "significance": significance,
+    }
+
+    return write_maps(maps | series, data, save_path.format(lagoon), attrs, lagoon)
+
+# %% Calculate the autocorrelation of the sites one by one, every site uses
+# all the CPUs for its permutations
+if __name__ == "__main__":
+    sites = load_sites()
+    saved = fan_out(site_autocorrelation, sites, processes=1)
+
+    print(f"{len(saved)} of {len(sites)} sites processed")
@@ -0,0 +1,100 @@
+# %% Imports
+import numpy as np
+import pandas as pd
+
+import xarray
+
+from functions.sites import load_sites, fan_out
+from functions.store import read_table
+from functions.telemetry import span
+from functions.stat_utils import harmonic_regression
+from functions.stat_plots import plot_wavelet_coherence
+from functions.render import figure_job, render_figures
+from functions.wavelets import wavelet_coherence, coherence_significance, ar1
+
+# %% Define paths
+data_path = "data/processed/hydrological_spectral_mean_data.parquet"
+save_path = "data/processed/{}_wavelet_coherence.nc"
+save_images_path = "images/{}_{}_wavelet_coherence.{}"
+
+# %% Define the options of the coherence
+# Drivers of NDVI with their titles, the drivers not available for a site
+# are skipped
+drivers = {
+    "SOI": "NDVI ~ SOI",
+    "Precipitation": "NDVI ~ Precipitation",
+}
+
+# Spacing between periods in octaves, red noise surrogates and significance
+# level of the Monte Carlo test
+dj = 1 / 12
+surrogates = 1000
+level = 0.95
+
+# %% Function to calculate the wavelet coherence of one site
+def site_coherence(site: dict) -> dict:
+    lagoon = site["key"]
+    names = [d for d in drivers if d == "SOI" or d in site["variables"]]
+
+    # Monthly series without missing months, the gaps are filled with the
+    # trend and the annual cycle of every series
+    with span("read table", site=lagoon):
+        table = read_table(data_path, columns=["NDVI", *names], lagoons=[lagoon])
+        table = table.set_index("Time")[["NDVI", *names]].sort_index()
+        table = table.resample("ME").mean()
+
+        table = harmonic_regression(table)["filled"]
+
+    # Every driver with NDVI as pairs of series, all at once
+    x = table[names].to_numpy()
+    y = np.repeat(table[["NDVI"]].to_numpy(), len(names), axis=1)
+
+    with span("wavelet coherence", site=lagoon):
+        result = wavelet_coherence(x, y, dj=dj)
+
+    # Red noise of every driver and NDVI, the surrogates run in parallel
+    with span("significance", site=lagoon):
+        alpha_x, alpha_y = ar1(x), ar1(y)
+        significance = np.stack([
+            coherence_significance(len(table), ax, ay, dj=dj, surrogates=surrogates, level=level)
+            for ax, ay in zip(alpha_x, alpha_y)
+        ])
+
+    # Save the spectra by driver, period and time
+    coherence = xarray.Dataset(
+        {
+            "coherence": (("driver", "period", "time"), result["coherence"].astype(np.float32)),
+            "phase": (("driver", "period", "time"), result["phase"].astype(np.float32)),
+            "cross power": (("driver", "period", "time"), result["cross power"].astype(np.float32)),
+            "significance": (("driver", "period"), significance.astype(np.float32)),
+            "coi": (("time",), result["coi"].astype(np.float32)),
+        },
+        coords={"driver": names, "period": result["period"], "time": table.index.values},
+    )
+    coherence.attrs["description"] = "Wavelet coherence of NDVI with its drivers (Morlet wavelet)"
+    coherence.attrs["period units"] = "months"
+    coherence.attrs["phase"] = "radians, positive when the driver leads NDVI"
+    coherence.attrs["significance"] = f"{level} level of {surrogates} pairs of red noise series"
+
+    with span("save netcdf", site=lagoon):
+        coherence.to_netcdf(save_path.format(lagoon))
+
+    filename = save_images_path.format(site["number"], lagoon, "svg")
+
+    return figure_job(
+        plot_wavelet_coherence, filename, coherence, {d: drivers[d] for d in names}
+    )
+
+# %% Calculate the coherence of all sites, the surrogates of every site
+# already use all CPUs, and render the figures in parallel
+if __name__ == "__main__":
+    sites = load_sites()
+
+    # Number the figures after the figures of the other stages
+    for i, site in enumerate(sites.values()):
+        site["number"] = 20 + i
+
+    jobs = fan_out(site_coherence, sites, processes=1)
+    rendered = render_figures(list(jobs.values()))
+
+    print(f"{len(jobs)} of {len(sites)} sites processed")
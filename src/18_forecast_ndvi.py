@@ -0,0 +1,103 @@
+# %% Imports
+import os
+import pandas as pd
+
+from functions.store import read_table, write_table
+from functions.sites import load_sites
+from functions.telemetry import span
+from functions.forecasting import (
+    lagged_drivers, order_grid, select_orders, forecast, save_models, load_models,
+)
+
+# %% Define paths
+data_path = "data/processed/hydrological_spectral_mean_data.parquet"
+clusters_path = "data/processed/cluster_mean_data.parquet"
+models_path = "data/processed/sarimax_models.json"
+save_path = "data/processed/ndvi_forecasts.parquet"
+
+# %% Define the options of the forecasts
+# Months that the drivers lead NDVI (as 7_prepare_lm_data.py), the drivers
+# not available for a site are skipped
+lags = {"Precipitation": 2, "Discharge": 1, "Temperature": 0, "SOI": 0}
+
+# Months to forecast, significance level of the intervals, months after
+# the fit before the orders are selected again and if all models are
+# fitted again
+steps = 12
+alpha = 0.05
+refit_every = 12
+rebuild = False
+
+# Candidate orders of the models
+orders = order_grid()
+
+sites = load_sites()
+
+# %% Functions to read the series of NDVI of the lagoons and their zones
+def read_series() -> dict[str, tuple[pd.Series, pd.DataFrame]]:
+    data = read_table(data_path, columns=["NDVI", *lags])
+    zones = read_table(clusters_path) if os.path.exists(clusters_path) else None
+
+    series = {}
+    for lagoon, site in sites.items():
+        subset = data[data.Lagoon == lagoon].set_index("Time").sort_index()
+        subset = subset.resample("ME").mean(numeric_only=True)
+
+        drivers = [d for d in lags if d == "SOI" or d in site["variables"]]
+        exog = lagged_drivers(subset, {d: lags[d] for d in drivers}, steps)
+
+        series[lagoon] = (subset["NDVI"], exog)
+
+        # Mean NDVI of every phenology cluster, with the drivers of its lagoon
+        if zones is None:
+            continue
+
+        clusters = zones[zones.Lagoon == lagoon].set_index("Time").sort_index()
+        clusters = clusters.reindex(subset.index)
+
+        for column in [c for c in clusters.columns if c.startswith("NDVI ")]:
+            series[f"{lagoon} cluster {column.split()[-1]}"] = (clusters[column], exog)
+
+    return series
+
+# %% Select the orders of the models in parallel or use the saved models,
+# and forecast all series
+if __name__ == "__main__":
+    series = read_series()
+    models = load_models(models_path) if os.path.exists(models_path) and not rebuild else {}
+
+    # The models are fitted again after refit_every months or if their
+    # drivers changed, the others only add the new months
+    stale = {
+        name: (y, exog) for name, (y, exog) in series.items()
+        if name not in models
+        or models[name]["exog"] != exog.columns.tolist()
+        or (y.index[-1].to_period("M") - pd.Period(models[name]["fitted"], freq="M")).n >= refit_every
+    }
+
+    if stale:
+        with span("select orders", series=len(stale), orders=len(orders)):
+            models.update(select_orders(stale, orders))
+
+        save_models(models, models_path)
+
+    with span("forecast", series=len(series)):
+        forecasts = forecast(models, series, steps, alpha)
+
+    # Save the forecasts of all series in a table
+    table = pd.concat([
+        frame.rename(columns=lambda c: "NDVI" if c == "mean" else f"NDVI {c}").assign(
+            Lagoon=name.split()[0], Zone=" ".join(name.split()[1:]) or "all"
+        )
+        for name, frame in forecasts.items()
+    ])
+    write_table(table.rename_axis("Time").reset_index(), save_path)
+
+    for name, model in models.items():
+        if name in sites:
+            print(
+                f"{name.capitalize()}: SARIMAX{model['order']}x{model['seasonal_order']} "
+                f"with {', '.join(model['exog'])} (AIC = {model['aic']:0.1f})"
+            )
+
+    print(f"{len(stale)} models fitted, {len(forecasts)} series forecasted {steps} months ahead")
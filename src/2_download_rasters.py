@@ -1,9 +1,13 @@
 # %% Imports
+import os
 import ee
 import geemap
 
 from statgis.landsat_functions import landsat_scaler, landsat_cloud_mask
 from functions.gee_processing import renamer7, renamer8, calc_ndvi
+from functions.cog import to_cog, write_empty
+from functions.scene_catalog import ee_client, refresh_catalog, months_with_scenes
+from functions.sites import load_sites
 
 ee.Initialize()
 
@@ -13,10 +17,20 @@ L7 = ee.ImageCollection("LANDSAT/LE07/C02/T1_L2").filter(ee.Filter.calendarRange
 L8 = ee.ImageCollection("LANDSAT/LC08/C02/T1_L2").filter(ee.Filter.calendarRange(2014, 2021, "year"))
 
 # %% Load mangrove forests feature collection
-forests = ee.FeatureCollection("projects/ee-sebnarvaez-mangroves/assets/forests")
+forests_asset = "projects/ee-sebnarvaez-mangroves/assets/forests"
+forests = ee.FeatureCollection(forests_asset)
 
-# %% Define the keys to iterate the forests
-keys = ["mallorquin", "totumo", "virgen"]
+# %% Define the keys to iterate the forests from the sites registry
+keys = list(load_sites())
+
+# If True, convert the images to Cloud-Optimized GeoTIFF after the download,
+# so the windowed reads only decode the tiles they touch
+cog = False
+
+# %% Update the local catalog of scenes to plan the exports without consulting
+# Earth Engine month by month
+catalog_path = "data/processed/scene_catalog.csv"
+catalog = refresh_catalog(catalog_path, ee_client(forests_asset), keys, "1996-01-01", "2022-01-01")
 
 # %% Iterate the forests to download image by forests and date
 for key in keys:
@@ -29,10 +43,22 @@ for key in keys:
     l7 = L7.filterBounds(roi).map(landsat_scaler).map(landsat_cloud_mask).map(renamer7).map(calc_ndvi)
     l8 = L8.filterBounds(roi).map(landsat_scaler).map(landsat_cloud_mask).map(renamer8).map(calc_ndvi)
 
+    # Months with at least one scene by sensor, the other months are not
+    # exported but written as empty images after, so every site keeps one
+    # image by month
+    months = {s: months_with_scenes(catalog, key, [s]) for s in ["L5", "L7", "L8"]}
+    empty = []
+
     # For loop to iterate throught years
     for i in range(1996, 2022):
         # For loop to iterate throught months
         for j in range(1, 13):
+            # Skip the months without scenes of the sensor of the year
+            sensor = "L5" if i < 1999 else "L7" if i < 2014 else "L8"
+            if (i, j) not in months[sensor]:
+                empty.append(f"data/raster/{key}/{i:04d}-{j:02d}-01.tif")
+                continue
+
             # If the image is from before 1999 use Landsat 5, filter them by the
             # year and the month, calculate the mean and set the date
             if i < 1999:
@@ -70,4 +96,16 @@ for key in keys:
             print(f"{key}: image {j:02d}-{i:04d}")
             geemap.ee_export_image(
                 img, filename=filename, scale=30, region=roi, unmask_value=-3e5
-            )
\ No newline at end of file
+            )
+
+            if cog:
+                to_cog(filename)
+
+    # Write the months without scenes with the grid of an exported image and
+    # all pixels as nodata, like a month covered by clouds
+    folder = f"data/raster/{key}/"
+    template = next(folder + name for name in sorted(os.listdir(folder)) if folder + name not in empty)
+
+    for filename in empty:
+        print(f"{key}: empty image {filename}")
+        write_empty(template, filename, nodata=-3e5)
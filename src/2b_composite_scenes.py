@@ -0,0 +1,38 @@
+# %% Imports
+from functions.compositing import write_composites
+from functions.sites import load_sites
+
+# %% Define the paths of the per-scene images and the composites
+# The per-scene images must have the same bands of 2_download_rasters.py
+# and be named with their acquisition date (YYYY-MM-DD.tif)
+scenes_path = "data/scenes/{}/"
+save_path = "data/raster/{}/"
+
+# %% Define the compositing options
+# Calendar period to group the scenes: "month", "season" or "year"
+period = "month"
+
+# Compositing rule: "mean", "median" or "max_ndvi"
+method = "median"
+
+# Rows read at once from every scene in the median, reduce it to use less memory
+block_rows = 256
+
+# If True, save the composites as Cloud-Optimized GeoTIFFs
+cog = False
+
+# %% Define the keys to composite the images from the sites registry
+lagoons = list(load_sites())
+
+# %% Composite the scenes by lagoon
+for lagoon in lagoons:
+    saved = write_composites(
+        scenes_path.format(lagoon),
+        save_path.format(lagoon),
+        period=period,
+        method=method,
+        block_rows=block_rows,
+        cog=cog,
+    )
+
+    print(f"{lagoon}: {len(saved)} {method} composites saved")
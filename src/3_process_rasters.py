@@ -3,40 +3,54 @@ import os
 import numpy as np
 
 import xarray
-import rioxarray
 import rasterio
+from rasterio.windows import Window
+
+from functions.sites import load_sites, fan_out
+from functions.store import save_netcdf
+from functions.telemetry import span, record_array
 
 # %% Define the paths to get and save the images
 path = "data/raster/{}/"
 save_path = "data/processed/{}_{}"
 
-# %% Define the keys to get the images
-lagoons = ["mallorquin", "totumo", "virgen"]
+# %% Function to process the images of one site
+def process_site(site: dict) -> str:
+    lagoon = site["key"]
 
-# %% For loop throught the keys to get the images
-for lagoon in lagoons:
     path_images = path.format(lagoon)       # Define the path of the images
     images = os.listdir(path_images)        # Search all images in the earlier defined path
 
-    # For loop throught the images
-    for image in images:
-        path_image = path_images + image    # Define the image path
-
-        # Open the image with rasterio
-        with rasterio.open(path_image, "r") as src:
-            # Get the limits of the images to define the coordinates
-            lims = src.bounds
-
-            # If the images if the first of all, define a new array with
-            # the Surface temperature and another with the NDVI
-            if image == images[0]:
-                temp = src.read(5)
-                ndvi = src.read(6)
-
-            # Else, concat the new array to the previously created
-            else:
-                temp = np.dstack([temp, src.read(5)])
-                ndvi = np.dstack([ndvi, src.read(6)])
+    # Size and bounds of the images from the first one, all images of a site
+    # have the same grid
+    with rasterio.open(path_images + images[0], "r") as src:
+        lims = src.bounds
+        shape = (src.height, src.width, len(images))
+        dtype = np.result_type(src.dtypes[4], src.dtypes[5])
+
+    # Cubes allocated once, so they are not copied by every image. Only the
+    # surface temperature and NDVI bands are read, the tiled images (COGs)
+    # by their tiles and the striped images at once
+    temp = np.empty(shape, dtype=dtype)
+    ndvi = np.empty(shape, dtype=dtype)
+
+    with span("read images", site=lagoon):
+        for i, image in enumerate(images):
+            with rasterio.open(path_images + image, "r") as src:
+                if src.profile.get("tiled", False):
+                    windows = [window for _, window in src.block_windows(5)]
+                else:
+                    windows = [Window(0, 0, src.width, src.height)]
+
+                for window in windows:
+                    rows, cols = window.toslices()
+                    block = src.read([5, 6], window=window)
+
+                    temp[rows, cols, i] = block[0]
+                    ndvi[rows, cols, i] = block[1]
+
+    record_array("NDVI cube", ndvi)
+    record_array("temperature cube", temp)
 
     # With the date in the path of the image define the time dimension
     t = np.array([ti[:-4] for ti in images], dtype="datetime64")
@@ -78,14 +92,19 @@ for lagoon in lagoons:
     # Merge NDVI and Temperature DataArrays to save on one Dataset
     data = xarray.merge([ndvi, temp])
 
-    # Transpose and define the CRS and the spatial dims to save it
-    data = data.transpose("time", "latitude", "longitude")
-    data = data.rio.write_crs("EPSG:4326")
-    data = data.rio.set_spatial_dims(x_dim="longitude", y_dim="latitude")
+    # Save data as a NetCDF file with the CRS and some attributes
+    attrs = {
+        "description": "NDVI and Surface Temperature extracted from LANDSAT SR images from 1996 to 2021",
+        "Surface Temperature units": "°C",
+    }
+
+    return save_netcdf(
+        data.transpose("time", "latitude", "longitude"), save_path.format(lagoon, "ndvi_temperature.nc"), attrs, lagoon
+    )
 
-    # Define some attributes
-    data.attrs["description"] = "NDVI and Surface Temperature extracted from LANDSAT SR images from 1996 to 2021"
-    data.attrs["Surface Temperature units"] = "°C"
+# %% Process the images of all sites in parallel
+if __name__ == "__main__":
+    sites = load_sites()
+    saved = fan_out(process_site, sites)
 
-    # Save data as a NetCDF file
-    data.to_netcdf(save_path.format(lagoon, "ndvi_temperature.nc"))
+    print(f"{len(saved)} of {len(sites)} sites processed")
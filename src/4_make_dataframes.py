@@ -1,36 +1,35 @@
 # %% Imports
 import numpy as np
 import pandas as pd
-import geopandas as gpd
 
 import xarray
 import rioxarray
 
 from functions.stat_utils import na_seadec
+from functions.store import write_table
+from functions.ideam import load_ideam, monthly_mean
+from functions.geometries import get_geometry
+from functions.sites import load_sites, fan_out
+from functions.telemetry import span
 
 # %% Define the time limits and the data paths
 t0 = np.datetime64("2001-01-01")
 tf = np.datetime64("2022-01-01")
 
 meteorological_path = "data/raw/{}_raw_data.csv"
-discharge_path = "data/raw/magdalena_river_discharge_data.csv"
 spectral_path = "data/processed/{}_ndvi_temperature.nc"
-forests_path = "data/shapefile/mangrove_forests.shp"
 soi_path = "data/processed/simple_soi.csv"
 
-# %% Define the key to iterate raw and processed data
-lagoons = ["mallorquin", "totumo", "virgen"]
-cities = ["barranquilla", "totumo", "cartagena"]
+# %% Function to read total precipitation and mean discharge of one site
+def read_hydrological(site: dict) -> pd.DataFrame:
+    city, lagoon = site["city"], site["key"]
 
-# %% Read total precipitation and mean discharge
-hydro_data = []
+    # Load precipitation data of the site gauges, only the dates and values
+    # are parsed and the parsed data is cached until the file changes
+    with span("read gauges", site=lagoon):
+        series, stations = load_ideam(meteorological_path.format(city), site["gauges"])
 
-# For loop to iterate throught cities and lagoons to load the precipitation data
-for city, lagoon in zip(cities, lagoons):
-    # Load precipitation data, dates are in the 17 column
-    df = pd.read_csv(meteorological_path.format(city), parse_dates=[16], index_col=16)
-    df = df[["Valor"]]                          # Subset the column with the data
-    df = df.resample("m").mean()                # Resample data to monthly mean
+    df = monthly_mean(series).to_frame()        # Resample data to monthly mean
 
     df.columns = ["Precipitation"]              # Rename column
     df.index.name = "Time"                      # Rename index column
@@ -40,13 +39,12 @@ for city, lagoon in zip(cities, lagoons):
     if df.Precipitation.isna().sum() > 0:
         df.Precipitation = na_seadec(df.Precipitation) 
 
-    # If the city is Barranquilla we have to load the mean river discharge of
-    # Magdalena river
-    if city == "barranquilla":
-        # Load mean discharge data, dates are in the column 17
-        df2 = pd.read_csv(discharge_path, parse_dates=[16], index_col=16)
-        df2 = df2[["Valor"]]                # Subset the data
-        df2 = df2.resample("m").mean()      # Resample to monthly mean
+    # If the site has a discharge source (Magdalena river for Mallorquín) we
+    # have to load the mean river discharge
+    if site["discharge"]:
+        # Load mean discharge data and resample it to monthly mean
+        series, stations = load_ideam(site["discharge"])
+        df2 = monthly_mean(series).to_frame()
         
         df2.columns = ["Discharge"]         # Rename column
         df2.index.name = "Time"             # Rename index column
@@ -62,45 +60,37 @@ for city, lagoon in zip(cities, lagoons):
     else:
         df["Discharge"] = np.nan
 
-    # Append new data to the list
-    hydro_data.append(df)
+    return df
 
-# Convert list in a dataframe, resort the columns and reset the index to
-# get the Time column
-hydro_data = pd.concat(hydro_data)
-hydro_data = hydro_data[["Lagoon", "Precipitation", "Discharge"]]
-hydro_data = hydro_data.reset_index()
+# %% Function to read mean NDVI and temperature of one site
+def read_spectral(site: dict) -> pd.DataFrame:
+    lagoon = site["key"]
 
-# %% Read mean NDVI and temperature
-spectral_data = []
-
-forests = gpd.read_file(forests_path)       # Load the forest to clip the images
-
-# For loop throught lagoons to get the NDVI and Temperature data
-for lagoon in lagoons: 
     # Read the NetCDF data
     data = xarray.open_dataset(spectral_path.format(lagoon), decode_coords="all")
     
-    # Define the forest of interest to clip the data
-    roi = forests[forests.key == lagoon].geometry
+    # Define the forest of interest to clip the data from the geometry store
+    roi = get_geometry(site["geometry"])
 
     # Clip the dataset to forest of interest, all touched False implies that only
     # conserve the pixels completely overlaped by the forest
-    data = data.rio.clip(roi, all_touched=False)
+    with span("clip", site=lagoon):
+        data = data.rio.clip(roi, all_touched=False)
 
     # Reduce the DataSet to a DataFrame and resample it to monthly mean data
     # Calculate the mean NDVI, Surface Temperature and the pixel count
-    df = pd.DataFrame({
-        "NDVI": data["NDVI"].mean(dim=["latitude", "longitude"]).to_series(), 
-        "Temperature": data["Surface Temperature"].mean(dim=["latitude", "longitude"]).to_series(),
-        "Count": data["NDVI"].count(dim=["latitude", "longitude"]).to_series()
-    }).resample("m").mean()
+    with span("spatial mean", site=lagoon):
+        df = pd.DataFrame({
+            "NDVI": data["NDVI"].mean(dim=["latitude", "longitude"]).to_series(), 
+            "Temperature": data["Surface Temperature"].mean(dim=["latitude", "longitude"]).to_series(),
+            "Count": data["NDVI"].count(dim=["latitude", "longitude"]).to_series()
+        }).resample("ME").mean()
 
     # Pass the first and second entries because they have NaN
     df = df.iloc[2:,:]
 
     # Set the NaN values in pixel count to 0 and calculate the pixel percentage
-    df.Count[df.Count.isna()] = 0
+    df.loc[df.Count.isna(), "Count"] = 0
     df["PixelPercentage"] = df.Count/df.Count.max()*100
     df = df.drop("Count", axis=1)           # Then, drop the Count column
 
@@ -108,8 +98,8 @@ for lagoon in lagoons:
     # 10%
     mask = df.PixelPercentage < 10.00
 
-    df["NDVI"][mask] = np.nan
-    df["Temperature"][mask] = np.nan
+    df.loc[mask, "NDVI"] = np.nan
+    df.loc[mask, "Temperature"] = np.nan
 
     # Interpolate NaN values in NDVI and Temperature
     df.NDVI = na_seadec(df.NDVI)
@@ -118,32 +108,43 @@ for lagoon in lagoons:
     df["Lagoon"] = lagoon                   # Define the Lagoon column
     df.index.name = "Time"                  # Rename index column
     
-    # Append spectral data
-    spectral_data.append(df)
-
-# Convert list in a dataframe, resort the columns and reset the index to
-# get the Time column
-spectral_data = pd.concat(spectral_data)
-spectral_data = spectral_data[["Lagoon", "NDVI", "Temperature", "PixelPercentage"]]
-spectral_data = spectral_data.reset_index()
-
-# %% Merge hydrological and spectral data
-data = hydro_data.merge(spectral_data, how="left", on=["Time", "Lagoon"])
-
-# Remove values outside the timespan and resort the data based on lagoon
-# and time
-mask = (data.Time > t0) & (data.Time < tf)
-data = data[:][mask]
-data = data.sort_values(["Lagoon", "Time"])
-data = data.reset_index(drop=True)
-
-# %% Load SOI data to final dataframe
-soi_data = pd.read_csv(soi_path, parse_dates=[0])
-soi_data.columns = ["Time", "SOI", "ENSO"]
-data = data.merge(soi_data, how="left", on="Time")
-
-# %% View final dataframe
-print(data)
-
-# %% Save final dataframe
-data.to_csv("data/processed/hydrological_spectral_mean_data.csv")
+    return df
+
+# %% Function to read all the data of one site
+def site_data(site: dict) -> tuple[pd.DataFrame, pd.DataFrame]:
+    return read_hydrological(site), read_spectral(site)
+
+# %% Read the data of all sites in parallel
+if __name__ == "__main__":
+    results = fan_out(site_data, load_sites())
+
+    # Convert lists in dataframes, resort the columns and reset the index to
+    # get the Time column
+    hydro_data = pd.concat([r[0] for r in results.values()])
+    hydro_data = hydro_data[["Lagoon", "Precipitation", "Discharge"]]
+    hydro_data = hydro_data.reset_index()
+
+    spectral_data = pd.concat([r[1] for r in results.values()])
+    spectral_data = spectral_data[["Lagoon", "NDVI", "Temperature", "PixelPercentage"]]
+    spectral_data = spectral_data.reset_index()
+
+    # Merge hydrological and spectral data
+    data = hydro_data.merge(spectral_data, how="left", on=["Time", "Lagoon"])
+
+    # Remove values outside the timespan and resort the data based on lagoon
+    # and time
+    mask = (data.Time > t0) & (data.Time < tf)
+    data = data[:][mask]
+    data = data.sort_values(["Lagoon", "Time"])
+    data = data.reset_index(drop=True)
+
+    # Load SOI data to final dataframe
+    soi_data = pd.read_csv(soi_path, parse_dates=[0])
+    soi_data.columns = ["Time", "SOI", "ENSO"]
+    data = data.merge(soi_data, how="left", on="Time")
+
+    # View final dataframe
+    print(data)
+
+    # Save final dataframe
+    write_table(data, "data/processed/hydrological_spectral_mean_data.parquet")
@@ -2,14 +2,13 @@
 import numpy as np
 import pandas as pd
 
-from functions.stat_utils import plot_ts_components, detrend_variables
-
-# %% Imports for plots and define some parameters
-import matplotlib.pyplot as plt
-
-# Load custom style
-plt.style.use("src/style.mplstyle")
+from functions.stat_utils import detrend_variables
+from functions.stat_plots import plot_ts_components
+from functions.store import read_table, write_table
+from functions.sites import load_sites
+from functions.render import figure_job, render_figures
 
+# %% Define some parameters
 # Define custom titles
 titles = {
     "Precipitation": "Total Precipitation [mm]",
@@ -18,42 +17,38 @@ titles = {
     "Temperature": "Mean Temperature [°C]",
 }
 
-# Keys for subset the data
-lagoons = ["mallorquin", "totumo", "virgen"]
+# Sites of the analysis and keys for subset the data
+sites = load_sites()
+lagoons = list(sites)
 
 # Variables to study
 variables = [t for t in titles.keys()]
 
 # %% Define constants
-data_path = "data/processed/hydrological_spectral_mean_data.csv"
-save_path = "data/processed/detrended_hydrological_spectral_mean_data.csv"
+data_path = "data/processed/hydrological_spectral_mean_data.parquet"
+save_path = "data/processed/detrended_hydrological_spectral_mean_data.parquet"
 save_images_path = "images/{}_{}_time_series_components.{}"
 
 # %% Load data
-DATA = pd.read_csv(data_path, parse_dates=[1], index_col=0)
+DATA = read_table(data_path)
 
-# Plot TS Components
-figs = []
+# Define the plots of the TS Components
+jobs = []
 
-for lagoon in lagoons:
+for i, lagoon in enumerate(lagoons):
     subset = DATA[DATA.Lagoon == lagoon].copy().set_index("Time", drop=True)
     enso = subset.ENSO.values
 
     subset = subset[variables]
-    
-    if lagoon == "mallorquin":
-        fs = (9, 4)
-    else:
-        fs = (7, 4)
-
-    figs.append(plot_ts_components(subset, fs, enso, titles=titles))
+    fs = tuple(sites[lagoon]["figsize"])
 
-# %% Show plots
-# plt.show()
+    jobs.append(figure_job(
+        plot_ts_components, save_images_path.format(i+1, lagoon, "svg"),
+        subset, fs, enso, titles=titles
+    ))
 
-# %% Save plots
-for i, (lagoon, fig) in enumerate(zip(lagoons, figs)):
-    fig.savefig(save_images_path.format(i+1, lagoon, "svg"))
+# %% Render the plots in parallel, only the plots whose data changed
+rendered = render_figures(jobs)
 
 # %% Detrended data
 # List to store the detrended dataframes
@@ -64,12 +59,8 @@ for lagoon in lagoons:
     # Subset data by lagoon
     subset = DATA[DATA.Lagoon == lagoon].copy().set_index("Time", drop=True)    
     
-    # Detrend variables of interest from subset dataframe: If 
-    # the lagoon isn't Mallorquín, we don't need Discharge
-    if lagoon == "mallorquin":
-        subset = detrend_variables(subset, variables)
-    else:
-        subset = detrend_variables(subset, [variables[i] for i in [0, 2, 3]])
+    # Detrend the variables available for the site
+    subset = detrend_variables(subset, sites[lagoon]["variables"])
     
     # Save subset dataframe into the list
     DAT2.append(subset)
@@ -78,4 +69,4 @@ for lagoon in lagoons:
 DAT2 = pd.concat(DAT2).reset_index()
 
 # Save detrended data
-DAT2.to_csv(save_path)
\ No newline at end of file
+write_table(DAT2, save_path)
\ No newline at end of file
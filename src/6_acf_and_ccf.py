@@ -3,14 +3,12 @@ import numpy as np
 import pandas as pd 
 
 from statsmodels.tsa.stattools import acf, ccf
-from functions.stat_utils import plot_acf_ccf
-
-# %% Imports for plots and define some paremeters
-import matplotlib.pyplot as plt
-
-# Load custom style
-plt.style.use("src/style.mplstyle")
+from functions.stat_plots import plot_acf_ccf
+from functions.store import read_table
+from functions.sites import load_sites
+from functions.render import figure_job, render_figures
 
+# %% Define some parameters
 # Define the titles of the variables
 titles = {
     "Precipitation": "Total Precipitation [mm]",
@@ -19,25 +17,26 @@ titles = {
     "Temperature": "Mean Temperature [°C]"
 }
 
-# Lagoons to subset data
-lagoons = ["mallorquin", "totumo", "virgen"]
+# Sites of the analysis and lagoons to subset data
+sites = load_sites()
+lagoons = list(sites)
 
 # %% Define paths
-data_path = "data/processed/detrended_hydrological_spectral_mean_data.csv"
+data_path = "data/processed/detrended_hydrological_spectral_mean_data.parquet"
 save_images_path = "images/{}_{}_{}cf_plot.{}"
 save_images_path = "images/{}_{}_{}cf_plot.{}"
 
-# %% Load data
-DATA = pd.read_csv(data_path, parse_dates=[1], index_col=0)
+# %% Load data, only the variables of interest
+DATA = read_table(data_path, columns=[t for t in titles.keys()])
 
 # %% Lists and dictionary to store date
-acf_figs = []                               # To save the acf plots
-ccf_figs = []                               # To save the ccf plots
+jobs = []                                   # To save the acf and ccf plots
 ccfs = {}                                   # To save the CCF data
 
 # %% Plot the ACF and CCF of all variables by lagoon
-# For loop to plot and calculate ACF and CCF by lagoon
-for lagoon in lagoons:
+# For loop to plot and calculate ACF and CCF by lagoon, the figures are
+# numbered from 4
+for n, lagoon in enumerate(lagoons):
     # Subset data based on lagoon
     subset = DATA[DATA.Lagoon == lagoon].copy()
     
@@ -46,21 +45,12 @@ for lagoon in lagoons:
     nlags = 24
     confi = 1.96/np.sqrt(N)
 
-    # Get the variables names
-    all_vars = subset.columns[2:-3]
-
-    # If lagoon is Totumo and La Virgen we have to remove discharge from
-    # the variables
-    if lagoon in ("totumo", "virgen"):
-        # Slice to remove discharge
-        all_vars = all_vars[[0, 2, 3]]
-        
-        i_vars = all_vars[[0, 2]]           # Get independant variables
-        d_vars = all_vars[[1]]              # Get dependant variables 
-    
-    else:
-        i_vars = all_vars[[0, 1, 3]]        # Get independant variables
-        d_vars = all_vars[[2]]              # Get dependant variables 
+    # Get the variables available for the site, NDVI is the dependant
+    # variable and the others the independant ones
+    all_vars = sites[lagoon]["variables"]
+
+    i_vars = [v for v in all_vars if v != "NDVI"]     # Get independant variables
+    d_vars = ["NDVI"]                                 # Get dependant variables
 
     # Dictionary to save ACF data by variable
     acf_data = {
@@ -77,19 +67,18 @@ for lagoon in lagoons:
     # Also save the CCF data in another dictionary
     ccfs[lagoon] = ccf_data
 
-    # Save the plots in their respective list
-    acf_figs.append(plot_acf_ccf(acf_data, confi, [-1.2, 1.2], titles))
-    ccf_figs.append(plot_acf_ccf(ccf_data, confi, [-0.7, 0.7]))
-    
-# %% Show figures
-# plt.show()
-
-# %% Save figures
-i = 4
-for lagoon, afig, cfig in zip(lagoons, acf_figs, ccf_figs):
-    afig.savefig(save_images_path.format(i, lagoon, "a", "svg"))
-    cfig.savefig(save_images_path.format(i+1, lagoon, "c", "svg"))
-    i += 2
+    # Define the plots
+    jobs.append(figure_job(
+        plot_acf_ccf, save_images_path.format(4+2*n, lagoon, "a", "svg"),
+        acf_data, confi, [-1.2, 1.2], titles
+    ))
+    jobs.append(figure_job(
+        plot_acf_ccf, save_images_path.format(5+2*n, lagoon, "c", "svg"),
+        ccf_data, confi, [-0.7, 0.7]
+    ))
+
+# %% Render the figures in parallel, only the figures whose data changed
+rendered = render_figures(jobs)
 
 # %% Show where is the maximum correlation by lagoon
 for lagoon in lagoons:
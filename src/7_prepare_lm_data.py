@@ -2,27 +2,24 @@
 import numpy as np 
 import pandas as pd
 
-from functions.stat_utils import plot_corr_matrix
+from functions.stat_plots import plot_corr_matrix
+from functions.store import read_table, write_table
+from functions.sites import load_sites
+from functions.render import figure_job, render_figures
 
-# %% Imports for plots and define some parameters
-import matplotlib.pyplot as plt
-
-# Load custom style
-plt.style.use("src/style.mplstyle")
-
-# Keys to iterate
-lagoons = ["mallorquin", "totumo", "virgen"]
+# %% Keys to iterate
+lagoons = list(load_sites())
 variables = ["Precipitation", "Discharge", "Temperature", "NDVI"]
 save_keys = ["original", "rolled", "interpolated_removed"]
 
 # %% Define paths
-data_path = "data/processed/detrended_hydrological_spectral_mean_data.csv"
-save_path = "data/processed/lm_data_{}_interpolations.csv"
+data_path = "data/processed/detrended_hydrological_spectral_mean_data.parquet"
+save_path = "data/processed/lm_data_{}_interpolations.parquet"
 
 save_images_path = "images/{}_corr_matrix_{}.{}"
 
 # %% Read data
-DATA = pd.read_csv(data_path, parse_dates=[1], index_col=0)
+DATA = read_table(data_path)
 
 # Calculate the moving average of five to reduce the noise on SOI
 DATA.SOI = DATA.SOI.rolling(window=5, min_periods=1, center=True).mean()
@@ -69,33 +66,28 @@ print("Interpolated removed", DAT3.shape)
 
 # %% Correlation plot
 # List to store all figures
-figs = []
+jobs = []
 
 # Iterate over the dataframes to plot the correlation matrix
-for data in [DATA, DAT2, DAT3]:
+for i, (data, key) in enumerate(zip([DATA, DAT2, DAT3], save_keys)):
     # Subset data for plot
     subset = data[data.Lagoon == "mallorquin"].copy()
     
     # Plot corr matrix
-    fig = plot_corr_matrix(
+    jobs.append(figure_job(
+        plot_corr_matrix,
+        save_images_path.format(i+10, key, "svg"),
         data=subset,
         variables=variables,
         half=True,
         hide_insignificants=True,
         show_labels=True,
         show_colorbar=False,
-    )
-
-    # Store the figs
-    figs.append(fig)
-
-# %% Show figure
-# plt.show()
+    ))
 
-# %% Save figures
-for i, (fig, key) in enumerate(zip(figs, save_keys)):
-    fig.savefig(save_images_path.format(i+10, key, "svg"))
+# %% Render the figures in parallel, only the figures whose data changed
+rendered = render_figures(jobs)
 
 # %% Save dataframes
 for key, data in zip(["with", "without"], [DAT2, DAT3]):
-    data.to_csv(save_path.format(key))
\ No newline at end of file
+    write_table(data, save_path.format(key))
\ No newline at end of file
@@ -2,19 +2,21 @@
 import pandas as pd
 import statsmodels.formula.api as smf
 
+from functions.store import read_table
+from functions.sites import load_sites
+from functions.telemetry import span
+from functions.stat_plots import plot_scatter_by_group
+from functions.render import figure_job, render_figures
+
 # %% Imports for plots and define some paremeters
 import matplotlib.pyplot as plt
-from matplotlib.gridspec import GridSpec
-
-# Load custom style
-plt.style.use("src/style.mplstyle")
 
 # Colormap for plots
-d_cmap = plt.cm.get_cmap("Set3", 3)
+d_cmap = plt.get_cmap("Set3", 3)
 colors = [d_cmap.colors[i,:] for i in range(3)]
 
 # Lagoons to subset the data
-lagoons = ["mallorquin", "totumo", "virgen"]
+lagoons = list(load_sites())
 
 # Define the titles of the variables
 titles = {
@@ -29,59 +31,20 @@ titles = {
 variables = ["Precipitation", "Discharge", "Temperature", "SOI"]
 
 # %% Define paths
-data_path = "data/processed/lm_data_without_interpolations.csv"
+data_path = "data/processed/lm_data_without_interpolations.parquet"
 save_images_path = "images/{}_linear_model_scatterplots.{}"
 save_models_path = "models/{}_model.{}"
 
-# %% load data 
-DATA = pd.read_csv(data_path, parse_dates=[1], index_col=0)
+# %% load data, only the variables of the models
+DATA = read_table(data_path, columns=variables + ["NDVI"])
 
 # %% Explor variables
-# Create figure and axes
-fig, axs = plt.subplots(figsize=(6, 6), nrows=2, ncols=2, sharey=True)
-
-# Index for plot
-xx = [0, 1, 0, 1]
-yy = [0, 0, 1, 1]
-
-# Iterate throught variables and axes to plot one variable by axes
-for ix, iy, variable in zip(xx, yy, variables):
-    handles = []                            # Save handles for legend
-
-    # Iterate throught lagoons and color to plot data by lagoon
-    for lagoon, color in zip(lagoons, colors):
-
-        # If there is data in the variable, plot it
-        try:
-            l = axs[iy,ix].scatter(
-                DATA[variable][DATA.Lagoon == lagoon],
-                DATA["NDVI"][DATA.Lagoon == lagoon],
-                label=lagoon.capitalize(),
-                color=color,
-                alpha=0.5
-            )
-
-        except:
-            continue
-
-        else:
-            handles.append(l)               # Save handle
-
-            # Add x-label
-            axs[iy,ix].set_xlabel(titles[variable])
-    
-    # If the axes is in the first column add the y-label
-    if ix == 0:
-        axs[iy,ix].set_ylabel(titles["NDVI"])
-
-# Add the legend to one axes
-axs[0,1].legend(handles=handles, title="Forest")
-
-# Show correlation between NDVI and the independant variables
-# plt.show()
-
-# Save plot
-fig.savefig(save_images_path.format(13, "svg"))
+# Plot NDVI against the independant variables by lagoon, rendered in a new
+# process only if the data changed
+rendered = render_figures([figure_job(
+    plot_scatter_by_group, save_images_path.format(13, "svg"),
+    DATA, variables, lagoons, colors, titles
+)])
 
 # %% Exploratory model
 # Formula with all variables and possible interactions
@@ -90,7 +53,8 @@ f = "NDVI ~ Lagoon*Precipitation + Lagoon*Temperature \
      + Temperature:SOI"
 
 # Run model
-exploratory_model = smf.ols(f, DATA).fit()
+with span("fit exploratory model"):
+    exploratory_model = smf.ols(f, DATA).fit()
 
 # Show results
 print("\nExploratory model:", exploratory_model.summary(), sep="\n")
@@ -103,7 +67,8 @@ print("\nExploratory model:", exploratory_model.summary(), sep="\n")
 f = "NDVI ~ Precipitation + Temperature + Precipitation:SOI"
 
 # Run model
-general_model = smf.ols(f, DATA).fit()
+with span("fit general model"):
+    general_model = smf.ols(f, DATA).fit()
 
 # Show results
 print("\nGeneral model:", general_model.summary(), sep="\n")
@@ -119,7 +84,8 @@ mallorquin = DATA[DATA.Lagoon == "mallorquin"].copy()
 f = "NDVI ~ Precipitation + Discharge + Temperature + Precipitation:Discharge"
 
 # Run model
-mallorquin_model = smf.ols(f, mallorquin).fit()
+with span("fit mallorquin model"):
+    mallorquin_model = smf.ols(f, mallorquin).fit()
 
 # Show results
 print("\nMallorquín model:", mallorquin_model.summary(), sep="\n")
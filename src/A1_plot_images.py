@@ -1,74 +1,120 @@
-# %% Imports
-import ee
-import geemap
-import matplotlib.pyplot as plt
-
-from geemap import cartoee
-from statgis.landsat_functions import landsat_scaler
-from functions.gee_processing import *
-
-ee.Initialize()
-
-# %% Define constants and plot options
-path = "./appendix/all_images/{}.png"
-
-lagoons = ["mallorquin", "totumo", "virgen"]
-
-zooms = {
-    "mallorquin": [-74.82934525005177, 11.028868816913656, -74.91404810273207, 11.062596879860857],
-    "totumo": [-75.21347135428282, 10.690516171754405, -75.25896861605656, 10.760405796055716],
-    "virgen": [-75.4639732791029, 10.409937971541012, -75.51173334636263, 10.512366397279758]
-}
-
-vis = {"bands": ["RED", "GREEN", "BLUE"], "min": 0.0, "max": 0.3, "gamma": 1.3}
-
-# %% Load mangrove forests feature collection
-forests = ee.FeatureCollection("projects/ee-sebnarvaez-mangroves/assets/forests")
-
-# %% Load, scale and rename Landsat 5, 7 and 8 image collections
-L5 = (
-    ee.ImageCollection("LANDSAT/LT05/C02/T1_L2").map(landsat_scaler)
-                                                .map(renamer7)
-                                                .filter(ee.Filter.calendarRange(1996, 1998, "year"))
-)
-
-L7 = (
-    ee.ImageCollection("LANDSAT/LE07/C02/T1_L2").map(landsat_scaler)
-                                                .map(renamer7)
-                                                .filter(ee.Filter.calendarRange(1999, 2013, "year"))
-)
-
-L8 = (
-    ee.ImageCollection("LANDSAT/LC08/C02/T1_L2").map(landsat_scaler)
-                                                .map(renamer8)
-                                                .filter(ee.Filter.calendarRange(2014, 2021, "year"))
-)
-
-# %% Merge image collections
-IC = L5.merge(L7.merge(L8))
-
-# %% Loop over the image collection to plot all images
-for lagoon in lagoons:
-    # Get the forest of interest
-    roi = forests.filter(ee.Filter.eq("key", lagoon)).first().geometry()
-    
-    # Filter images that intersect with the forest of interest
-    ICF = IC.filterBounds(roi)
-    
-    # Extract images dates to loop on they
-    dates = ICF.reduceColumns(ee.Reducer.toList(), ["DATE_ACQUIRED"]).get("list").getInfo()
-
-    for date in dates:
-        # Filter images by date and make their mean
-        img = ICF.filter(ee.Filter.eq("DATE_ACQUIRED", date)).mean()
-
-        # Plot with cartoee
-        fig = plt.figure()
-
-        ax = cartoee.get_map(img, vis_params=vis, region=zooms[lagoon])
-        lb = f"{lagoon} {date}"
-
-        ax.set_title(lb, fontsize=12)
-
-        plt.savefig(path.format(lb))
-        plt.close()
+# %% Imports
+import os
+import matplotlib.pyplot as plt
+
+from functions.quicklook import render_quicklooks
+from functions.sites import load_sites
+
+# %% Define constants and plot options
+path = "./appendix/all_images/{}.png"
+
+# If True, render the quick-looks from the rasters already downloaded instead
+# of requesting every image to Earth Engine
+offline = True
+
+# Rasters to render offline (use data/scenes/{}/ for the per-scene images)
+# and file to save the hashes of the rendered images
+images_path = "data/raster/{}/"
+manifest_path = "./appendix/all_images/quicklooks.json"
+
+# Local catalog of the Earth Engine scenes metadata
+catalog_path = "data/processed/scene_catalog.csv"
+
+# Sites of the analysis and limits of their quick-looks
+sites = load_sites()
+lagoons = list(sites)
+
+zooms = {lagoon: site["zoom"] for lagoon, site in sites.items()}
+
+vis = {"bands": ["RED", "GREEN", "BLUE"], "min": 0.0, "max": 0.3, "gamma": 1.3}
+
+# %% Render the quick-looks from the local rasters in a process pool
+# The main guard avoids that the workers run the script again when they import it
+if offline and __name__ == "__main__":
+    jobs = []
+
+    # Define a job by image with the same label of the Earth Engine plots
+    for lagoon in lagoons:
+        for image in sorted(os.listdir(images_path.format(lagoon))):
+            if not image.endswith(".tif"):
+                continue
+
+            lb = f"{lagoon} {image[:-4]}"
+            jobs.append({
+                "path": images_path.format(lagoon) + image,
+                "save_path": path.format(lb),
+                "extent": zooms[lagoon],
+                "title": lb,
+            })
+
+    # Render only the images that changed since the last run
+    rendered = render_quicklooks(jobs, vis, manifest_path)
+    print(f"{len(rendered)} of {len(jobs)} quick-looks rendered")
+
+# %% Render the quick-looks with Earth Engine
+elif not offline:
+    import ee
+
+    from geemap import cartoee
+    from statgis.landsat_functions import landsat_scaler
+    from functions.gee_processing import *
+    from functions.scene_catalog import ee_client, refresh_catalog, scene_dates
+
+    ee.Initialize()
+
+    # Load mangrove forests feature collection
+    forests_asset = "projects/ee-sebnarvaez-mangroves/assets/forests"
+    forests = ee.FeatureCollection(forests_asset)
+
+    # Update the scenes catalog, only the dates not consulted before are requested
+    catalog = refresh_catalog(
+        catalog_path, ee_client(forests_asset), lagoons, "1996-01-01", "2022-01-01"
+    )
+
+    # Load, scale and rename Landsat 5, 7 and 8 image collections
+    L5 = (
+        ee.ImageCollection("LANDSAT/LT05/C02/T1_L2").map(landsat_scaler)
+                                                    .map(renamer7)
+                                                    .filter(ee.Filter.calendarRange(1996, 1998, "year"))
+    )
+
+    L7 = (
+        ee.ImageCollection("LANDSAT/LE07/C02/T1_L2").map(landsat_scaler)
+                                                    .map(renamer7)
+                                                    .filter(ee.Filter.calendarRange(1999, 2013, "year"))
+    )
+
+    L8 = (
+        ee.ImageCollection("LANDSAT/LC08/C02/T1_L2").map(landsat_scaler)
+                                                    .map(renamer8)
+                                                    .filter(ee.Filter.calendarRange(2014, 2021, "year"))
+    )
+
+    # Merge image collections
+    IC = L5.merge(L7.merge(L8))
+
+    # Loop over the image collection to plot all images
+    for lagoon in lagoons:
+        # Get the forest of interest
+        roi = forests.filter(ee.Filter.eq("key", lagoon)).first().geometry()
+
+        # Filter images that intersect with the forest of interest
+        ICF = IC.filterBounds(roi)
+
+        # Extract images dates from the catalog to loop on they
+        dates = scene_dates(catalog, lagoon)
+
+        for date in dates:
+            # Filter images by date and make their mean
+            img = ICF.filter(ee.Filter.eq("DATE_ACQUIRED", date)).mean()
+
+            # Plot with cartoee
+            fig = plt.figure()
+
+            ax = cartoee.get_map(img, vis_params=vis, region=zooms[lagoon])
+            lb = f"{lagoon} {date}"
+
+            ax.set_title(lb, fontsize=12)
+
+            plt.savefig(path.format(lb))
+            plt.close()
@@ -4,18 +4,19 @@ import pandas as pd
 
 import matplotlib.pyplot as plt
 
+from functions.store import read_table
+
 # %% Define plot options and color palettes
 plt.style.use("src/style.mplstyle")
 
-colors = plt.cm.get_cmap("Set3", 3)
+colors = plt.get_cmap("Set3", 3)
 colors = [colors.colors[i,:] for i in range(3)]
-binary_cmap = plt.cm.get_cmap("bwr_r", 2)
+binary_cmap = plt.get_cmap("bwr_r", 2)
 
 # %% Load final dataframe
-data = pd.read_csv(
-    "data/processed/hydrological_spectral_mean_data.csv",
-    parse_dates=[1],
-    index_col=0
+data = read_table(
+    "data/processed/hydrological_spectral_mean_data.parquet",
+    columns=["PixelPercentage"],
 )
 
 # %% Define constants
@@ -1,10 +1,17 @@
 # %% Imports
-import geopandas as gpd
+from functions.stations import build_station_index, query_stations
+from functions.geometries import load_forests
 
 # %% Define parameters
 # CRS to reproject all dataframes
 EPSG = 32618
 
+# Distance to the forests to search stations [m]
+radius = 6000
+
+# Get only Climatical, Pluviometrical and Synaptical stations
+categories_of_interest = ["PM", "CP", "SP"]
+
 # Varaibles that will be discarded from stations dataframe
 unused_vars = [
     "TECNOLOGIA", "AREA_OPERA", "AREA_HIDRO", 
@@ -13,28 +20,20 @@ unused_vars = [
 ]
 
 # %% Defien paths
-forests_path = "data/shapefile/mangrove_forests.shp"
 stations_path = "data/shapefile/CNE_IDEAM.shp"
 save_path = "appendix/gauge_stations/stations_of_interest.shp"
 
-# %% Read and reproject forests and stations
-forests = gpd.read_file(forests_path).to_crs(epsg=EPSG)
-stations = gpd.read_file(stations_path).to_crs(epsg=EPSG)
+# %% Read and reproject forests, the stations are reprojected and indexed only
+# the first time and then loaded from the cache
+forests = load_forests(epsg=EPSG)
+stations, tree = build_station_index(stations_path, epsg=EPSG)
 
 # %% Subset stations
-buffers = forests.copy()                    # Copy the data from the forest
-buffers.geometry = buffers.buffer(6000)     # Replace its geometry with a buffer of 6 km
-buffers = buffers[["key", "geometry"]]      # Get only the key (Forest) and geomtry
-
-# Spatial join to filter the stations and add thier respective forest
-stations = stations.sjoin(buffers, how="inner")
-
-# Get only Climatical, Pluviometrical and Synaptical stations
-categories_of_interest = (stations.CATEGORIA == "PM") | \
-    (stations.CATEGORIA == "CP") | (stations.CATEGORIA == "SP")
-
-# Get stations from the categories of interest
-stations = stations[categories_of_interest]
+# Query the stations of the categories of interest inside the radius of all
+# forests at once, with their distance and rank by forest
+stations = query_stations(
+    forests, stations, tree, radius=radius, categories=categories_of_interest
+)
 
 # Drop unused variables
 stations = stations.drop(unused_vars, axis=1)
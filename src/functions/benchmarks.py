@@ -0,0 +1,317 @@
+# %% Dependencies imports
+import os
+import sys
+import json
+import time
+import tracemalloc
+import subprocess
+import importlib.util
+
+# %% Typing imports
+from types import ModuleType
+from typing import Callable, Sequence
+
+# %% Constants
+# Script run in a new interpreter to measure the import of a module, it
+# prints the time of the import and the modules it loaded
+_IMPORT_SCRIPT = """
+import sys, time, json
+before = set(sys.modules)
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": sorted(set(sys.modules) - before)}}))
+"""
+
+
+# %% Functions
+def _calibration_loop() -> int:
+    """
+    Fixed work of the interpreter, the unit of the relative times.
+    """
+    total = 0
+    for i in range(500_000):
+        total += i * i % 7
+
+    return total
+
+
+def calibration(repeats: int = 7) -> float:
+    """
+    Function to measure the speed of the machine with a fixed loop, so the
+    times of the benchmarks can be compared between machines and runs.
+
+    Parameters
+    ----------
+    repeats : int = 7
+        Times the loop is measured, the fastest is reported.
+
+    Returns
+    -------
+    seconds : float
+        Fastest time of the loop in seconds.
+    """
+    times = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        _calibration_loop()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def normalize(results: dict[str, dict], unit: float) -> dict[str, dict]:
+    """
+    Function to add to every result its time relative to the calibration
+    loop ("relative").
+
+    Parameters
+    ----------
+    results : dict[str, dict]
+        Results of measure() by benchmark name.
+
+    unit : float
+        Time of the calibration loop from calibration().
+
+    Returns
+    -------
+    results : dict[str, dict]
+        The same results with the relative times.
+    """
+    for result in results.values():
+        result["relative"] = result["seconds"] / unit
+
+    return results
+
+
+def import_time(module: str, repeats: int = 5, cwd: str = "src") -> dict:
+    """
+    Function to measure the import time of a module in new interpreters, as
+    a pool worker or a short script would pay it.
+
+    Parameters
+    ----------
+    module : str
+        Name of the module (e.g. functions.stat_utils).
+
+    repeats : int = 5
+        Times the import is measured, the fastest is reported (the slower
+        ones are the noise of other processes, as in timeit).
+
+    cwd : str = "src"
+        Folder where the interpreters are started.
+
+    Returns
+    -------
+    result : dict
+        Fastest time of the import in seconds ("seconds") and the top level
+        packages loaded by the import ("packages").
+    """
+    times = []
+
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-c", _IMPORT_SCRIPT.format(module=module)],
+            cwd=cwd, capture_output=True, text=True, check=True,
+        )
+        measure = json.loads(output.stdout.strip().splitlines()[-1])
+        times.append(measure["seconds"])
+
+    packages = sorted({m.split(".")[0] for m in measure["modules"]})
+
+    return {"seconds": min(times), "packages": packages}
+
+
+def check_import(
+    module: str,
+    budget: float,
+    forbidden: Sequence[str] = (),
+    repeats: int = 5,
+    cwd: str = "src",
+) -> tuple[dict, list[str]]:
+    """
+    Function to check that the import of a module is inside its time budget
+    and doesn't load heavy packages.
+
+    Parameters
+    ----------
+    module : str
+        Name of the module.
+
+    budget : float
+        Maximum import time in seconds.
+
+    forbidden : Sequence[str] = ()
+        Packages that the import must not load (e.g. matplotlib).
+
+    repeats : int = 5
+        Times the import is measured.
+
+    cwd : str = "src"
+        Folder where the interpreters are started.
+
+    Returns
+    -------
+    result : dict
+        Measure of the import from import_time().
+
+    errors : list[str]
+        Problems found, empty if the import is inside the budget.
+    """
+    result = import_time(module, repeats, cwd)
+    errors = []
+
+    if result["seconds"] > budget:
+        errors.append(f"{module}: import took {result['seconds']:.3f} s, budget {budget:.3f} s")
+
+    for package in forbidden:
+        if package in result["packages"]:
+            errors.append(f"{module}: import loads {package}")
+
+    return result, errors
+
+
+def measure(func: Callable, *args, repeats: int = 3, **kwargs) -> dict:
+    """
+    Function to measure the time and the peak of memory allocated by a
+    function.
+
+    A first run is discarded, it pays the lazy imports and the caches. The
+    time is measured without tracing the memory, and the memory in an extra
+    run with tracemalloc (NumPy reports its arrays to tracemalloc).
+
+    Parameters
+    ----------
+    func : Callable
+        Function to measure, it receives the positional and keyword arguments.
+
+    repeats : int = 3
+        Times the function is timed, the fastest is reported.
+
+    Returns
+    -------
+    result : dict
+        Fastest time in seconds ("seconds") and peak of memory allocated in
+        MiB ("peak_mib").
+    """
+    func(*args, **kwargs)
+
+    times = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {"seconds": min(times), "peak_mib": peak / 2**20}
+
+
+def load_stage(script: str) -> ModuleType:
+    """
+    Function to import a stage script (e.g. src/3_process_rasters.py) as a
+    module, to call its functions. The code under its main guard doesn't run.
+
+    Parameters
+    ----------
+    script : str
+        Path of the script.
+
+    Returns
+    -------
+    module : ModuleType
+        Module of the script.
+    """
+    name = "stage_" + os.path.splitext(os.path.basename(script))[0]
+    spec = importlib.util.spec_from_file_location(name, script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def load_baseline(path: str) -> dict[str, dict]:
+    """
+    Function to load the stored results of the benchmarks, empty if there
+    is no baseline.
+    """
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path: str, results: dict[str, dict]) -> None:
+    """
+    Function to store the results of the benchmarks as the new baseline,
+    keeping the results of the benchmarks that were not run.
+    """
+    baseline = load_baseline(path)
+    baseline.update(results)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+def compare_baseline(
+    results: dict[str, dict],
+    baseline: dict[str, dict],
+    tolerance: float = 0.5,
+    min_seconds: float = 0.005,
+) -> list[str]:
+    """
+    Function to find the benchmarks slower or with more memory than the
+    baseline.
+
+    The times are compared relative to the calibration loop of every run
+    (see normalize()), so the baseline of one machine can be used in
+    another. The results without relative times are compared in seconds.
+
+    Parameters
+    ----------
+    results : dict[str, dict]
+        Results of measure() by benchmark name.
+
+    baseline : dict[str, dict]
+        Results from load_baseline().
+
+    tolerance : float = 0.5
+        Relative increase accepted before reporting a regression, wide
+        enough for the noise of a shared machine.
+
+    min_seconds : float = 0.005
+        Differences in time lower than this are ignored, they are noise.
+
+    Returns
+    -------
+    regressions : list[str]
+        Description of every regression found.
+    """
+    regressions = []
+
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        time_metric = "relative" if "relative" in result and "relative" in baseline[name] else "seconds"
+
+        # Seconds of the current machine by unit of the metric, to ignore
+        # the small differences
+        scale = result["seconds"] / result[time_metric] if result[time_metric] else 1.0
+
+        for metric, unit, floor in ((time_metric, "", min_seconds / scale), ("peak_mib", " MiB", 0.0)):
+            old, new = baseline[name][metric], result[metric]
+
+            if new > old * (1 + tolerance) and new - old > floor:
+                regressions.append(f"{name}: {metric} {old:.4f} -> {new:.4f}{unit} (+{new / old - 1:.0%})")
+
+    return regressions
@@ -0,0 +1,218 @@
+# %% Dependencies imports
+import numpy as np
+from scipy import stats
+
+from functions.stat_utils import batched_inverse, decimal_years, harmonic_design
+
+# %% Typing imports
+import numpy.typing as npt
+
+# %% Constants
+# Maps of break_maps()
+BREAK_MAPS = ["break_time", "magnitude", "slope_change", "fstat", "pvalue"]
+
+
+# %% Functions
+def break_design(t: npt.NDArray, candidates: npt.NDArray) -> npt.NDArray:
+    """
+    Function to build the columns of the candidate breaks: a step (change
+    of level) and a hinge (change of slope) at every candidate date.
+
+    Parameters
+    ----------
+    t : numpy.ndarray
+        Time in decimal years.
+
+    candidates : numpy.ndarray
+        Dates of the candidate breaks in decimal years.
+
+    Returns
+    -------
+    design : numpy.ndarray
+        Matrix with shape (time, candidates, 2).
+    """
+    step = (t[:, None] >= candidates[None, :]).astype("float64")
+    hinge = (t[:, None] - candidates[None, :]) * step
+
+    return np.stack([step, hinge], axis=-1)
+
+
+def break_search(
+    y: npt.NDArray,
+    t: npt.NDArray,
+    candidates: npt.NDArray,
+    order: int = 2,
+    trim: float = 0.15,
+) -> dict[str, npt.NDArray]:
+    """
+    Function to find the most likely break of the series of every pixel,
+    comparing a harmonic model with a linear trend against the same model
+    with a change of level and slope at every candidate date.
+
+    The model without break is fitted once by pixel, then the reduction of
+    the residual sum of squares of every candidate is the projection of its
+    two columns on the residuals (Frisch-Waugh-Lovell), so every candidate
+    of every pixel only needs a 2x2 solve from sums that are products of
+    the validity mask by the shared design matrices.
+
+    Parameters
+    ----------
+    y : numpy.ndarray
+        Series with shape (time, pixels), NaN where there is no data.
+
+    t : numpy.ndarray
+        Time in decimal years.
+
+    candidates : numpy.ndarray
+        Dates of the candidate breaks in decimal years.
+
+    order : int = 2
+        Number of harmonics of the annual cycle.
+
+    trim : float = 0.15
+        Minimum fraction of the valid dates of a pixel at every side of a break.
+
+    Returns
+    -------
+    maps : dict[str, numpy.ndarray]
+        Values by pixel (see BREAK_MAPS): date of the break, change of level
+        and of slope at the break, F statistic against the model without
+        break and its p-value with the Bonferroni correction for the number
+        of candidates, NaN where no candidate has enough dates.
+    """
+    x = harmonic_design(t, order)
+    z = break_design(t, candidates)
+    n_times, k = x.shape
+    n_candidates = len(candidates)
+
+    valid = np.isfinite(y)
+    w = valid.astype("float64")
+    y0 = np.where(valid, y, 0.0)
+    n = w.sum(axis=0)
+
+    # Model without break of every pixel
+    gram = (w.T @ (x[:, :, None] * x[:, None, :]).reshape(n_times, -1)).reshape(-1, k, k)
+    enough = n > k + 2
+    inverse = batched_inverse(gram, enough)
+
+    beta = np.einsum("pij,pj->pi", inverse, y0.T @ x)
+    residuals = np.where(valid, y0 - x @ beta.T, 0.0)
+    sse = (residuals ** 2).sum(axis=0)
+
+    # Sums of the break columns with the residuals, with themselves and with
+    # the design, over the valid dates of every pixel
+    q = (residuals.T @ z.reshape(n_times, -1)).reshape(-1, n_candidates, 2)
+
+    zz = np.stack([z[..., 0], z[..., 1], z[..., 1] ** 2], axis=-1)
+    zz = (w.T @ zz.reshape(n_times, -1)).reshape(-1, n_candidates, 3)
+
+    zx = z[:, :, :, None] * x[:, None, None, :]
+    zx = (w.T @ zx.reshape(n_times, -1)).reshape(-1, n_candidates, 2, k)
+
+    # Break columns without the part explained by the design (Schur complement)
+    projected = np.einsum("pczk,pkl->pczl", zx, inverse)
+    s11 = zz[..., 0] - np.einsum("pcl,pcl->pc", projected[:, :, 0], zx[:, :, 0])
+    s12 = zz[..., 1] - np.einsum("pcl,pcl->pc", projected[:, :, 0], zx[:, :, 1])
+    s22 = zz[..., 2] - np.einsum("pcl,pcl->pc", projected[:, :, 1], zx[:, :, 1])
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        det = s11 * s22 - s12 ** 2
+
+        # Coefficients of the step and the hinge, and the reduction of the SSE
+        level = (s22 * q[..., 0] - s12 * q[..., 1]) / det
+        slope = (s11 * q[..., 1] - s12 * q[..., 0]) / det
+        reduction = level * q[..., 0] + slope * q[..., 1]
+
+    # Candidates with enough dates at both sides of the break
+    after = zz[..., 0]
+    minimum = np.maximum(trim * n, 3)[:, None]
+    allowed = (after >= minimum) & (n[:, None] - after >= minimum) & (det > 1e-9 * s11 * s22)
+    reduction = np.where(allowed & np.isfinite(reduction), reduction, -np.inf)
+
+    best = np.argmax(reduction, axis=1)
+    rows = np.arange(len(best))
+    found = enough & np.isfinite(reduction[rows, best])
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dof = n - k - 2
+        fstat = (reduction[rows, best] / 2) / ((sse - reduction[rows, best]) / dof)
+        pvalue = np.minimum(stats.f.sf(fstat, 2, dof) * allowed.sum(axis=1), 1.0)
+
+    maps = {
+        "break_time": candidates[best],
+        "magnitude": level[rows, best],
+        "slope_change": slope[rows, best],
+        "fstat": fstat,
+        "pvalue": pvalue,
+    }
+
+    return {name: np.where(found, values, np.nan) for name, values in maps.items()}
+
+
+def break_maps(
+    cube: npt.NDArray,
+    times: npt.ArrayLike,
+    order: int = 2,
+    trim: float = 0.15,
+    every: int = 1,
+    max_bytes: int = 2**28,
+) -> dict[str, npt.NDArray]:
+    """
+    Function to find the most likely break of every pixel of a cube, by
+    chunks of pixels.
+
+    Parameters
+    ----------
+    cube : numpy.ndarray
+        Cube with shape (time, y, x) and NaN where there is no data.
+
+    times : ArrayLike
+        Dates of the cube.
+
+    order : int = 2
+        Number of harmonics of the annual cycle.
+
+    trim : float = 0.15
+        Minimum fraction of the valid dates of a pixel at every side of a
+        break, the candidates are the dates inside the trimmed period.
+
+    every : int = 1
+        Test one of every this number of dates as candidate, to make the
+        search faster.
+
+    max_bytes : int = 256 MiB
+        Memory for the arrays of every chunk of pixels.
+
+    Returns
+    -------
+    maps : dict[str, numpy.ndarray]
+        Maps with shape (y, x) by name (see BREAK_MAPS), the date of the
+        break in decimal years and the changes in units of the cube and
+        units of the cube by year.
+    """
+    n_times, ny, nx = cube.shape
+    y = cube.reshape(n_times, ny * nx)
+
+    order_times = np.argsort(times)
+    t = decimal_years(np.asarray(times)[order_times])
+    y = y[order_times]
+
+    # Candidates inside the trimmed period
+    start, end = int(np.ceil(trim * n_times)), int(np.floor((1 - trim) * n_times))
+    candidates = t[start:end + 1:every]
+
+    # Memory of the arrays of the candidates by pixel
+    k = 2 + 2 * order
+    columns = len(candidates) * (3 * k + 12) + 3 * n_times
+    chunk = max(1, int(max_bytes // (8 * columns)))
+
+    maps = {name: np.full(ny * nx, np.nan) for name in BREAK_MAPS}
+
+    for start in range(0, ny * nx, chunk):
+        block = slice(start, start + chunk)
+        result = break_search(y[:, block].astype("float64"), t, candidates, order, trim)
+
+        for name in BREAK_MAPS:
+            maps[name][block] = result[name]
+
+    return {name: values.reshape(ny, nx) for name, values in maps.items()}
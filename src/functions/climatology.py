@@ -0,0 +1,184 @@
+# %% Dependencies imports
+import numpy as np
+import pandas as pd
+import shapely
+import xarray
+
+# %% Typing imports
+from typing import Sequence
+
+# %% Constants
+# Statistics of every variable by calendar month, without the percentiles
+STATISTICS = ["mean", "std", "count"]
+
+
+# %% Functions
+def monthly_climatology(
+    data: xarray.Dataset,
+    variables: Sequence[str] = ("NDVI", "Surface Temperature"),
+    percentiles: Sequence[float] = (10, 50, 90),
+) -> xarray.Dataset:
+    """
+    Function to calculate the climatology of every pixel by calendar month:
+    mean, standard deviation, number of valid values and percentiles.
+
+    The cube is read one calendar month at a time, so a cube opened without
+    loading it is never in memory at once.
+
+    Parameters
+    ----------
+    data : xarray.Dataset
+        Cube with the dimensions (time, latitude, longitude), like the
+        NetCDF files of 3_process_rasters.py.
+
+    variables : Sequence[str] = ("NDVI", "Surface Temperature")
+        Variables of the cube.
+
+    percentiles : Sequence[float] = (10, 50, 90)
+        Percentiles to calculate, between 0 and 100.
+
+    Returns
+    -------
+    climatology : xarray.Dataset
+        Variables named "{variable} {statistic}" (mean, std, count, p10,
+        ...) with the dimensions (month, latitude, longitude).
+    """
+    months = data["time"].dt.month.values
+    names = STATISTICS + [f"p{p:g}" for p in percentiles]
+
+    _, ny, nx = data[variables[0]].transpose("time", "latitude", "longitude").shape
+    stats = {f"{v} {name}": np.full((12, ny, nx), np.nan, dtype=np.float32) for v in variables for name in names}
+
+    for month in range(1, 13):
+        rows = np.flatnonzero(months == month)
+
+        if len(rows) == 0:
+            continue
+
+        for variable in variables:
+            values = data[variable].isel(time=rows).transpose("time", "latitude", "longitude").values
+            count = np.isfinite(values).sum(axis=0)
+
+            # Pixels without data (or with only one value for the standard
+            # deviation) keep NaN, without a warning
+            with np.errstate(invalid="ignore", divide="ignore"):
+                total = np.nansum(values, axis=0)
+                mean = np.where(count > 0, total / count, np.nan)
+                squares = np.nansum((values - mean) ** 2, axis=0)
+                std = np.where(count > 1, np.sqrt(squares / (count - 1)), np.nan)
+
+            stats[f"{variable} mean"][month - 1] = mean
+            stats[f"{variable} std"][month - 1] = std
+            stats[f"{variable} count"][month - 1] = count
+
+            if percentiles and (count > 0).any():
+                # Only the pixels with data, nanpercentile warns on the others
+                valid = count > 0
+                values = np.nanpercentile(values[:, valid], list(percentiles), axis=0)
+
+                for p, value in zip(percentiles, values):
+                    stats[f"{variable} p{p:g}"][month - 1][valid] = value
+
+    climatology = xarray.Dataset(
+        {name: (("month", "latitude", "longitude"), values) for name, values in stats.items()},
+        coords={"month": np.arange(1, 13), "latitude": data["latitude"], "longitude": data["longitude"]},
+    )
+
+    return climatology
+
+
+def anomaly_map(
+    climatology: xarray.Dataset, data: xarray.Dataset, date: str | np.datetime64, variable: str = "NDVI",
+) -> xarray.DataArray:
+    """
+    Function to get the standardized anomaly of every pixel in a date,
+    looking up the climatology of its calendar month.
+
+    Parameters
+    ----------
+    climatology : xarray.Dataset
+        Climatology from monthly_climatology().
+
+    data : xarray.Dataset
+        Cube of the climatology.
+
+    date : str | numpy.datetime64
+        Date of interest, the nearest image of the cube is used.
+
+    variable : str = "NDVI"
+        Variable of the cube.
+
+    Returns
+    -------
+    anomaly : xarray.DataArray
+        Anomaly map in standard deviations of its calendar month.
+    """
+    # Nearest image, the time of the cubes of stage 3 is not sorted
+    times = data["time"].values
+    nearest = np.argmin(np.abs(times - np.datetime64(date, "ns")))
+    image = data[variable].isel(time=nearest)
+    month = int(image["time"].dt.month)
+
+    mean = climatology[f"{variable} mean"].sel(month=month, drop=True)
+    std = climatology[f"{variable} std"].sel(month=month, drop=True)
+
+    return ((image - mean) / std).rename(f"{variable} anomaly")
+
+
+def zone_anomalies(
+    climatology: xarray.Dataset, data: xarray.Dataset, zone: shapely.Geometry, variable: str = "NDVI",
+) -> pd.Series:
+    """
+    Function to get the series of the mean standardized anomaly of the
+    pixels inside a zone, looking up the climatology of every date.
+
+    Only the rows and columns of the cube that cover the zone are read.
+
+    Parameters
+    ----------
+    climatology : xarray.Dataset
+        Climatology from monthly_climatology().
+
+    data : xarray.Dataset
+        Cube of the climatology.
+
+    zone : shapely.Geometry
+        Zone of interest in the CRS of the cube (e.g. from
+        functions.geometries.get_prepared()).
+
+    variable : str = "NDVI"
+        Variable of the cube.
+
+    Returns
+    -------
+    anomalies : pd.Series
+        Mean anomaly in standard deviations by date.
+    """
+    lon, lat = np.meshgrid(data["longitude"].values, data["latitude"].values)
+    inside = shapely.contains_xy(zone, lon, lat)
+
+    if not inside.any():
+        raise ValueError("the zone doesn't cover any pixel of the cube")
+
+    # Window of the cube that covers the zone
+    rows = np.flatnonzero(inside.any(axis=1))
+    cols = np.flatnonzero(inside.any(axis=0))
+    window = {"latitude": slice(rows[0], rows[-1] + 1), "longitude": slice(cols[0], cols[-1] + 1)}
+
+    inside = inside[window["latitude"], window["longitude"]]
+
+    values = data[variable].isel(window).transpose("time", "latitude", "longitude").values
+    months = data["time"].dt.month.values - 1
+
+    # Climatology of the calendar month of every date
+    mean = climatology[f"{variable} mean"].isel(window).values[months]
+    std = climatology[f"{variable} std"].isel(window).values[months]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        anomalies = (values - mean) / std
+        anomalies = np.where(inside, anomalies, np.nan)
+
+        valid = np.isfinite(anomalies).sum(axis=(1, 2))
+        series = np.nansum(anomalies, axis=(1, 2)) / np.where(valid > 0, valid, np.nan)
+
+    return pd.Series(series, index=pd.Index(data["time"].values, name="Time"), name=f"{variable} anomaly").sort_index()
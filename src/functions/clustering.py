@@ -0,0 +1,241 @@
+# %% Dependencies imports
+import numpy as np
+
+# %% Typing imports
+import numpy.typing as npt
+from typing import Callable, Iterable
+
+
+# %% Functions
+def assign(features: npt.NDArray, centers: npt.NDArray) -> tuple[npt.NDArray, npt.NDArray]:
+    """
+    Function to assign every row to its nearest center.
+
+    Parameters
+    ----------
+    features : numpy.ndarray
+        Features with shape (rows, features), without NaN.
+
+    centers : numpy.ndarray
+        Centers with shape (clusters, features).
+
+    Returns
+    -------
+    labels : numpy.ndarray
+        Index of the nearest center of every row.
+
+    distances : numpy.ndarray
+        Squared distance of every row to its center.
+    """
+    # |x - c|² = |x|² - 2 x·c + |c|², the products of all rows and centers at once
+    distances = (
+        (features ** 2).sum(axis=1)[:, None]
+        - 2 * features @ centers.T
+        + (centers ** 2).sum(axis=1)[None, :]
+    )
+    labels = np.argmin(distances, axis=1)
+
+    return labels, np.maximum(distances[np.arange(len(labels)), labels], 0.0)
+
+
+def kmeans_plus_plus(features: npt.NDArray, k: int, rng: np.random.Generator) -> npt.NDArray:
+    """
+    Function to choose the initial centers with k-means++: every new center
+    is a row drawn with probability proportional to its squared distance to
+    the centers already chosen.
+
+    Parameters
+    ----------
+    features : numpy.ndarray
+        Sample of the features with shape (rows, features).
+
+    k : int
+        Number of centers.
+
+    rng : numpy.random.Generator
+        Random generator.
+
+    Returns
+    -------
+    centers : numpy.ndarray
+        Centers with shape (k, features).
+    """
+    centers = [features[rng.integers(len(features))]]
+
+    for _ in range(1, k):
+        _, distances = assign(features, np.array(centers))
+        total = distances.sum()
+
+        # All the rows are on the centers, repeat a random row
+        i = rng.choice(len(features), p=distances / total) if total > 0 else rng.integers(len(features))
+        centers.append(features[i])
+
+    return np.array(centers)
+
+
+def lloyd(features: npt.NDArray, centers: npt.NDArray, iterations: int = 10) -> tuple[npt.NDArray, float]:
+    """
+    Function to refine centers with the iterations of the classic k-means
+    over features in memory.
+
+    Parameters
+    ----------
+    features : numpy.ndarray
+        Features with shape (rows, features).
+
+    centers : numpy.ndarray
+        Initial centers with shape (clusters, features).
+
+    iterations : int = 10
+        Number of iterations.
+
+    Returns
+    -------
+    centers : numpy.ndarray
+        Refined centers.
+
+    inertia : float
+        Sum of the squared distances of the rows to their centers.
+    """
+    centers = centers.copy()
+    k = len(centers)
+
+    for _ in range(iterations):
+        labels, _ = assign(features, centers)
+        members = (labels[:, None] == np.arange(k)).astype("float64")
+        n = members.sum(axis=0)
+
+        # The empty clusters keep their center
+        moved = n > 0
+        centers[moved] = (members.T @ features)[moved] / n[moved][:, None]
+
+    _, distances = assign(features, centers)
+
+    return centers, float(distances.sum())
+
+
+def reservoir_sample(batches: Iterable[npt.NDArray], size: int, rng: np.random.Generator) -> npt.NDArray:
+    """
+    Function to draw a uniform sample of the rows of all the batches in one
+    pass, with reservoir sampling (algorithm R) vectorized by batch.
+
+    Parameters
+    ----------
+    batches : Iterable[numpy.ndarray]
+        Batches of features with shape (rows, features).
+
+    size : int
+        Number of rows of the sample.
+
+    rng : numpy.random.Generator
+        Random generator.
+
+    Returns
+    -------
+    sample : numpy.ndarray
+        Sample with shape (size, features), or all the rows if there are
+        fewer.
+    """
+    sample, seen = None, 0
+
+    for batch in batches:
+        if sample is None:
+            sample = np.empty((size, batch.shape[1]), dtype=batch.dtype)
+
+        # The row i enters the reservoir while it isn't full, and after in a
+        # random slot with probability size / (i + 1)
+        index = seen + np.arange(len(batch))
+        slots = np.where(index < size, index, rng.integers(0, index + 1))
+        rows = np.flatnonzero(slots < size)
+
+        # When several rows of the batch fall in a slot the last one stays
+        _, last = np.unique(slots[rows][::-1], return_index=True)
+        rows = rows[::-1][last]
+        sample[slots[rows]] = batch[rows]
+
+        seen += len(batch)
+
+    if sample is None:
+        return np.empty((0, 0))
+
+    return sample[:min(seen, size)]
+
+
+def minibatch_kmeans(
+    batches: Callable[[], Iterable[npt.NDArray]],
+    k: int = 5,
+    epochs: int = 5,
+    init_size: int = 10000,
+    n_init: int = 3,
+    seed: int = 0,
+) -> npt.NDArray:
+    """
+    Function to find the centers of k clusters with mini-batch k-means
+    (Sculley, 2010), reading the features by batches so they don't need to
+    be in memory at once.
+
+    Every batch moves every center to the mean of its rows in the batch
+    with a learning rate of the rows of the batch over all the rows
+    assigned to the center, so the centers converge to the means of their
+    clusters.
+
+    Parameters
+    ----------
+    batches : Callable[[], Iterable[numpy.ndarray]]
+        Function that returns a new iterable of batches of features with
+        shape (rows, features) and without NaN, it is called once by epoch.
+
+    k : int = 5
+        Number of clusters.
+
+    epochs : int = 5
+        Number of passes over the batches.
+
+    init_size : int = 10000
+        Number of rows sampled from all the batches (see reservoir_sample())
+        to initialize the centers with k-means++.
+
+    n_init : int = 3
+        Number of initializations refined with lloyd() on the sample, the
+        one with the lowest inertia is kept.
+
+    seed : int = 0
+        Seed of the random generator.
+
+    Returns
+    -------
+    centers : numpy.ndarray
+        Centers with shape (k, features).
+    """
+    rng = np.random.default_rng(seed)
+
+    # Sample of all the batches to initialize the centers, so the clusters
+    # of the last rows are also in it
+    sample = reservoir_sample(batches(), init_size, rng)
+
+    if len(sample) < k:
+        raise ValueError(f"there are {len(sample)} rows to find {k} clusters")
+
+    inits = [lloyd(sample, kmeans_plus_plus(sample, k, rng)) for _ in range(n_init)]
+    centers = min(inits, key=lambda init: init[1])[0]
+    counts = np.zeros(k)
+
+    for _ in range(epochs):
+        for batch in batches():
+            if len(batch) == 0:
+                continue
+
+            labels, _ = assign(batch, centers)
+
+            # Rows and sums of the batch by center
+            members = (labels[:, None] == np.arange(k)).astype("float64")
+            n = members.sum(axis=0)
+            sums = members.T @ batch
+
+            counts += n
+            moved = n > 0
+            rate = n[moved] / counts[moved]
+
+            centers[moved] += rate[:, None] * (sums[moved] / n[moved][:, None] - centers[moved])
+
+    return centers
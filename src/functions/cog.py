@@ -0,0 +1,214 @@
+# %% Dependencies imports
+import os
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
+
+# %% Typing imports
+from typing import Sequence
+
+# %% Functions
+def to_cog(
+    path: str,
+    save_path: str | None = None,
+    compress: str = "DEFLATE",
+    blocksize: int = 256,
+    resampling: str = "average",
+    overview_levels: Sequence[int] | None = None,
+) -> str:
+    """
+    Function to convert a GeoTIFF to a Cloud-Optimized GeoTIFF (COG) with
+    internal tiles, compression and overviews.
+
+    With internal tiles a windowed read only decodes the tiles that touch the
+    window, instead of all the strips of the image.
+
+    Parameters
+    ----------
+    path : str
+        Path of the GeoTIFF to convert.
+
+    save_path : str | None = None
+        Path to save the COG, if it is not defined the original image is
+        replaced.
+
+    compress : str = "DEFLATE"
+        Compression of the tiles: "DEFLATE", "ZSTD", "LZW" or "NONE".
+
+    blocksize : int = 256
+        Width and height of the internal tiles in pixels.
+
+    resampling : str = "average"
+        Resampling method of the overviews.
+
+    overview_levels : Sequence[int] | None = None
+        Decimation factors of the overviews, if it is not defined they are
+        calculated until the image fits in one tile.
+
+    Returns
+    -------
+    save_path : str
+        Path of the COG.
+    """
+    # If there is not save path, write to a temporal file and then replace
+    # the original image
+    replace = save_path is None
+    if replace:
+        save_path = path + ".cog.tmp"
+
+    options = {
+        "driver": "COG",
+        "compress": compress,
+        "blocksize": blocksize,
+        "overview_resampling": resampling,
+        "bigtiff": "IF_SAFER",
+    }
+
+    # Floating point images compress better with the floating point predictor
+    with rasterio.open(path, "r") as src:
+        if src.dtypes[0].startswith("float") and compress != "NONE":
+            options["predictor"] = 3
+
+    if overview_levels is None:
+        options["overviews"] = "AUTO"
+        rasterio.shutil.copy(path, save_path, **options)
+
+    # The COG driver can't receive the levels, so they are built in a
+    # temporal copy and then copied with the overviews
+    else:
+        tmp_path = save_path + ".ovr.tmp"
+        rasterio.shutil.copy(path, tmp_path, driver="GTiff")
+
+        with rasterio.open(tmp_path, "r+") as tmp:
+            tmp.build_overviews(
+                list(overview_levels), Resampling[resampling]
+            )
+
+        options["overviews"] = "FORCE_USE_EXISTING"
+        rasterio.shutil.copy(tmp_path, save_path, **options)
+        os.remove(tmp_path)
+
+    if replace:
+        os.replace(save_path, path)
+        save_path = path
+
+    return save_path
+
+
+def write_empty(template: str, path: str, nodata: float = -3e5) -> str:
+    """
+    Function to write an image with the grid and the bands of another one
+    and all its pixels as nodata, e.g. for the months without scenes.
+
+    Parameters
+    ----------
+    template : str
+        Path of an image with the grid, the bands and the format.
+
+    path : str
+        Path of the new image.
+
+    nodata : float = -3e5
+        Value of all the pixels, the unmask value of the downloads.
+
+    Returns
+    -------
+    path : str
+        Path of the new image.
+    """
+    with rasterio.open(template, "r") as src:
+        profile = src.profile
+
+    profile.update(driver="GTiff", nodata=nodata)
+
+    with rasterio.open(path, "w", **profile) as dst:
+        for _, window in dst.block_windows(1):
+            block = np.full((profile["count"], window.height, window.width), nodata, dtype=profile["dtype"])
+            dst.write(block, window=window)
+
+    return path
+
+
+def validate_cog(path: str) -> list[str]:
+    """
+    Function to validate that an image is a Cloud-Optimized GeoTIFF.
+
+    Parameters
+    ----------
+    path : str
+        Path of the image to validate.
+
+    Returns
+    -------
+    errors : list[str]
+        Problems found in the image, it is empty if the image is a valid COG.
+    """
+    errors = []
+
+    with rasterio.open(path, "r") as src:
+        structure = src.tags(ns="IMAGE_STRUCTURE")
+
+        if src.driver != "GTiff":
+            errors.append(f"driver is {src.driver}, not GTiff")
+
+        # GDAL reports the COG layout only when the IFDs and tiles are sorted
+        # like the COG specification requires
+        if structure.get("LAYOUT", "").upper() != "COG":
+            errors.append("the file layout is not COG")
+
+        # Striped images have to decode whole strips in a windowed read
+        if not src.profile.get("tiled", False):
+            errors.append("the image is not internally tiled")
+
+        # Images larger than one tile need overviews
+        block_width = src.block_shapes[0][1]
+        if max(src.width, src.height) > block_width and not src.overviews(1):
+            errors.append("the image doesn't have overviews")
+
+    return errors
+
+
+def convert_folder(path: str, validate: bool = True, **kwargs) -> list[str]:
+    """
+    Function to convert all the GeoTIFFs of a folder to Cloud-Optimized
+    GeoTIFFs in place, skipping the ones that are already COGs.
+
+    Parameters
+    ----------
+    path : str
+        Folder with the images.
+
+    validate : bool = True
+        If True, validate every image after the conversion.
+
+    **kwargs
+        Options passed to to_cog().
+
+    Returns
+    -------
+    converted : list[str]
+        Paths of the images converted.
+    """
+    converted = []
+
+    for image in sorted(os.listdir(path)):
+        if not image.endswith(".tif"):
+            continue
+
+        path_image = os.path.join(path, image)
+
+        # Skip the images that are already COGs
+        if not validate_cog(path_image):
+            continue
+
+        to_cog(path_image, **kwargs)
+
+        if validate:
+            errors = validate_cog(path_image)
+            if errors:
+                raise ValueError(f"{path_image} is not a valid COG: {', '.join(errors)}")
+
+        converted.append(path_image)
+
+    return converted
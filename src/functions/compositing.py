@@ -0,0 +1,372 @@
+# %% Dependencies imports
+import os
+import json
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from functions.cog import to_cog
+
+# %% Typing imports
+import numpy.typing as npt
+from typing import Sequence
+
+# %% Constants
+# Band order of the images exported by 2_download_rasters.py
+BANDS = ["BLUE", "GREEN", "RED", "NIR", "TEMPERATURE", "NDVI"]
+
+# Value used by 2_download_rasters.py to unmask the images
+NODATA = -3e5
+
+# Calendar seasons used to group the scenes, December is assigned to the
+# season of the next year
+SEASONS = {
+    12: "DJF", 1: "DJF", 2: "DJF",
+    3: "MAM", 4: "MAM", 5: "MAM",
+    6: "JJA", 7: "JJA", 8: "JJA",
+    9: "SON", 10: "SON", 11: "SON",
+}
+
+# First month of every season to date the composites
+SEASON_MONTHS = {"DJF": 12, "MAM": 3, "JJA": 6, "SON": 9}
+
+
+# %% Functions
+def period_key(date: np.datetime64 | str, period: str = "month") -> str:
+    """
+    Function to get the calendar period of a date as a date string with the
+    same format of the images names (YYYY-MM-DD).
+
+    Parameters
+    ----------
+    date : numpy.datetime64 | str
+        Date of the scene.
+
+    period : str = "month"
+        Calendar period to group the scenes: "month", "season" or "year".
+
+    Returns
+    -------
+    key : str
+        First day of the period that contains the date.
+    """
+    date = np.datetime64(date, "D").astype(object)
+
+    match period:
+        case "month":
+            key = f"{date.year:04d}-{date.month:02d}-01"
+        case "season":
+            # December belongs to the season of the next year, so the
+            # composite is dated in December of the previous year
+            season = SEASONS[date.month]
+            year = date.year - 1 if date.month in (1, 2) else date.year
+            key = f"{year:04d}-{SEASON_MONTHS[season]:02d}-01"
+        case "year":
+            key = f"{date.year:04d}-01-01"
+        case _:
+            raise ValueError("period must be 'month', 'season' or 'year'")
+
+    return key
+
+
+def group_scenes(path: str, period: str = "month") -> dict[str, list[str]]:
+    """
+    Function to group the per-scene images of a folder by calendar period.
+
+    The images must be named with their acquisition date (YYYY-MM-DD.tif),
+    the same layout used by 2_download_rasters.py.
+
+    Parameters
+    ----------
+    path : str
+        Folder with the per-scene images.
+
+    period : str = "month"
+        Calendar period to group the scenes: "month", "season" or "year".
+
+    Returns
+    -------
+    groups : dict[str, list[str]]
+        Paths of the scenes sorted by date and grouped by period key.
+    """
+    groups = {}
+
+    for image in sorted(os.listdir(path)):
+        if not image.endswith(".tif"):
+            continue
+
+        key = period_key(image[:-4], period)
+        groups.setdefault(key, []).append(os.path.join(path, image))
+
+    return groups
+
+
+def _read_block(
+    src: rasterio.io.DatasetReader, window: Window | None = None
+) -> npt.NDArray:
+    """
+    Read all bands of one image (or one window of it) as float64 with the
+    nodata values replaced by NaN.
+    """
+    data = src.read(window=window).astype("float64")
+    data[data == NODATA] = np.nan
+
+    return data
+
+
+def _row_windows(height: int, width: int, block_rows: int) -> list[Window]:
+    """
+    Split an image in windows of complete rows.
+    """
+    return [
+        Window(0, row, width, min(block_rows, height - row))
+        for row in range(0, height, block_rows)
+    ]
+
+
+def composite_mean(paths: Sequence[str]) -> npt.NDArray:
+    """
+    Function to calculate the mean composite of a group of scenes using
+    running accumulators, so only one scene is held in memory.
+
+    Parameters
+    ----------
+    paths : Sequence[str]
+        Paths of the scenes of the period.
+
+    Returns
+    -------
+    composite : numpy.ndarray
+        Array with shape (bands, rows, cols) and NaN where there is no data.
+    """
+    total = None
+    count = None
+
+    for path in paths:
+        with rasterio.open(path, "r") as src:
+            data = _read_block(src)
+
+        # Create the accumulators with the shape of the first scene
+        if total is None:
+            total = np.zeros_like(data)
+            count = np.zeros(data.shape, dtype="uint32")
+
+        valid = np.isfinite(data)
+        total[valid] += data[valid]
+        count += valid
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        composite = total / count
+
+    return composite
+
+
+def composite_max_ndvi(paths: Sequence[str], ndvi_band: int = 6) -> npt.NDArray:
+    """
+    Function to calculate the maximum NDVI composite of a group of scenes,
+    all bands of each pixel are taken from the scene with the greatest NDVI.
+
+    Parameters
+    ----------
+    paths : Sequence[str]
+        Paths of the scenes of the period.
+
+    ndvi_band : int = 6
+        Band of the NDVI in the images (starting in 1, like rasterio).
+
+    Returns
+    -------
+    composite : numpy.ndarray
+        Array with shape (bands, rows, cols) and NaN where there is no data.
+    """
+    composite = None
+    best = None
+
+    for path in paths:
+        with rasterio.open(path, "r") as src:
+            data = _read_block(src)
+
+        ndvi = data[ndvi_band - 1]
+
+        # Create the accumulators with the shape of the first scene
+        if composite is None:
+            composite = np.full_like(data, np.nan)
+            best = np.full_like(ndvi, -np.inf)
+
+        # Replace the pixels where the NDVI is greater than the previous one
+        better = np.isfinite(ndvi) & (ndvi > best)
+        composite[:, better] = data[:, better]
+        best[better] = ndvi[better]
+
+    return composite
+
+
+def composite_median(paths: Sequence[str], block_rows: int = 256) -> npt.NDArray:
+    """
+    Function to calculate the median composite of a group of scenes by
+    blocks of rows, so only one block of every scene is held in memory.
+
+    Parameters
+    ----------
+    paths : Sequence[str]
+        Paths of the scenes of the period.
+
+    block_rows : int = 256
+        Number of rows read at once from every scene.
+
+    Returns
+    -------
+    composite : numpy.ndarray
+        Array with shape (bands, rows, cols) and NaN where there is no data.
+    """
+    srcs = [rasterio.open(path, "r") for path in paths]
+
+    try:
+        count, height, width = srcs[0].count, srcs[0].height, srcs[0].width
+        composite = np.full((count, height, width), np.nan)
+
+        for window in _row_windows(height, width, block_rows):
+            # Stack the block of all scenes and reduce it along the scenes
+            block = np.stack([_read_block(src, window) for src in srcs])
+            rows = slice(window.row_off, window.row_off + window.height)
+
+            # The median of a pixel without data in any scene is NaN
+            valid = np.isfinite(block).any(axis=0)
+            composite[:, rows][valid] = np.nanmedian(block[:, valid], axis=0)
+
+    finally:
+        for src in srcs:
+            src.close()
+
+    return composite
+
+
+def composite_period(
+    paths: Sequence[str], method: str = "mean", block_rows: int = 256
+) -> npt.NDArray:
+    """
+    Function to calculate the composite of a group of scenes with the
+    compositing rule selected by the user.
+
+    Parameters
+    ----------
+    paths : Sequence[str]
+        Paths of the scenes of the period.
+
+    method : str = "mean"
+        Compositing rule: "mean", "median" or "max_ndvi".
+
+    block_rows : int = 256
+        Number of rows read at once from every scene in the median.
+
+    Returns
+    -------
+    composite : numpy.ndarray
+        Array with shape (bands, rows, cols) and NaN where there is no data.
+    """
+    match method:
+        case "mean":
+            composite = composite_mean(paths)
+        case "median":
+            composite = composite_median(paths, block_rows)
+        case "max_ndvi":
+            composite = composite_max_ndvi(paths)
+        case _:
+            raise ValueError("method must be 'mean', 'median' or 'max_ndvi'")
+
+    return composite
+
+
+def _up_to_date(filename: str, paths: Sequence[str], method: str) -> bool:
+    """
+    If a composite was made with the same scenes and method, saved in its
+    tags, and it is newer than all of them.
+    """
+    if not os.path.exists(filename):
+        return False
+
+    with rasterio.open(filename, "r") as src:
+        tags = src.tags()
+
+    scenes = json.dumps(sorted(os.path.basename(p) for p in paths))
+    if tags.get("SCENES") != scenes or tags.get("METHOD") != method:
+        return False
+
+    return os.stat(filename).st_mtime_ns >= max(os.stat(p).st_mtime_ns for p in paths)
+
+
+def write_composites(
+    path: str,
+    save_path: str,
+    period: str = "month",
+    method: str = "mean",
+    block_rows: int = 256,
+    overwrite: bool = False,
+    cog: bool = False,
+) -> list[str]:
+    """
+    Function to composite all the per-scene images of a folder by calendar
+    period and save them with the layout of 2_download_rasters.py, so they
+    can be read directly by 3_process_rasters.py.
+
+    Parameters
+    ----------
+    path : str
+        Folder with the per-scene images (YYYY-MM-DD.tif).
+
+    save_path : str
+        Folder to save the composites (YYYY-MM-DD.tif).
+
+    period : str = "month"
+        Calendar period to group the scenes: "month", "season" or "year".
+
+    method : str = "mean"
+        Compositing rule: "mean", "median" or "max_ndvi".
+
+    block_rows : int = 256
+        Number of rows read at once from every scene in the median.
+
+    overwrite : bool = False
+        If False, skip the composites that are up to date: made with the same
+        scenes and method (saved in the tags of the composite) and newer
+        than all the scenes, so the scenes that arrive later for a period
+        rebuild its composite.
+
+    cog : bool = False
+        If True, save the composites as Cloud-Optimized GeoTIFFs.
+
+    Returns
+    -------
+    saved : list[str]
+        Paths of the composites written.
+    """
+    saved = []
+
+    os.makedirs(save_path, exist_ok=True)
+
+    for key, paths in group_scenes(path, period).items():
+        filename = os.path.join(save_path, f"{key}.tif")
+
+        if not overwrite and _up_to_date(filename, paths, method):
+            continue
+
+        composite = composite_period(paths, method, block_rows)
+
+        # Use the profile of the first scene and restore the nodata value
+        with rasterio.open(paths[0], "r") as src:
+            profile = src.profile.copy()
+
+        profile.update(dtype="float64", nodata=NODATA)
+        composite[np.isnan(composite)] = NODATA
+
+        with rasterio.open(filename, "w", **profile) as dst:
+            dst.write(composite)
+            dst.descriptions = tuple(BANDS[: composite.shape[0]])
+            dst.update_tags(SCENES=json.dumps(sorted(os.path.basename(p) for p in paths)), METHOD=method)
+
+        if cog:
+            to_cog(filename)
+
+        saved.append(filename)
+
+    return saved
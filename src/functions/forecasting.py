@@ -0,0 +1,304 @@
+# %% Dependencies imports
+import json
+import itertools
+import warnings
+import numpy as np
+import pandas as pd
+
+from functions.sites import pool_map
+
+# %% Typing imports
+import numpy.typing as npt
+from typing import Sequence
+
+
+# %% Functions
+def order_grid(
+    p: Sequence[int] = (0, 1, 2),
+    d: Sequence[int] = (0,),
+    q: Sequence[int] = (0, 1),
+    seasonal: Sequence[tuple[int, int, int]] = ((0, 0, 0), (1, 0, 0), (0, 0, 1), (1, 0, 1)),
+    period: int = 12,
+) -> list[tuple[tuple, tuple]]:
+    """
+    Function to get the candidate orders of the SARIMAX models.
+
+    Parameters
+    ----------
+    p, d, q : Sequence[int]
+        Autoregressive, differencing and moving average orders.
+
+    seasonal : Sequence[tuple[int, int, int]]
+        Seasonal orders (P, D, Q).
+
+    period : int = 12
+        Months of the seasonal cycle.
+
+    Returns
+    -------
+    orders : list[tuple[tuple, tuple]]
+        Pairs of order (p, d, q) and seasonal order (P, D, Q, period).
+    """
+    return [
+        ((i, j, k), (*s, period if any(s) else 0))
+        for i, j, k, s in itertools.product(p, d, q, seasonal)
+    ]
+
+
+def lagged_drivers(table: pd.DataFrame, lags: dict[str, int], steps: int = 0) -> pd.DataFrame:
+    """
+    Function to move the drivers forward their lags and extend them some
+    months after the end of the table, to use them as exogenous variables.
+
+    The months of a driver without a value (the gaps, the months before the
+    table and the months after its last value) take its mean in their
+    calendar month before the shift, so every month has the value or the
+    climatology of the driver lag months before and the forecasts after the
+    lags are conditional on the climatology of the drivers.
+
+    Parameters
+    ----------
+    table : pd.DataFrame
+        Monthly drivers indexed by the end of the month, without missing
+        months.
+
+    lags : dict[str, int]
+        Months that every driver leads NDVI, the drivers not in the table
+        are skipped.
+
+    steps : int = 0
+        Months added after the end of the table.
+
+    Returns
+    -------
+    exog : pd.DataFrame
+        Lagged drivers from the first month of the table to steps months
+        after its end, without NaN.
+    """
+    index = pd.date_range(table.index[0], periods=len(table) + steps, freq="ME")
+    exog = pd.DataFrame(index=index)
+
+    for driver, lag in lags.items():
+        if driver not in table.columns:
+            continue
+
+        # Fill the driver from lag months before the table, then shift it
+        source = pd.date_range(end=index[-1], periods=len(index) + lag, freq="ME")
+        climatology = table[driver].groupby(table.index.month).mean()
+
+        values = table[driver].reindex(source)
+        values = values.fillna(pd.Series(climatology.reindex(source.month).values, index=source))
+
+        exog[driver] = values.shift(lag).reindex(index)
+
+    return exog
+
+
+def _trend(order: tuple, seasonal_order: tuple) -> str:
+    """
+    Constant of the models without differences.
+    """
+    return "c" if order[1] == 0 and seasonal_order[1] == 0 else "n"
+
+
+def _model(y: npt.NDArray, exog: npt.NDArray, order: tuple, seasonal_order: tuple):
+    """
+    SARIMAX model of a series with its exogenous variables.
+    """
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+    return SARIMAX(
+        y, exog=exog if exog.shape[1] else None, order=order,
+        seasonal_order=seasonal_order, trend=_trend(order, seasonal_order),
+    )
+
+
+def _fit(task: tuple) -> tuple:
+    """
+    Fit a model by maximum likelihood, the models that fail have an
+    infinite AIC.
+    """
+    name, y, exog, order, seasonal_order = task
+
+    try:
+        # The model is built first, statsmodels sets its warnings filters
+        # when it is imported
+        model = _model(y, exog, order, seasonal_order)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            result = model.fit(disp=False, maxiter=200)
+
+        aic = result.aic if np.isfinite(result.aic) else np.inf
+        return name, order, seasonal_order, aic, result.params.tolist()
+
+    except (np.linalg.LinAlgError, ValueError):
+        return name, order, seasonal_order, np.inf, []
+
+
+def select_orders(
+    series: dict[str, tuple[pd.Series, pd.DataFrame]],
+    orders: list[tuple[tuple, tuple]] | None = None,
+    processes: int | None = None,
+) -> dict[str, dict]:
+    """
+    Function to fit the SARIMAX models of many series with all candidate
+    orders and keep the one with the lowest AIC of every series. All the
+    fits of all series are calculated in a process pool.
+
+    Parameters
+    ----------
+    series : dict[str, tuple[pd.Series, pd.DataFrame]]
+        Monthly series (NaN where there is no data) and their exogenous
+        variables (see lagged_drivers()) by name, e.g. by lagoon or zone.
+
+    orders : list[tuple[tuple, tuple]] | None = None
+        Candidate orders, by default order_grid().
+
+    processes : int | None = None
+        Number of worker processes, by default the number of CPUs. If it is
+        1 the models are fitted in this process.
+
+    Returns
+    -------
+    models : dict[str, dict]
+        Fitted state of the model of every series: orders, parameters, AIC,
+        exogenous variables and the last month of the fit, to forecast
+        again without fitting (see forecast()).
+    """
+    orders = order_grid() if orders is None else orders
+
+    tasks = []
+    for name, (y, exog) in series.items():
+        x = exog.reindex(y.index).to_numpy("float64")
+        tasks += [(name, y.to_numpy("float64"), x, order, seasonal) for order, seasonal in orders]
+
+    models = {}
+    for name, order, seasonal, aic, params in pool_map(_fit, tasks, processes):
+        if name not in models or aic < models[name]["aic"]:
+            models[name] = {"order": order, "seasonal_order": seasonal, "aic": aic, "params": params}
+
+    for name, (y, exog) in series.items():
+        if not np.isfinite(models[name]["aic"]):
+            raise ValueError(f"no model of {name} could be fitted")
+
+        models[name]["exog"] = exog.columns.tolist()
+        models[name]["fitted"] = str(y.index[-1].to_period("M"))
+
+    return models
+
+
+def _forecast(task: tuple) -> tuple:
+    """
+    Forecast of a series with the parameters of its model.
+    """
+    name, model, y, exog, future, alpha = task
+
+    # The Kalman filter with the saved parameters adds the new months
+    # without fitting again
+    result = _model(y, exog, tuple(model["order"]), tuple(model["seasonal_order"])).filter(
+        np.asarray(model["params"])
+    )
+    prediction = result.get_forecast(len(future), exog=future if future.shape[1] else None)
+
+    return name, prediction.predicted_mean, prediction.conf_int(alpha=alpha)
+
+
+def forecast(
+    models: dict[str, dict],
+    series: dict[str, tuple[pd.Series, pd.DataFrame]],
+    steps: int = 12,
+    alpha: float = 0.05,
+    processes: int | None = 1,
+) -> dict[str, pd.DataFrame]:
+    """
+    Function to forecast many series with their fitted models, including
+    the months added after the fit.
+
+    Parameters
+    ----------
+    models : dict[str, dict]
+        Fitted state of the models from select_orders().
+
+    series : dict[str, tuple[pd.Series, pd.DataFrame]]
+        Monthly series and their exogenous variables extended at least
+        steps months after the end of the series (see lagged_drivers()).
+
+    steps : int = 12
+        Months to forecast.
+
+    alpha : float = 0.05
+        Significance level of the prediction intervals.
+
+    processes : int | None = 1
+        Number of worker processes, the filters are fast so by default they
+        run in this process.
+
+    Returns
+    -------
+    forecasts : dict[str, pd.DataFrame]
+        Forecast ("mean", "lower" and "upper") of every series indexed by
+        month.
+    """
+    tasks = []
+    for name, (y, exog) in series.items():
+        model = models[name]
+        exog = exog[model["exog"]]
+
+        index = pd.date_range(y.index[-1], periods=steps + 1, freq="ME")[1:]
+        if not index.isin(exog.index).all():
+            raise ValueError(f"the exogenous variables of {name} end before the forecast")
+
+        tasks.append((
+            name, model, y.to_numpy("float64"), exog.reindex(y.index).to_numpy("float64"),
+            exog.reindex(index).to_numpy("float64"), alpha,
+        ))
+
+    forecasts = {}
+    for name, mean, interval in pool_map(_forecast, tasks, processes):
+        index = pd.date_range(series[name][0].index[-1], periods=steps + 1, freq="ME")[1:]
+        forecasts[name] = pd.DataFrame(
+            {"mean": mean, "lower": interval[:, 0], "upper": interval[:, 1]}, index=index
+        )
+
+    return forecasts
+
+
+def save_models(models: dict[str, dict], path: str) -> None:
+    """
+    Function to save the fitted state of the models as JSON.
+
+    Parameters
+    ----------
+    models : dict[str, dict]
+        Models from select_orders().
+
+    path : str
+        Path of the JSON file.
+    """
+    with open(path, "w") as f:
+        json.dump(models, f, indent=1)
+
+
+def load_models(path: str) -> dict[str, dict]:
+    """
+    Function to read the models saved by save_models().
+
+    Parameters
+    ----------
+    path : str
+        Path of the JSON file.
+
+    Returns
+    -------
+    models : dict[str, dict]
+        Fitted state of the models to forecast again.
+    """
+    with open(path) as f:
+        models = json.load(f)
+
+    for model in models.values():
+        model["order"] = tuple(model["order"])
+        model["seasonal_order"] = tuple(model["seasonal_order"])
+
+    return models
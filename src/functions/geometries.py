@@ -0,0 +1,212 @@
+# %% Dependencies imports
+import os
+import glob
+import hashlib
+import tempfile
+import geopandas as gpd
+import shapely
+
+# %% Constants
+# Shapefile of the forests and folder to store their GeoParquet variants
+FORESTS_PATH = "data/shapefile/mangrove_forests.shp"
+STORE_PATH = "data/processed/cache"
+
+# Geometries already loaded or calculated in this process, keyed by CRS,
+# operation and distance
+_cache = {}
+
+
+# %% Functions
+def shapefile_stamp(path: str) -> list[tuple[str, int, int]]:
+    """
+    Function to get the modification time and the size of a shapefile and
+    its sidecar files, the attributes (.dbf), the CRS (.prj) and the index
+    (.shx) of a shapefile are in other files.
+
+    Parameters
+    ----------
+    path : str
+        Path of the shapefile.
+
+    Returns
+    -------
+    stamp : list[tuple[str, int, int]]
+        Name, modification time in nanoseconds and size of every file.
+    """
+    base, _ = os.path.splitext(path)
+
+    return [
+        (os.path.basename(file), os.stat(file).st_mtime_ns, os.stat(file).st_size)
+        for file in sorted(glob.glob(glob.escape(base) + ".*"))
+    ]
+
+
+def load_forests(
+    epsg: int | None = None,
+    path: str = FORESTS_PATH,
+    store_path: str = STORE_PATH,
+) -> gpd.GeoDataFrame:
+    """
+    Function to load the forests, reprojected if it is needed, indexed by
+    their key.
+
+    The shapefile is parsed only once, then every CRS is stored as
+    GeoParquet and kept in memory, until the shapefile or any of its sidecar
+    files changes.
+
+    Parameters
+    ----------
+    epsg : int | None = None
+        EPSG code of the CRS of interest. By default the CRS of the shapefile.
+
+    path : str = FORESTS_PATH
+        Path of the forests shapefile.
+
+    store_path : str = STORE_PATH
+        Folder to store the GeoParquet variants.
+
+    Returns
+    -------
+    forests : geopandas.GeoDataFrame
+        Forests indexed by key, the key is also kept as a column.
+    """
+    stamp = shapefile_stamp(path)
+    memo = ("forests", epsg)
+
+    if memo in _cache and _cache[memo][0] == stamp:
+        return _cache[memo][1]
+
+    # The stored variants are named after the hash of the stamp, so a
+    # variant is only used with the files that it was made from
+    name = os.path.splitext(os.path.basename(path))[0]
+    prefix = os.path.join(store_path, f"{name}_{epsg or 'source'}")
+    digest = hashlib.sha256(repr(stamp).encode()).hexdigest()[:16]
+    parquet_path = f"{prefix}_{digest}.parquet"
+
+    if os.path.exists(parquet_path):
+        forests = gpd.read_parquet(parquet_path)
+
+    else:
+        if epsg is None:
+            forests = gpd.read_file(path)
+        else:
+            forests = load_forests(None, path, store_path).to_crs(epsg=epsg)
+
+        forests = forests.set_index(forests["key"].rename(None))
+
+        # Written to a temporary file and renamed, the workers of fan_out()
+        # could read or write the same variant at the same time
+        os.makedirs(store_path, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=".parquet", dir=store_path)
+        os.close(fd)
+
+        try:
+            forests.to_parquet(temp_path)
+            os.replace(temp_path, parquet_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        # Remove the variants of the previous files, another worker could
+        # be removing them too
+        for old in glob.glob(glob.escape(prefix) + "_*.parquet") + glob.glob(glob.escape(prefix) + ".parquet"):
+            if old != parquet_path:
+                try:
+                    os.remove(old)
+                except FileNotFoundError:
+                    pass
+
+    _cache[memo] = (stamp, forests)
+
+    return forests
+
+
+def get_geometry(
+    key: str,
+    epsg: int | None = None,
+    operation: str = "geometry",
+    distance: float = 0.0,
+) -> gpd.GeoSeries:
+    """
+    Function to get the geometry of a forest, its boundary or a buffer of
+    it, in any CRS. The results are kept in memory.
+
+    Parameters
+    ----------
+    key : str
+        Key of the forest.
+
+    epsg : int | None = None
+        EPSG code of the CRS of interest. By default the CRS of the shapefile.
+
+    operation : str = "geometry"
+        Geometry of interest: "geometry", "boundary" or "buffer".
+
+    distance : float = 0.0
+        Distance of the buffer in the units of the CRS.
+
+    Returns
+    -------
+    geometry : geopandas.GeoSeries
+        Series with the geometry of the forest, like forests[forests.key == key].geometry.
+    """
+    forests = load_forests(epsg)
+    memo = ("geometry", epsg, operation, distance)
+
+    # Calculate the operation for all forests at once
+    if memo not in _cache or _cache[memo][0] is not forests:
+        match operation:
+            case "geometry":
+                geometries = forests.geometry
+            case "boundary":
+                geometries = forests.boundary
+            case "buffer":
+                geometries = forests.buffer(distance)
+            case _:
+                raise ValueError("operation must be 'geometry', 'boundary' or 'buffer'")
+
+        _cache[memo] = (forests, geometries)
+
+    geometries = _cache[memo][1]
+
+    return geometries.loc[[key]]
+
+
+def get_prepared(
+    key: str,
+    epsg: int | None = None,
+    operation: str = "geometry",
+    distance: float = 0.0,
+) -> shapely.Geometry:
+    """
+    Function to get the geometry of a forest prepared with shapely, to
+    repeat fast predicates (contains, intersects) against it.
+
+    Parameters
+    ----------
+    key : str
+        Key of the forest.
+
+    epsg : int | None = None
+        EPSG code of the CRS of interest. By default the CRS of the shapefile.
+
+    operation : str = "geometry"
+        Geometry of interest: "geometry", "boundary" or "buffer".
+
+    distance : float = 0.0
+        Distance of the buffer in the units of the CRS.
+
+    Returns
+    -------
+    geometry : shapely.Geometry
+        Prepared geometry of the forest.
+    """
+    forests = load_forests(epsg)
+    memo = ("prepared", key, epsg, operation, distance)
+
+    if memo not in _cache or _cache[memo][0] is not forests:
+        prepared = get_geometry(key, epsg, operation, distance).values[0]
+        shapely.prepare(prepared)
+        _cache[memo] = (forests, prepared)
+
+    return _cache[memo][1]
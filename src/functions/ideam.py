@@ -0,0 +1,202 @@
+# %% Dependencies imports
+import os
+import glob
+import json
+import hashlib
+import pandas as pd
+
+# %% Typing imports
+from typing import Sequence
+
+# %% Constants
+# Columns of the IDEAM exports with the measures
+SERIES_COLUMNS = ["CodigoEstacion", "Etiqueta", "Fecha", "Valor"]
+
+# Columns of the IDEAM exports with the station metadata, repeated in every row
+STATION_COLUMNS = [
+    "CodigoEstacion", "NombreEstacion", "Latitud", "Longitud", "Altitud",
+    "Categoria", "Entidad", "AreaOperativa", "Departamento", "Municipio",
+    "FechaInstalacion", "FechaSuspension",
+]
+
+# Explicit types of the columns, the repeated strings are read as categories
+# and the dates are parsed after the reading
+DTYPES = {
+    "CodigoEstacion": "int64",
+    "Etiqueta": "category",
+    "Valor": "float64",
+    "NombreEstacion": "category",
+    "Latitud": "float64",
+    "Longitud": "float64",
+    "Altitud": "float64",
+    "Categoria": "category",
+    "Entidad": "category",
+    "AreaOperativa": "category",
+    "Departamento": "category",
+    "Municipio": "category",
+    "FechaInstalacion": "category",
+    "FechaSuspension": "category",
+}
+
+# Format of the dates of the measures
+DATE_FORMAT = "%Y-%m-%d %H:%M"
+
+
+# %% Functions
+def _split(chunk: pd.DataFrame, stations: Sequence[int] | None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Split a block of rows in the measures and the metadata of its stations.
+    """
+    if stations is not None:
+        chunk = chunk[chunk.CodigoEstacion.isin(stations)]
+
+    series = chunk[SERIES_COLUMNS].copy()
+
+    # The pyarrow engine parses the dates by itself
+    if not pd.api.types.is_datetime64_any_dtype(series["Fecha"]):
+        series["Fecha"] = pd.to_datetime(series["Fecha"], format=DATE_FORMAT)
+
+    series["Fecha"] = series["Fecha"].astype("datetime64[ns]")
+
+    metadata = chunk[STATION_COLUMNS].drop_duplicates("CodigoEstacion")
+
+    return series, metadata
+
+
+def read_ideam(
+    path: str,
+    stations: Sequence[int] | None = None,
+    chunksize: int | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Function to read an IDEAM export, only with the columns of interest and
+    with explicit types.
+
+    The station metadata, repeated in every row of the export, is returned
+    in a separated table with one row by station.
+
+    Parameters
+    ----------
+    path : str
+        Path of the IDEAM CSV export.
+
+    stations : Sequence[int] | None = None
+        Codes of the stations of interest. By default all.
+
+    chunksize : int | None = None
+        Rows read at once. If it is defined the file is streamed in blocks,
+        useful for national multi-station exports, else it is read at once
+        with the pyarrow engine.
+
+    Returns
+    -------
+    series : pd.DataFrame
+        Measures with the columns CodigoEstacion, Etiqueta, Fecha and Valor.
+
+    metadata : pd.DataFrame
+        Metadata with one row by station.
+    """
+    usecols = list(dict.fromkeys(SERIES_COLUMNS + STATION_COLUMNS))
+    dtypes = {c: DTYPES[c] for c in usecols if c in DTYPES}
+
+    if chunksize is None:
+        data = pd.read_csv(path, usecols=usecols, dtype=dtypes, engine="pyarrow")
+        series, metadata = _split(data, stations)
+
+    # Stream the file and keep only the rows of the stations of interest
+    else:
+        blocks = [
+            _split(chunk, stations)
+            for chunk in pd.read_csv(path, usecols=usecols, dtype=dtypes, chunksize=chunksize)
+        ]
+
+        series = pd.concat([b[0] for b in blocks], ignore_index=True)
+        metadata = pd.concat([b[1] for b in blocks]).drop_duplicates("CodigoEstacion")
+
+    series = series.reset_index(drop=True)
+    metadata = metadata.reset_index(drop=True)
+
+    return series, metadata
+
+
+def load_ideam(
+    path: str,
+    stations: Sequence[int] | None = None,
+    chunksize: int | None = None,
+    cache_path: str = "data/processed/cache",
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Function to read an IDEAM export with read_ideam() and cache the result
+    as Parquet, the cache is used while the export and the options don't
+    change.
+
+    Parameters
+    ----------
+    path : str
+        Path of the IDEAM CSV export.
+
+    stations : Sequence[int] | None = None
+        Codes of the stations of interest. By default all.
+
+    chunksize : int | None = None
+        Rows read at once, if it is not defined the file is read at once.
+
+    cache_path : str = "data/processed/cache"
+        Folder to save the parsed data.
+
+    Returns
+    -------
+    series : pd.DataFrame
+        Measures with the columns CodigoEstacion, Etiqueta, Fecha and Valor.
+
+    metadata : pd.DataFrame
+        Metadata with one row by station.
+    """
+    # The key changes if the file or the stations of interest change
+    stat = os.stat(path)
+    key = [os.path.abspath(path), stat.st_size, stat.st_mtime_ns, sorted(stations or [])]
+    key = hashlib.sha1(json.dumps(key).encode()).hexdigest()[:16]
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    series_path = os.path.join(cache_path, f"{name}_{key}_series.parquet")
+    metadata_path = os.path.join(cache_path, f"{name}_{key}_stations.parquet")
+
+    if os.path.exists(series_path) and os.path.exists(metadata_path):
+        return pd.read_parquet(series_path), pd.read_parquet(metadata_path)
+
+    series, metadata = read_ideam(path, stations, chunksize)
+
+    # Remove the caches of previous versions of the file and save the new one
+    os.makedirs(cache_path, exist_ok=True)
+    for old in glob.glob(os.path.join(cache_path, f"{name}_*.parquet")):
+        os.remove(old)
+
+    series.to_parquet(series_path, index=False)
+    metadata.to_parquet(metadata_path, index=False)
+
+    return series, metadata
+
+
+def monthly_mean(series: pd.DataFrame, station: int | None = None) -> pd.Series:
+    """
+    Function to resample the measures of a station to monthly mean values.
+
+    Parameters
+    ----------
+    series : pd.DataFrame
+        Measures from read_ideam() or load_ideam().
+
+    station : int | None = None
+        Code of the station, if it is not defined all the measures are used.
+
+    Returns
+    -------
+    monthly : pd.Series
+        Monthly mean values indexed by the last day of the month.
+    """
+    if station is not None:
+        series = series[series.CodigoEstacion == station]
+
+    monthly = series.set_index("Fecha")["Valor"].resample("ME").mean()
+
+    return monthly
@@ -0,0 +1,344 @@
+# %% Dependencies imports
+import json
+import numpy as np
+import pandas as pd
+
+# %% Typing imports
+import numpy.typing as npt
+from typing import Sequence
+
+
+# %% Functions
+def _lags(variables: Sequence[str], lags: dict[str, int] | None) -> dict[str, int]:
+    """
+    Lag of every variable, 0 for the variables without lag.
+    """
+    return {v: int((lags or {}).get(v, 0)) for v in variables}
+
+
+def new_state(variables: Sequence[str], lags: dict[str, int] | None = None) -> dict:
+    """
+    Function to create the sufficient statistics of a monthly table, to
+    update its climatology, correlations and regressions a month at a time.
+
+    The statistics are kept by calendar month: the number of values, their
+    sums and sums of squares by variable, and the number of complete
+    months (with the variables moved by their lags), their sums and cross
+    products. The anomalies of every month
+    (its value minus the mean of its calendar month) don't need to be saved,
+    their covariance is the sum of the covariances inside every calendar
+    month.
+
+    Parameters
+    ----------
+    variables : Sequence[str]
+        Variables of the table.
+
+    lags : dict[str, int] | None = None
+        Months that a variable is moved forward before the statistics (like
+        the shifts of 7_prepare_lm_data.py), by default 0.
+
+    Returns
+    -------
+    state : dict
+        State for update() with the statistics in zero.
+    """
+    k = len(variables)
+    lags = _lags(variables, lags)
+
+    return {
+        "variables": list(variables),
+        "lags": lags,
+        "last": None,
+        # Last values of the variables, to move them forward
+        "buffer": [[np.nan] * k for _ in range(max(lags.values()))],
+        # Statistics of every variable by calendar month
+        "count": np.zeros((12, k)),
+        "sum": np.zeros((12, k)),
+        "squares": np.zeros((12, k)),
+        # Statistics of the months with all variables by calendar month
+        "complete": np.zeros(12),
+        "complete_sum": np.zeros((12, k)),
+        "products": np.zeros((12, k, k)),
+    }
+
+
+def update(state: dict, time: str | pd.Timestamp, values: dict[str, float]) -> dict:
+    """
+    Function to add a month to the statistics, the cost doesn't depend on
+    the number of months already added.
+
+    Parameters
+    ----------
+    state : dict
+        State from new_state() or load_state(), it is modified.
+
+    time : str | pd.Timestamp
+        Month of the values, after the last month added. The months without
+        data between both are added as missing.
+
+    values : dict[str, float]
+        Value of every variable, NaN or missing keys if there is no data.
+
+    Returns
+    -------
+    state : dict
+        The same state updated.
+    """
+    month = pd.Period(time, freq="M")
+    variables = state["variables"]
+
+    if state["last"] is not None:
+        last = pd.Period(state["last"], freq="M")
+
+        if month <= last:
+            raise ValueError(f"{month} was already added, the last month is {last}")
+
+        # Months without data keep the lags aligned
+        for _ in range((month - last).n - 1):
+            _push(state, [np.nan] * len(variables))
+
+    raw = np.array([float(values.get(v, np.nan)) for v in variables])
+    row = np.array(_push(state, raw.tolist()))
+    state["last"] = str(month)
+
+    m = month.month - 1
+
+    # The climatology uses the values of the month, the cross products the
+    # values moved by their lags
+    valid = np.isfinite(raw)
+
+    state["count"][m] += valid
+    state["sum"][m] += np.where(valid, raw, 0.0)
+    state["squares"][m] += np.where(valid, raw ** 2, 0.0)
+
+    if np.isfinite(row).all():
+        state["complete"][m] += 1
+        state["complete_sum"][m] += row
+        state["products"][m] += np.outer(row, row)
+
+    return state
+
+
+def _push(state: dict, raw: list[float]) -> list[float]:
+    """
+    Save the values of a month in the buffer and return the row with every
+    variable moved forward its lag.
+    """
+    buffer = state["buffer"] + [raw]
+    row = [buffer[-1 - state["lags"][v]][i] for i, v in enumerate(state["variables"])]
+
+    # Only the months needed by the largest lag are kept
+    state["buffer"] = buffer[1:]
+
+    return row
+
+
+def climatology(state: dict) -> pd.DataFrame:
+    """
+    Function to get the mean and standard deviation of every variable by
+    calendar month.
+
+    Parameters
+    ----------
+    state : dict
+        State from update().
+
+    Returns
+    -------
+    climatology : pd.DataFrame
+        Columns (statistic, variable) indexed by month (1 to 12).
+    """
+    count, total, squares = state["count"], state["sum"], state["squares"]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        std = np.sqrt((squares - total * mean) / (count - 1))
+
+    index = pd.Index(np.arange(1, 13), name="Month")
+
+    return pd.concat({
+        "mean": pd.DataFrame(mean, index=index, columns=state["variables"]),
+        "std": pd.DataFrame(np.where(count > 1, std, np.nan), index=index, columns=state["variables"]),
+    }, axis=1)
+
+
+def anomalies(state: dict, time: str | pd.Timestamp, values: dict[str, float]) -> pd.Series:
+    """
+    Function to get the standardized anomalies of a month with the current
+    climatology (the values are not moved by their lags).
+
+    Parameters
+    ----------
+    state : dict
+        State from update().
+
+    time : str | pd.Timestamp
+        Month of the values.
+
+    values : dict[str, float]
+        Value of every variable.
+
+    Returns
+    -------
+    anomalies : pd.Series
+        Anomaly of every variable in standard deviations of its calendar month.
+    """
+    stats = climatology(state).loc[pd.Period(time, freq="M").month]
+    raw = pd.Series({v: float(values.get(v, np.nan)) for v in state["variables"]})
+
+    return (raw - stats["mean"]) / stats["std"]
+
+
+def _scatter(state: dict) -> tuple[npt.NDArray, int, int]:
+    """
+    Cross products of the anomalies of the complete months, with the
+    number of months and of calendar months with data.
+    """
+    scatter = np.zeros_like(state["products"][0])
+    groups = 0
+
+    for n, total, products in zip(state["complete"], state["complete_sum"], state["products"]):
+        if n > 0:
+            scatter += products - np.outer(total, total) / n
+            groups += 1
+
+    return scatter, int(state["complete"].sum()), groups
+
+
+def correlation_matrix(state: dict) -> pd.DataFrame:
+    """
+    Function to get the correlation matrix of the anomalies of the complete
+    months (every month minus the mean of its calendar month).
+
+    Parameters
+    ----------
+    state : dict
+        State from update().
+
+    Returns
+    -------
+    corr : pd.DataFrame
+        Correlation matrix of the variables.
+    """
+    scatter, _, _ = _scatter(state)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scale = np.sqrt(np.diag(scatter))
+        corr = scatter / np.outer(scale, scale)
+
+    return pd.DataFrame(corr, index=state["variables"], columns=state["variables"])
+
+
+def regression(state: dict, response: str = "NDVI") -> pd.DataFrame:
+    """
+    Function to fit the least squares regression of the anomalies of a
+    variable over the anomalies of the others, from the normal equations of
+    the complete months.
+
+    Parameters
+    ----------
+    state : dict
+        State from update().
+
+    response : str = "NDVI"
+        Dependant variable.
+
+    Returns
+    -------
+    model : pd.DataFrame
+        Coefficient, standard error, t and p-value of every independant
+        variable, the number of months and the R² are in model.attrs.
+    """
+    from scipy import stats
+
+    scatter, n, groups = _scatter(state)
+    variables = state["variables"]
+
+    y = variables.index(response)
+    x = [i for i in range(len(variables)) if i != y]
+
+    sxx = scatter[np.ix_(x, x)]
+    sxy = scatter[x, y]
+    syy = scatter[y, y]
+
+    coef = np.linalg.solve(sxx, sxy)
+
+    # A mean by calendar month is estimated with the anomalies
+    dof = n - len(x) - groups
+    sse = syy - coef @ sxy
+    se = np.sqrt(sse / dof * np.diag(np.linalg.inv(sxx)))
+    t = coef / se
+
+    model = pd.DataFrame(
+        {"coef": coef, "std err": se, "t": t, "pvalue": 2 * stats.t.sf(np.abs(t), dof)},
+        index=[variables[i] for i in x],
+    )
+    model.attrs = {"months": n, "r2": 1 - sse / syy}
+
+    return model
+
+
+def same_options(state: dict, variables: Sequence[str], lags: dict[str, int] | None = None) -> bool:
+    """
+    Function to know if a state was created with some variables and lags,
+    the statistics of a state can only be updated with the same ones.
+
+    Parameters
+    ----------
+    state : dict
+        State from new_state() or load_state().
+
+    variables : Sequence[str]
+        Variables of the table, in order.
+
+    lags : dict[str, int] | None = None
+        Lags of the variables, by default 0.
+
+    Returns
+    -------
+    same : bool
+        True if the state has the same variables (in the same order) and lags.
+    """
+    return state["variables"] == list(variables) and state["lags"] == _lags(variables, lags)
+
+
+def save_state(state: dict, path: str) -> None:
+    """
+    Function to save a state as JSON.
+
+    Parameters
+    ----------
+    state : dict
+        State from update().
+
+    path : str
+        Path of the JSON file.
+    """
+    state = {key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in state.items()}
+
+    with open(path, "w") as f:
+        json.dump(state, f)
+
+
+def load_state(path: str) -> dict:
+    """
+    Function to read a state saved by save_state().
+
+    Parameters
+    ----------
+    path : str
+        Path of the JSON file.
+
+    Returns
+    -------
+    state : dict
+        State to continue the updates.
+    """
+    with open(path) as f:
+        state = json.load(f)
+
+    for key in ("count", "sum", "squares", "complete", "complete_sum", "products"):
+        state[key] = np.array(state[key], dtype="float64")
+
+    return state
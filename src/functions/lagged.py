@@ -0,0 +1,364 @@
+# %% Dependencies imports
+import numpy as np
+from scipy import stats
+
+from functions.stat_utils import batched_inverse
+
+# %% Typing imports
+import numpy.typing as npt
+from typing import Sequence
+
+# %% Constants
+# Maps of correlation_maps() by driver and of regression_maps() by driver
+CORRELATION_MAPS = ["correlation", "lag", "coefficient", "pvalue"]
+REGRESSION_MAPS = ["coefficient", "pvalue"]
+
+
+# %% Functions
+def monthly_grid(values: npt.NDArray, times: npt.ArrayLike) -> tuple[npt.NDArray, npt.NDArray]:
+    """
+    Function to place a series on every month between its first and last
+    date, so that the lags in steps of time are lags in months.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Series with the time in the first axis and NaN where there is no data.
+
+    times : ArrayLike
+        Dates of the series, in any order.
+
+    Returns
+    -------
+    months : numpy.ndarray
+        Consecutive months as datetime64[M].
+
+    grid : numpy.ndarray
+        Series by month, the mean of the dates of the same month and NaN in
+        the months without dates.
+    """
+    times = np.asarray(times, dtype="datetime64[M]")
+    months = np.arange(times.min(), times.max() + 1)
+    rows = (times - months[0]).astype(int)
+
+    values = np.asarray(values)
+    dtype = np.result_type(values.dtype, np.float32)
+    grid = np.full((len(months), *values.shape[1:]), np.nan, dtype=dtype)
+
+    if len(np.unique(rows)) == len(rows):
+        grid[rows] = values
+        return months, grid
+
+    # Several dates in a month, the mean of their valid values
+    valid = np.isfinite(values)
+    total = np.zeros(grid.shape)
+    count = np.zeros(grid.shape)
+    np.add.at(total, rows, np.where(valid, values, 0.0))
+    np.add.at(count, rows, valid)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        grid = (total / count).astype(dtype)
+
+    return months, grid
+
+
+def lag_matrix(drivers: npt.NDArray, lags: Sequence[int]) -> npt.NDArray:
+    """
+    Function to stack the lagged copies of the drivers as columns, the lag
+    is the number of steps that the driver leads the response.
+
+    Parameters
+    ----------
+    drivers : numpy.ndarray
+        Drivers with shape (time, drivers).
+
+    lags : Sequence[int]
+        Lags in steps of time, the negative lags make the response lead.
+
+    Returns
+    -------
+    matrix : numpy.ndarray
+        Matrix with shape (time, lags * drivers) ordered by lag and then by
+        driver, NaN where the lag moves the driver outside the series.
+    """
+    n_times, n_drivers = drivers.shape
+    matrix = np.full((n_times, len(lags), n_drivers), np.nan)
+
+    for i, lag in enumerate(lags):
+        if lag >= 0:
+            matrix[lag:, i] = drivers[:n_times - lag]
+        else:
+            matrix[:lag, i] = drivers[-lag:]
+
+    return matrix.reshape(n_times, -1)
+
+
+def _standardize(y: npt.NDArray) -> tuple[npt.NDArray, npt.NDArray]:
+    """
+    Standardize the series in the columns (time in the first axis) with
+    their valid values, return the scales. The constant series are only
+    centred.
+    """
+    y = np.asarray(y, dtype="float64")
+    y = y.reshape(len(y), -1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        valid = np.isfinite(y)
+        n = valid.sum(axis=0)
+        mean = np.where(valid, y, 0.0).sum(axis=0) / n
+        scale = np.sqrt(np.where(valid, (y - mean) ** 2, 0.0).sum(axis=0) / n)
+        scale[scale == 0] = 1.0
+
+        return (y - mean) / scale, scale
+
+
+def lagged_correlation(
+    y: npt.NDArray, drivers: npt.NDArray, lags: Sequence[int],
+) -> tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+    """
+    Function to correlate the series of every pixel with the lagged drivers
+    using matrix products, with the dates where both series have data.
+
+    The series and the drivers are standardized, then the sums of the
+    correlation of every pair are the products of the (pixels, time) cube
+    by the (time, lags * drivers) matrix of the drivers.
+
+    Parameters
+    ----------
+    y : numpy.ndarray
+        Series with shape (time, pixels), NaN where there is no data.
+
+    drivers : numpy.ndarray
+        Drivers with shape (time, drivers), NaN where there is no data.
+
+    lags : Sequence[int]
+        Lags in steps of time that the drivers lead the series.
+
+    Returns
+    -------
+    r : numpy.ndarray
+        Pearson correlation with shape (pixels, lags, drivers).
+
+    slope : numpy.ndarray
+        Slope of the series over the driver in their units, same shape.
+
+    n : numpy.ndarray
+        Number of dates of every correlation, same shape.
+    """
+    zy, scale_y = _standardize(y)
+    zx, scale_x = _standardize(lag_matrix(drivers, lags))
+
+    valid_y = np.isfinite(zy).astype("float64")
+    valid_x = np.isfinite(zx).astype("float64")
+    y0 = np.nan_to_num(zy)
+    x0 = np.nan_to_num(zx)
+
+    # Sums of every pixel and column over the dates where both have data
+    n = valid_y.T @ valid_x
+    sx = valid_y.T @ x0
+    sxx = valid_y.T @ x0 ** 2
+    sy = y0.T @ valid_x
+    syy = (y0 ** 2).T @ valid_x
+    sxy = y0.T @ x0
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sxy - sx * sy / n
+        var_x = sxx - sx ** 2 / n
+        var_y = syy - sy ** 2 / n
+
+        r = cov / np.sqrt(var_x * var_y)
+
+        # The slope of the standardized series back to the original units
+        slope = cov / var_x * scale_y[:, None] / scale_x[None, :]
+
+    # Without three dates or with a constant series there is no correlation
+    r[n < 3] = np.nan
+    slope[np.isnan(r)] = np.nan
+
+    shape = (y.shape[1], len(lags), drivers.shape[1])
+
+    return r.reshape(shape), slope.reshape(shape), n.reshape(shape)
+
+
+def correlation_pvalue(r: npt.NDArray, n: npt.NDArray) -> npt.NDArray:
+    """
+    Function to get the two-sided p-value of Pearson correlations with the
+    t-test of n - 2 degrees of freedom.
+
+    Parameters
+    ----------
+    r : numpy.ndarray
+        Correlations.
+
+    n : numpy.ndarray
+        Number of dates of every correlation.
+
+    Returns
+    -------
+    pvalue : numpy.ndarray
+        P-values, NaN where there are less than three dates.
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = r * np.sqrt((n - 2) / (1 - r ** 2))
+        pvalue = 2 * stats.t.sf(np.abs(t), n - 2)
+
+    return np.where(n >= 3, pvalue, np.nan)
+
+
+def _chunks(n_series: int, bytes_per_series: int, max_bytes: int) -> list[slice]:
+    """
+    Slices of series whose arrays use at most max_bytes.
+    """
+    size = max(1, int(max_bytes // bytes_per_series))
+    return [slice(i, min(i + size, n_series)) for i in range(0, n_series, size)]
+
+
+def correlation_maps(
+    cube: npt.NDArray,
+    drivers: dict[str, npt.NDArray],
+    lags: Sequence[int] = range(13),
+    max_bytes: int = 2**28,
+) -> dict[str, npt.NDArray]:
+    """
+    Function to find, for every pixel and driver, the lag with the largest
+    absolute correlation, with the correlation, the slope and the p-value in
+    that lag.
+
+    The p-value is the one of the selected lag, it doesn't correct for the
+    search over the lags.
+
+    Parameters
+    ----------
+    cube : numpy.ndarray
+        Cube with shape (time, y, x) and NaN where there is no data.
+
+    drivers : dict[str, numpy.ndarray]
+        Series of the drivers by name, aligned with the time of the cube.
+        The steps of time must be regular, without missing dates (see
+        monthly_grid()).
+
+    lags : Sequence[int] = range(13)
+        Lags in steps of time that the drivers lead the cube.
+
+    max_bytes : int = 256 MiB
+        Memory for the arrays of every chunk of pixels.
+
+    Returns
+    -------
+    maps : dict[str, numpy.ndarray]
+        Maps with shape (y, x) named "{driver} {map}" (see CORRELATION_MAPS),
+        the lags in steps of time and the coefficients in units of the cube
+        by unit of the driver.
+    """
+    n_times, ny, nx = cube.shape
+    y = cube.reshape(n_times, ny * nx)
+    x = np.column_stack(list(drivers.values())).astype("float64")
+    lags = np.asarray(lags)
+
+    maps = {f"{name} {m}": np.full(ny * nx, np.nan) for name in drivers for m in CORRELATION_MAPS}
+    for block in _chunks(ny * nx, 8 * (4 * n_times + 8 * len(lags) * x.shape[1]), max_bytes):
+        r, slope, n = lagged_correlation(y[:, block].astype("float64"), x, lags)
+
+        # Lag with the largest absolute correlation, the pixels without
+        # correlations keep NaN
+        best = np.argmax(np.nan_to_num(np.abs(r), nan=-1.0), axis=1)[:, None, :]
+        r, slope, n = (np.take_along_axis(a, best, axis=1)[:, 0] for a in (r, slope, n))
+        found = np.isfinite(r)
+
+        pvalue = correlation_pvalue(r, n)
+
+        for i, name in enumerate(drivers):
+            maps[f"{name} correlation"][block] = r[:, i]
+            maps[f"{name} lag"][block] = np.where(found[:, i], lags[best[:, 0, i]], np.nan)
+            maps[f"{name} coefficient"][block] = slope[:, i]
+            maps[f"{name} pvalue"][block] = pvalue[:, i]
+
+    return {name: values.reshape(ny, nx) for name, values in maps.items()}
+
+
+def regression_maps(
+    cube: npt.NDArray,
+    drivers: dict[str, npt.NDArray],
+    lags: dict[str, int] | None = None,
+    max_bytes: int = 2**28,
+) -> dict[str, npt.NDArray]:
+    """
+    Function to fit a multiple linear regression of the series of every
+    pixel over the lagged drivers, solving the normal equations of all the
+    pixels at once with the dates where the pixel and all drivers have data.
+
+    Parameters
+    ----------
+    cube : numpy.ndarray
+        Cube with shape (time, y, x) and NaN where there is no data.
+
+    drivers : dict[str, numpy.ndarray]
+        Series of the drivers by name, aligned with the time of the cube.
+        The steps of time must be regular, without missing dates (see
+        monthly_grid()).
+
+    lags : dict[str, int] | None = None
+        Lag in steps of time of every driver, by default 0.
+
+    max_bytes : int = 256 MiB
+        Memory for the arrays of every chunk of pixels.
+
+    Returns
+    -------
+    maps : dict[str, numpy.ndarray]
+        Maps with shape (y, x) named "{driver} {map}" (see REGRESSION_MAPS),
+        with the coefficients in units of the cube by unit of the driver and
+        their t-test p-values, and the "r2" map.
+    """
+    lags = lags or {}
+    n_times, ny, nx = cube.shape
+    y = cube.reshape(n_times, ny * nx)
+
+    # Lagged drivers centred, so the normal equations are well conditioned
+    x = np.column_stack([lag_matrix(drivers[name][:, None], [lags.get(name, 0)]) for name in drivers])
+    x = x - np.nanmean(x, axis=0)
+    x = np.column_stack([np.ones(n_times), x])
+    k = x.shape[1]
+
+    dates = np.isfinite(x).all(axis=1)
+    x0 = np.where(dates[:, None], x, 0.0)
+    outer = (x0[:, :, None] * x0[:, None, :]).reshape(n_times, k * k)
+
+    maps = {f"{name} {m}": np.full(ny * nx, np.nan) for name in drivers for m in REGRESSION_MAPS}
+    maps["r2"] = np.full(ny * nx, np.nan)
+    for block in _chunks(ny * nx, 8 * (4 * n_times + 8 * k * k), max_bytes):
+        yb = y[:, block].astype("float64")
+
+        valid = (np.isfinite(yb) & dates[:, None]).astype("float64")
+        y0 = np.where(valid > 0, yb, 0.0)
+        n = valid.sum(axis=0)
+
+        # Normal equations of every pixel: (X' W X) b = X' W y
+        gram = (valid.T @ outer).reshape(-1, k, k)
+        xy = y0.T @ x0
+
+        # The pixels without enough dates are masked after
+        enough = n > k
+        inverse = batched_inverse(gram, enough)
+
+        beta = np.einsum("pij,pj->pi", inverse, xy)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # Residual and total sums of squares from the sums
+            syy = (y0 ** 2).sum(axis=0)
+            sse = np.maximum(syy - (beta * xy).sum(axis=1), 0.0)
+            sst = syy - y0.sum(axis=0) ** 2 / n
+
+            sigma2 = sse / (n - k)
+            se = np.sqrt(sigma2[:, None] * np.diagonal(inverse, axis1=1, axis2=2))
+            pvalue = 2 * stats.t.sf(np.abs(beta / se), (n - k)[:, None])
+
+            r2 = 1 - sse / sst
+
+        for i, name in enumerate(drivers):
+            maps[f"{name} coefficient"][block] = np.where(enough, beta[:, i + 1], np.nan)
+            maps[f"{name} pvalue"][block] = np.where(enough, pvalue[:, i + 1], np.nan)
+
+        maps["r2"][block] = np.where(enough, r2, np.nan)
+
+    return {name: values.reshape(ny, nx) for name, values in maps.items()}
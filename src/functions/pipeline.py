@@ -0,0 +1,371 @@
+# %% Dependencies imports
+import os
+import sys
+import ast
+import glob
+import json
+import time
+import fnmatch
+import hashlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from functions.telemetry import span
+
+# %% Typing imports
+from typing import Sequence
+
+# %% Functions
+def expand(patterns: Sequence[str]) -> list[str]:
+    """
+    Function to get the sorted files that match a list of glob patterns.
+
+    Parameters
+    ----------
+    patterns : Sequence[str]
+        Glob patterns of the files.
+
+    Returns
+    -------
+    files : list[str]
+        Files that match any pattern, without repetitions.
+    """
+    files = set()
+
+    for pattern in patterns:
+        files.update(f for f in glob.glob(pattern, recursive=True) if os.path.isfile(f))
+
+    return sorted(files)
+
+
+def content_hash(files: Sequence[str], chunk_size: int = 1 << 20) -> str:
+    """
+    Function to calculate one hash of the names and the content of a group of
+    files.
+
+    Parameters
+    ----------
+    files : Sequence[str]
+        Paths of the files.
+
+    chunk_size : int = 1 MiB
+        Bytes read at once from every file.
+
+    Returns
+    -------
+    digest : str
+        SHA-256 of the files.
+    """
+    h = hashlib.sha256()
+
+    for path in files:
+        h.update(path.replace(os.sep, "/").encode())
+
+        with open(path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                h.update(chunk)
+
+    return h.hexdigest()
+
+
+def stage_dependencies(stages: Sequence[dict]) -> dict[str, set[str]]:
+    """
+    Function to find the stages that every stage needs, a stage depends on
+    another one if one of its inputs is an output of the other.
+
+    Parameters
+    ----------
+    stages : Sequence[dict]
+        Stages with the keys "name", "script", "inputs" and "outputs".
+
+    Returns
+    -------
+    deps : dict[str, set[str]]
+        Names of the stages needed by every stage.
+    """
+    deps = {stage["name"]: set() for stage in stages}
+
+    for stage in stages:
+        for other in stages:
+            if other is stage:
+                continue
+
+            # Compare the patterns in both directions, so a file and a glob
+            # that contains it are related
+            if any(
+                fnmatch.fnmatch(i, o) or fnmatch.fnmatch(o, i)
+                for i in stage["inputs"] for o in other["outputs"]
+            ):
+                deps[stage["name"]].add(other["name"])
+
+    return deps
+
+
+def check_cycles(deps: dict[str, set[str]]) -> None:
+    """
+    Function to check that the stages can run in some order, removing the
+    stages whose dependencies are all removed until none is left.
+
+    Parameters
+    ----------
+    deps : dict[str, set[str]]
+        Names of the stages needed by every stage, from stage_dependencies().
+
+    Raises
+    ------
+    ValueError
+        If some stages depend on each other, with the stages of the cycles
+        and the stages after them.
+    """
+    pending = dict(deps)
+
+    while pending:
+        ready = [name for name, needed in pending.items() if not needed & pending.keys()]
+
+        if not ready:
+            raise ValueError(f"the stages have a dependency cycle: {', '.join(sorted(pending))}")
+
+        for name in ready:
+            del pending[name]
+
+
+def _upstream(targets: Sequence[str], deps: dict[str, set[str]]) -> set[str]:
+    """
+    Get the targets and all the stages that they need.
+    """
+    unknown = [name for name in targets if name not in deps]
+    if unknown:
+        raise ValueError(
+            f"unknown stages: {', '.join(unknown)}. The stages are: {', '.join(sorted(deps))}"
+        )
+
+    selected = set()
+    pending = list(targets)
+
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(deps[name])
+
+    return selected
+
+
+def local_imports(path: str, package: str = "functions") -> list[str]:
+    """
+    Function to find the modules of a local package that a script imports,
+    directly or through other modules of the package.
+
+    Parameters
+    ----------
+    path : str
+        Path of the script.
+
+    package : str = "functions"
+        Name of the local package, next to the script or its parent folder.
+
+    Returns
+    -------
+    modules : list[str]
+        Sorted paths of the modules of the package.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    if os.path.basename(folder) == package:
+        folder = os.path.dirname(folder)
+
+    found = set()
+    pending = [os.path.abspath(path)]
+
+    while pending:
+        with open(pending.pop(), encoding="utf-8") as f:
+            tree = ast.parse(f.read())
+
+        # Modules in "import functions.x", "from functions.x import y" and
+        # "from functions import x"
+        names = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names += [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                names.append(node.module)
+                names += [f"{node.module}.{alias.name}" for alias in node.names]
+
+        for name in names:
+            parts = name.split(".")
+            if parts[0] != package or len(parts) < 2:
+                continue
+
+            module = os.path.join(folder, package, parts[1] + ".py")
+            if os.path.isfile(module) and module not in found:
+                found.add(module)
+                pending.append(module)
+
+    return sorted(os.path.relpath(m) for m in found)
+
+
+def _stage_hash(stage: dict) -> str:
+    """
+    Hash of the script, the helper modules that it imports and the inputs
+    of a stage.
+    """
+    return content_hash([stage["script"]] + local_imports(stage["script"]) + expand(stage["inputs"]))
+
+
+def _run_stage(stage: dict) -> tuple[int, float, str]:
+    """
+    Run the script of a stage in a new Python process.
+    """
+    t0 = time.perf_counter()
+
+    # The stages inherit the trace options from the environment
+    with span(stage["name"], "stage"):
+        result = subprocess.run(
+            [sys.executable, stage["script"]], capture_output=True, text=True
+        )
+
+    seconds = time.perf_counter() - t0
+
+    return result.returncode, seconds, result.stdout + result.stderr
+
+
+def run_pipeline(
+    stages: Sequence[dict],
+    targets: Sequence[str] | None = None,
+    state_path: str = "data/pipeline_state.json",
+    force: bool = False,
+    jobs: int | None = None,
+) -> tuple[dict, list[str]]:
+    """
+    Function to run the stages of the pipeline in dependency order, the
+    independent stages run at the same time.
+
+    A stage is skipped if its script, the modules of functions that it
+    imports and its inputs have the same content hash of its last
+    successful run and all its outputs exist. The stages
+    without inputs are only run if any of their outputs is missing.
+
+    Parameters
+    ----------
+    stages : Sequence[dict]
+        Stages with the keys "name", "script", "inputs" and "outputs", where
+        inputs and outputs are glob patterns.
+
+    targets : Sequence[str] | None = None
+        Stages to run, with all the stages that they need. By default all.
+
+    state_path : str = "data/pipeline_state.json"
+        JSON file to save the hashes and the timings of every stage.
+
+    force : bool = False
+        If True, run the stages even if their inputs didn't change.
+
+    jobs : int | None = None
+        Maximum number of stages running at the same time.
+
+    Returns
+    -------
+    state : dict
+        Hash, status, seconds and end time of the last run of every stage.
+
+    failed : list[str]
+        Stages of this run that failed or were blocked by a failed stage.
+
+    Raises
+    ------
+    ValueError
+        If a target is not a stage or the stages have a dependency cycle.
+    """
+    by_name = {stage["name"]: stage for stage in stages}
+    deps = stage_dependencies(stages)
+    check_cycles(deps)
+
+    if targets is None:
+        selected = set(by_name)
+    else:
+        selected = _upstream(targets, deps)
+
+    # Load the state of the previous runs
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path, "r") as f:
+            state = json.load(f)
+
+    done = set()                            # Stages finished or skipped
+    failed = set()                          # Stages failed or blocked
+    running = {}                            # Futures of the running stages
+    digests = {}                            # Hashes of the stages submitted
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while len(done) + len(failed) < len(selected):
+            # Submit all the stages whose dependencies are finished
+            progress = False
+
+            for name in sorted(selected - done - failed - set(running.values())):
+                needed = deps[name] & selected
+
+                if needed & failed:
+                    progress = True
+                    failed.add(name)
+                    print(f"{name}: blocked by a failed stage")
+                    continue
+
+                if not needed <= done:
+                    continue
+
+                stage = by_name[name]
+                digest = _stage_hash(stage)
+                previous = state.get(name, {})
+
+                # Skip the stages whose inputs didn't change, the stages
+                # without inputs (downloads) only run if their outputs are missing
+                outputs = all(glob.glob(o) for o in stage["outputs"])
+                unchanged = not stage["inputs"] or (
+                    previous.get("status") == "ok" and previous.get("hash") == digest
+                )
+
+                progress = True
+
+                if not force and outputs and unchanged:
+                    done.add(name)
+                    print(f"{name}: unchanged, skipped")
+                    continue
+
+                print(f"{name}: running")
+                digests[name] = digest
+                running[pool.submit(_run_stage, stage)] = name
+
+            # The skipped stages can let others start, without any progress
+            # the remaining stages would wait forever
+            if not running:
+                if not progress:
+                    waiting = sorted(selected - done - failed)
+                    raise RuntimeError(f"no stage can run: {', '.join(waiting)}")
+
+                continue
+
+            # Wait until any stage finishes
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in finished:
+                name = running.pop(future)
+                returncode, seconds, output = future.result()
+
+                state[name] = {
+                    "hash": digests[name],
+                    "status": "ok" if returncode == 0 else "failed",
+                    "seconds": round(seconds, 3),
+                    "finished": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                }
+
+                if returncode == 0:
+                    done.add(name)
+                    print(f"{name}: finished in {seconds:0.1f} s")
+                else:
+                    failed.add(name)
+                    print(f"{name}: failed in {seconds:0.1f} s", output, sep="\n")
+
+            # Save the state after every stage, so a failure keeps the rest
+            with open(state_path, "w") as f:
+                json.dump(state, f, indent=1)
+
+    return state, sorted(failed)
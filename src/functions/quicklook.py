@@ -0,0 +1,219 @@
+# %% Dependencies imports
+import os
+import json
+import hashlib
+import numpy as np
+import rasterio
+from rasterio.windows import from_bounds
+from concurrent.futures import ProcessPoolExecutor
+
+# Plot without pyplot, so the workers don't start an interactive backend
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# %% Typing imports
+import numpy.typing as npt
+from typing import Sequence
+
+# %% Constants
+# Band of every color in the images exported by 2_download_rasters.py
+BAND_INDEX = {"BLUE": 1, "GREEN": 2, "RED": 3, "NIR": 4, "TEMPERATURE": 5, "NDVI": 6}
+
+# Value used by 2_download_rasters.py to unmask the images
+NODATA = -3e5
+
+# Figure reused by every render in a worker process
+_figure = None
+
+
+# %% Functions
+def stretch(rgb: npt.NDArray, vis: dict) -> npt.NDArray:
+    """
+    Function to apply a linear stretch and a gamma correction to a RGB array,
+    with the same meaning of the Earth Engine visualization parameters.
+
+    Parameters
+    ----------
+    rgb : numpy.ndarray
+        Array with shape (3, rows, cols) and NaN where there is no data.
+
+    vis : dict
+        Visualization parameters with the keys "min", "max" and "gamma".
+
+    Returns
+    -------
+    rgba : numpy.ndarray
+        Array with shape (rows, cols, 4) and values between 0 and 1, the
+        pixels without data are transparent.
+    """
+    # Linear stretch between min and max
+    scaled = (rgb - vis["min"]) / (vis["max"] - vis["min"])
+    scaled = np.clip(scaled, 0.0, 1.0)
+
+    # Earth Engine gamma correction
+    scaled = scaled ** (1.0 / vis.get("gamma", 1.0))
+
+    # The alpha channel hides the pixels without data in any band
+    alpha = np.isfinite(rgb).all(axis=0).astype("float64")
+    rgba = np.dstack([np.nan_to_num(band) for band in scaled] + [alpha])
+
+    return rgba
+
+
+def read_rgb(
+    path: str, bands: Sequence[str], extent: Sequence[float] | None = None
+) -> tuple[npt.NDArray, list[float]]:
+    """
+    Function to read the RGB bands of an image, only inside an extent.
+
+    Parameters
+    ----------
+    path : str
+        Path of the image.
+
+    bands : Sequence[str]
+        Names of the red, green and blue bands.
+
+    extent : Sequence[float] | None = None
+        Limits to read [x0, y0, x1, y1], in any order. If it is not defined
+        the full image is read.
+
+    Returns
+    -------
+    rgb : numpy.ndarray
+        Array with shape (3, rows, cols) and NaN where there is no data.
+
+    limits : list[float]
+        Limits of the array read [left, right, bottom, top] for imshow.
+    """
+    with rasterio.open(path, "r") as src:
+        if extent is None:
+            window = None
+        else:
+            # The zooms don't have sorted coordinates
+            xs, ys = sorted(extent[0::2]), sorted(extent[1::2])
+            window = from_bounds(xs[0], ys[0], xs[1], ys[1], src.transform)
+            window = window.round_offsets().round_lengths()
+
+        rgb = src.read([BAND_INDEX[band] for band in bands], window=window)
+        rgb = rgb.astype("float64")
+
+        bounds = src.window_bounds(window) if window else src.bounds
+
+    rgb[rgb == NODATA] = np.nan
+
+    limits = [bounds[0], bounds[2], bounds[1], bounds[3]]
+
+    return rgb, limits
+
+
+def _render_key(job: dict, vis: dict) -> str:
+    """
+    Hash that changes when the image or the render options change.
+    """
+    stat = os.stat(job["path"])
+    key = [stat.st_mtime_ns, stat.st_size, job.get("extent"), job.get("title"), vis]
+
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def _init_worker(figsize: Sequence[float], dpi: int) -> None:
+    """
+    Create the figure that the worker reuses for all its renders.
+    """
+    global _figure
+
+    _figure = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(_figure)
+
+
+def _render(job: dict, vis: dict) -> str:
+    """
+    Render one quick-look in the figure of the worker.
+    """
+    rgb, limits = read_rgb(job["path"], vis["bands"], job.get("extent"))
+
+    # Clear the reused figure and plot the image
+    _figure.clear()
+    ax = _figure.add_subplot(1, 1, 1)
+    ax.imshow(stretch(rgb, vis), extent=limits, interpolation="nearest")
+    ax.set_title(job.get("title", ""), fontsize=12)
+
+    _figure.savefig(job["save_path"])
+
+    return job["save_path"]
+
+
+def render_quicklooks(
+    jobs: Sequence[dict],
+    vis: dict,
+    manifest_path: str | None = None,
+    processes: int | None = None,
+    figsize: Sequence[float] = (4, 4),
+    dpi: int = 100,
+) -> list[str]:
+    """
+    Function to render RGB quick-looks of local images in a process pool,
+    every worker reuses the same figure canvas.
+
+    The images already rendered are skipped if the image and the render
+    options haven't changed since the last render.
+
+    Parameters
+    ----------
+    jobs : Sequence[dict]
+        Quick-looks to render, with the keys "path" (image), "save_path"
+        (png), "extent" (optional limits [x0, y0, x1, y1]) and "title".
+
+    vis : dict
+        Visualization parameters with the keys "bands", "min", "max" and
+        "gamma", like the Earth Engine visualization parameters.
+
+    manifest_path : str | None = None
+        JSON file to save the hashes of the rendered quick-looks, if it is
+        not defined all quick-looks are rendered.
+
+    processes : int | None = None
+        Number of worker processes, by default the number of CPUs.
+
+    figsize : Sequence[width, height] = (4, 4)
+        Size of the figures.
+
+    dpi : int = 100
+        Resolution of the figures.
+
+    Returns
+    -------
+    rendered : list[str]
+        Paths of the quick-looks rendered.
+    """
+    # Load the hashes of the previous renders
+    manifest = {}
+    if manifest_path is not None and os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+
+    # Keep only the jobs whose image or options changed
+    keys = {job["save_path"]: _render_key(job, vis) for job in jobs}
+    pending = [
+        job for job in jobs
+        if manifest.get(job["save_path"]) != keys[job["save_path"]]
+        or not os.path.exists(job["save_path"])
+    ]
+
+    rendered = []
+
+    if pending:
+        with ProcessPoolExecutor(
+            max_workers=processes, initializer=_init_worker, initargs=(figsize, dpi)
+        ) as pool:
+            rendered = list(pool.map(_render, pending, [vis] * len(pending)))
+
+    # Save the hashes of the new renders
+    if manifest_path is not None:
+        manifest.update({path: keys[path] for path in rendered})
+
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=1)
+
+    return rendered
@@ -0,0 +1,340 @@
+# %% Dependencies imports
+import os
+import sys
+import json
+import pickle
+import hashlib
+import tempfile
+import importlib
+import importlib.util
+import traceback
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+from matplotlib.collections import QuadMesh, PathCollection
+
+from functions.pipeline import local_imports
+from functions.telemetry import span
+
+# %% Typing imports
+from typing import Any, Callable, Sequence
+from matplotlib.figure import Figure
+
+# %% Constants
+# Style of the figures and file to save the hashes of the rendered figures
+STYLE_PATH = "src/style.mplstyle"
+MANIFEST_PATH = "images/render_manifest.json"
+
+# Minimum number of points of a scatter to rasterize it
+MIN_POINTS = 500
+
+
+# %% Functions
+def figure_job(builder: Callable, path: str, *args: Any, **kwargs: Any) -> dict:
+    """
+    Function to define the render of a figure: the function that builds it,
+    its arguments and the path to save it.
+
+    Parameters
+    ----------
+    builder : Callable
+        Function that returns a matplotlib Figure, it must be defined in an
+        importable module (e.g. functions.stat_plots), not in a script.
+
+    path : str
+        Path to save the figure.
+
+    *args, **kwargs : Any
+        Arguments of the builder, they must be picklable.
+
+    Returns
+    -------
+    job : dict
+        Job for render_figures().
+    """
+    if builder.__module__ == "__main__":
+        raise ValueError("the builder must be defined in an importable module, not in a script")
+
+    return {
+        "builder": f"{builder.__module__}:{builder.__qualname__}",
+        "path": path,
+        "args": args,
+        "kwargs": kwargs,
+    }
+
+
+def _builder(name: str) -> Callable:
+    """
+    Import the builder of a job from its module:qualname.
+    """
+    module, qualname = name.split(":")
+    func = importlib.import_module(module)
+
+    for attr in qualname.split("."):
+        func = getattr(func, attr)
+
+    return func
+
+
+def job_key(job: dict, style: str = STYLE_PATH, dpi: int = 300, rasterize: bool = True) -> str:
+    """
+    Function to get the hash of a figure: its data, the source of its
+    builder module and of the modules of functions it imports, the style and
+    the render options.
+
+    Parameters
+    ----------
+    job : dict
+        Job from figure_job().
+
+    style : str = STYLE_PATH
+        Matplotlib style file.
+
+    dpi : int = 300
+        Resolution of the rasterized layers.
+
+    rasterize : bool = True
+        If the heavy layers are rasterized.
+
+    Returns
+    -------
+    key : str
+        SHA-256 of the figure.
+    """
+    h = hashlib.sha256()
+    h.update(f"{job['builder']}|{dpi}|{rasterize}".encode())
+
+    # Changes in the code of the builder, in the helpers it uses or in the
+    # style render the figure again
+    module = importlib.util.find_spec(job["builder"].split(":")[0])
+    for path in (module.origin, *local_imports(module.origin), style):
+        with open(path, "rb") as f:
+            h.update(f.read())
+
+    h.update(pickle.dumps((job["args"], job["kwargs"]), protocol=4))
+
+    return h.hexdigest()
+
+
+def rasterize_layers(fig: Figure, min_points: int = MIN_POINTS) -> None:
+    """
+    Function to rasterize the heavy layers of a figure (meshes, images and
+    big scatters) inside its vector output, the axes, texts and lines keep
+    being vectors.
+
+    Parameters
+    ----------
+    fig : matplotlib.figure.Figure
+        Figure to modify.
+
+    min_points : int = MIN_POINTS
+        Minimum number of points of a scatter to rasterize it.
+    """
+    for ax in fig.axes:
+        for collection in ax.collections:
+            if isinstance(collection, QuadMesh) or (
+                isinstance(collection, PathCollection)
+                and len(collection.get_offsets()) >= min_points
+            ):
+                collection.set_rasterized(True)
+
+        for image in ax.images:
+            image.set_rasterized(True)
+
+
+def _render(job: dict, style: str, dpi: int, rasterize: bool) -> str | None:
+    """
+    Build and save the figure of a job, return the error instead of raising it.
+    """
+    import matplotlib.pyplot as plt
+
+    try:
+        with span(job["path"], "render"):
+            plt.style.use(style)
+            fig = _builder(job["builder"])(*job["args"], **job["kwargs"])
+
+            if rasterize:
+                rasterize_layers(fig)
+
+            fig.savefig(job["path"], dpi=dpi)
+            plt.close(fig)
+
+    except Exception:
+        plt.close("all")
+        return traceback.format_exc()
+
+    return None
+
+
+def _init_worker() -> None:
+    """
+    Use the non-interactive backend in the workers.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def _render_pool(
+    jobs: Sequence[dict], style: str, processes: int | None, dpi: int, rasterize: bool,
+) -> list[str | None]:
+    """
+    Render the jobs in a process pool started from a new interpreter, so the
+    workers don't import the script that defined the jobs.
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        jobs_path = os.path.join(folder, "jobs.pkl")
+        results_path = os.path.join(folder, "results.pkl")
+
+        with open(jobs_path, "wb") as f:
+            pickle.dump({"jobs": list(jobs), "style": style, "processes": processes,
+                         "dpi": dpi, "rasterize": rasterize}, f)
+
+        # The interpreter must find the functions package
+        env = os.environ.copy()
+        src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env["PYTHONPATH"] = os.pathsep.join(p for p in [src, env.get("PYTHONPATH")] if p)
+
+        subprocess.run(
+            [sys.executable, "-m", "functions.render", jobs_path, results_path],
+            env=env, check=True,
+        )
+
+        with open(results_path, "rb") as f:
+            return pickle.load(f)
+
+
+def _load_manifest(path: str) -> dict[str, str]:
+    """
+    Hashes of the rendered figures, empty if there is no manifest.
+    """
+    if not os.path.exists(path):
+        return {}
+
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _save_manifest(path: str, keys: dict[str, str]) -> None:
+    """
+    Add the hashes of some figures to the manifest. The stages render at
+    the same time, so the manifest is read again just before the write and
+    written to a temporary file that replaces it, the other stages never
+    read half a file.
+    """
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+
+    manifest = _load_manifest(path)
+    manifest.update(keys)
+
+    fd, temp_path = tempfile.mkstemp(suffix=".json", dir=folder)
+    os.close(fd)
+
+    try:
+        with open(temp_path, "w") as f:
+            json.dump(manifest, f, indent=1)
+
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def render_figures(
+    jobs: Sequence[dict],
+    manifest_path: str | None = MANIFEST_PATH,
+    style: str = STYLE_PATH,
+    processes: int | None = None,
+    dpi: int = 300,
+    rasterize: bool = True,
+) -> list[str]:
+    """
+    Function to render figures in a process pool, only the figures whose
+    data, builder or style changed since their last render.
+
+    Parameters
+    ----------
+    jobs : Sequence[dict]
+        Jobs from figure_job().
+
+    manifest_path : str | None = MANIFEST_PATH
+        JSON file to save the hashes of the rendered figures, if it is not
+        defined all figures are rendered.
+
+    style : str = STYLE_PATH
+        Matplotlib style file.
+
+    processes : int | None = None
+        Number of worker processes, by default the number of CPUs. If it is
+        1 the figures are rendered in this process.
+
+    dpi : int = 300
+        Resolution of the rasterized layers.
+
+    rasterize : bool = True
+        If True, rasterize the meshes, images and big scatters inside the
+        vector outputs.
+
+    Returns
+    -------
+    rendered : list[str]
+        Paths of the figures rendered.
+
+    Raises
+    ------
+    RuntimeError
+        If any figure failed, after printing the traceback of every failure
+        and saving the hashes of the other figures.
+    """
+    # Load the hashes of the previous renders
+    manifest = {} if manifest_path is None else _load_manifest(manifest_path)
+
+    # Keep only the jobs whose figure changed
+    keys = {job["path"]: job_key(job, style, dpi, rasterize) for job in jobs}
+    pending = [
+        job for job in jobs
+        if manifest.get(job["path"]) != keys[job["path"]] or not os.path.exists(job["path"])
+    ]
+
+    if processes == 1 or len(pending) < 2:
+        errors = [_render(job, style, dpi, rasterize) for job in pending]
+    else:
+        errors = _render_pool(pending, style, processes, dpi, rasterize)
+
+    rendered, failed = [], []
+
+    # Report the failed figures and keep the others
+    for job, error in zip(pending, errors):
+        if error is None:
+            rendered.append(job["path"])
+        else:
+            failed.append(job["path"])
+            print(f"{job['path']}: failed", error, sep="\n")
+
+    # Save the hashes of the new renders
+    if manifest_path is not None and rendered:
+        _save_manifest(manifest_path, {path: keys[path] for path in rendered})
+
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(pending)} figures failed: {', '.join(failed)}")
+
+    return rendered
+
+
+# %% Render the jobs saved by render_figures() in a process pool
+if __name__ == "__main__":
+    jobs_path, results_path = sys.argv[1:3]
+
+    with open(jobs_path, "rb") as f:
+        options = pickle.load(f)
+
+    n = len(options["jobs"])
+
+    with ProcessPoolExecutor(max_workers=options["processes"], initializer=_init_worker) as pool:
+        errors = list(pool.map(
+            _render, options["jobs"], [options["style"]] * n,
+            [options["dpi"]] * n, [options["rasterize"]] * n,
+        ))
+
+    with open(results_path, "wb") as f:
+        pickle.dump(errors, f)
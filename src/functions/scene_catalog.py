@@ -0,0 +1,348 @@
+# %% Dependencies imports
+import os
+import json
+import numpy as np
+import pandas as pd
+
+# %% Typing imports
+from typing import Callable, Sequence
+
+# A client receives the collection id, the forest key and the date range
+# [start, end) and returns one dictionary by scene with the keys "id",
+# "date", "cloud_cover" and "footprint" (GeoJSON string)
+Client = Callable[[str, str, str, str], list[dict]]
+
+# %% Constants
+# Landsat collections used by 2_download_rasters.py and A1_plot_images.py
+COLLECTIONS = {
+    "L5": "LANDSAT/LT05/C02/T1_L2",
+    "L7": "LANDSAT/LE07/C02/T1_L2",
+    "L8": "LANDSAT/LC08/C02/T1_L2",
+}
+
+# Years used of every sensor in the analysis
+SENSOR_YEARS = {"L5": (1996, 1998), "L7": (1999, 2013), "L8": (2014, 2021)}
+
+# Columns of the catalog
+COLUMNS = ["id", "sensor", "key", "date", "cloud_cover", "footprint"]
+
+
+# %% Clients
+def ee_client(forests_asset: str) -> Client:
+    """
+    Function to create a client that consults the scenes metadata in Earth
+    Engine, with one request for every date range.
+
+    Parameters
+    ----------
+    forests_asset : str
+        Earth Engine asset with the forests, each one with a "key" property.
+
+    Returns
+    -------
+    client : Client
+        Function to consult the scenes of a forest in a date range.
+    """
+    import ee
+
+    forests = ee.FeatureCollection(forests_asset)
+
+    def client(collection: str, key: str, start: str, end: str) -> list[dict]:
+        roi = forests.filter(ee.Filter.eq("key", key)).first().geometry()
+        ic = ee.ImageCollection(collection).filterBounds(roi).filterDate(start, end)
+
+        # Convert the images to features to get their footprints and
+        # properties in only one request
+        fc = ee.FeatureCollection(ic.map(
+            lambda img: ee.Feature(img.geometry(), {
+                "id": img.get("system:index"),
+                "date": img.get("DATE_ACQUIRED"),
+                "cloud_cover": img.get("CLOUD_COVER"),
+            })
+        ))
+
+        features = fc.getInfo()["features"]
+
+        return [
+            {**f["properties"], "footprint": json.dumps(f["geometry"])}
+            for f in features
+        ]
+
+    return client
+
+
+def fake_client(scenes: pd.DataFrame) -> Client:
+    """
+    Function to create a client that consults the scenes metadata in a local
+    dataframe, to test the catalog without Earth Engine.
+
+    Parameters
+    ----------
+    scenes : pd.DataFrame
+        Dataframe with the columns "collection", "key", "id", "date",
+        "cloud_cover" and "footprint".
+
+    Returns
+    -------
+    client : Client
+        Function to consult the scenes of a forest in a date range.
+    """
+    def client(collection: str, key: str, start: str, end: str) -> list[dict]:
+        mask = (
+            (scenes.collection == collection) & (scenes.key == key)
+            & (scenes.date >= start) & (scenes.date < end)
+        )
+
+        return scenes[mask][["id", "date", "cloud_cover", "footprint"]].to_dict("records")
+
+    return client
+
+
+# %% Functions
+def _date_batches(start: str, end: str, batch_days: int) -> list[tuple[str, str]]:
+    """
+    Split the date range [start, end) in batches of batch_days.
+    """
+    edges = np.arange(
+        np.datetime64(start, "D"), np.datetime64(end, "D"), np.timedelta64(batch_days, "D")
+    )
+    edges = [str(e) for e in edges] + [end]
+
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def load_catalog(path: str) -> tuple[pd.DataFrame, dict]:
+    """
+    Function to load the scenes catalog and the date ranges that it covers.
+
+    Parameters
+    ----------
+    path : str
+        Path of the catalog CSV, the coverage is saved next to it as JSON.
+
+    Returns
+    -------
+    catalog : pd.DataFrame
+        Dataframe with one row by scene and forest.
+
+    coverage : dict
+        Date range [start, end) consulted by "sensor/key".
+    """
+    if os.path.exists(path):
+        catalog = pd.read_csv(path, dtype={"id": str, "key": str, "date": str})
+    else:
+        catalog = pd.DataFrame(columns=COLUMNS)
+
+    coverage = {}
+    if os.path.exists(path + ".json"):
+        with open(path + ".json", "r") as f:
+            coverage = json.load(f)
+
+    return catalog, coverage
+
+
+def refresh_catalog(
+    path: str,
+    client: Client,
+    keys: Sequence[str],
+    start: str,
+    end: str,
+    collections: dict[str, str] = COLLECTIONS,
+    batch_days: int = 366,
+) -> pd.DataFrame:
+    """
+    Function to update the scenes catalog, only the date ranges that were
+    not consulted before are requested to the client.
+
+    Parameters
+    ----------
+    path : str
+        Path of the catalog CSV, the coverage is saved next to it as JSON.
+
+    client : Client
+        Function to consult the scenes, like ee_client() or fake_client().
+
+    keys : Sequence[str]
+        Keys of the forests.
+
+    start : str
+        First date to consult (YYYY-MM-DD).
+
+    end : str
+        Date after the last date to consult (YYYY-MM-DD).
+
+    collections : dict[str, str] = COLLECTIONS
+        Collection id by sensor name.
+
+    batch_days : int = 366
+        Days consulted in every request.
+
+    Returns
+    -------
+    catalog : pd.DataFrame
+        Dataframe with one row by scene and forest, sorted by date.
+    """
+    catalog, coverage = load_catalog(path)
+    rows = []
+
+    for sensor, collection in collections.items():
+        for key in keys:
+            covered = coverage.get(f"{sensor}/{key}")
+
+            # Define the ranges that were not consulted
+            if covered is None:
+                missing = [(start, end)]
+            else:
+                missing = []
+                if start < covered[0]:
+                    missing.append((start, covered[0]))
+                if end > covered[1]:
+                    missing.append((covered[1], end))
+
+            for r0, r1 in missing:
+                for b0, b1 in _date_batches(r0, r1, batch_days):
+                    for scene in client(collection, key, b0, b1):
+                        rows.append({**scene, "sensor": sensor, "key": key})
+
+            # Update the covered range
+            if covered is None:
+                coverage[f"{sensor}/{key}"] = [start, end]
+            else:
+                coverage[f"{sensor}/{key}"] = [min(start, covered[0]), max(end, covered[1])]
+
+    if rows:
+        catalog = pd.concat([catalog, pd.DataFrame(rows, columns=COLUMNS)])
+
+    # Remove repeated scenes and sort them by date
+    catalog = catalog.drop_duplicates(["id", "key"], keep="last")
+    catalog = catalog.sort_values(["key", "date", "id"]).reset_index(drop=True)
+
+    catalog.to_csv(path, index=False)
+    with open(path + ".json", "w") as f:
+        json.dump(coverage, f, indent=1)
+
+    return catalog
+
+
+def select_scenes(
+    catalog: pd.DataFrame,
+    key: str,
+    sensors: Sequence[str] | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    max_cloud: float | None = None,
+) -> pd.DataFrame:
+    """
+    Function to select the scenes of a forest in the catalog.
+
+    Parameters
+    ----------
+    catalog : pd.DataFrame
+        Catalog from load_catalog() or refresh_catalog().
+
+    key : str
+        Key of the forest.
+
+    sensors : Sequence[str] | None = None
+        Sensors of interest, by default all.
+
+    start : str | None = None
+        First date of interest (YYYY-MM-DD).
+
+    end : str | None = None
+        Date after the last date of interest (YYYY-MM-DD).
+
+    max_cloud : float | None = None
+        Maximum cloud cover of the scenes in percentage.
+
+    Returns
+    -------
+    scenes : pd.DataFrame
+        Scenes that accomplish all the conditions.
+    """
+    mask = catalog.key == key
+
+    if sensors is not None:
+        mask &= catalog.sensor.isin(sensors)
+    if start is not None:
+        mask &= catalog.date >= start
+    if end is not None:
+        mask &= catalog.date < end
+    if max_cloud is not None:
+        mask &= catalog.cloud_cover <= max_cloud
+
+    return catalog[mask]
+
+
+def months_with_scenes(
+    catalog: pd.DataFrame,
+    key: str,
+    sensors: Sequence[str] | None = None,
+    max_cloud: float | None = None,
+) -> set[tuple[int, int]]:
+    """
+    Function to get the months (year, month) that have at least one scene of
+    a forest, to plan the exports without consulting Earth Engine.
+
+    Parameters
+    ----------
+    catalog : pd.DataFrame
+        Catalog from load_catalog() or refresh_catalog().
+
+    key : str
+        Key of the forest.
+
+    sensors : Sequence[str] | None = None
+        Sensors of interest, by default all.
+
+    max_cloud : float | None = None
+        Maximum cloud cover of the scenes in percentage.
+
+    Returns
+    -------
+    months : set[tuple[int, int]]
+        Months with scenes.
+    """
+    scenes = select_scenes(catalog, key, sensors, max_cloud=max_cloud)
+
+    return {(int(d[:4]), int(d[5:7])) for d in scenes.date}
+
+
+def scene_dates(
+    catalog: pd.DataFrame,
+    key: str,
+    sensor_years: dict[str, tuple[int, int]] = SENSOR_YEARS,
+    max_cloud: float | None = None,
+) -> list[str]:
+    """
+    Function to get the acquisition dates of a forest, taking every sensor
+    only in its years of the analysis.
+
+    Parameters
+    ----------
+    catalog : pd.DataFrame
+        Catalog from load_catalog() or refresh_catalog().
+
+    key : str
+        Key of the forest.
+
+    sensor_years : dict[str, tuple[int, int]] = SENSOR_YEARS
+        First and last year used of every sensor.
+
+    max_cloud : float | None = None
+        Maximum cloud cover of the scenes in percentage.
+
+    Returns
+    -------
+    dates : list[str]
+        Sorted acquisition dates (YYYY-MM-DD) without repetitions.
+    """
+    dates = set()
+
+    for sensor, (y0, y1) in sensor_years.items():
+        scenes = select_scenes(
+            catalog, key, [sensor], f"{y0:04d}-01-01", f"{y1 + 1:04d}-01-01", max_cloud
+        )
+        dates.update(scenes.date)
+
+    return sorted(dates)
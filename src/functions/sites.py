@@ -0,0 +1,159 @@
+# %% Dependencies imports
+import traceback
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+from functions.telemetry import span
+
+# tomllib is in the standard library from Python 3.11
+try:
+    import tomllib
+except ModuleNotFoundError:
+    import tomli as tomllib
+
+# %% Typing imports
+from typing import Any, Callable, Sequence
+
+# %% Constants
+SITES_PATH = "src/sites.toml"
+
+
+# %% Functions
+def load_sites(path: str = SITES_PATH) -> dict[str, dict]:
+    """
+    Function to load the registry of sites.
+
+    Parameters
+    ----------
+    path : str = SITES_PATH
+        Path of the TOML file with one table by site.
+
+    Returns
+    -------
+    sites : dict[str, dict]
+        Configuration of every site by key, in the order of the file. The key
+        is also saved in the "key" field.
+    """
+    with open(path, "rb") as f:
+        sites = tomllib.load(f)
+
+    for key, site in sites.items():
+        site["key"] = key
+
+    return sites
+
+
+def pool_map(
+    func: Callable,
+    tasks: Sequence[Any],
+    processes: int | None = None,
+    initializer: Callable | None = None,
+    initargs: tuple = (),
+) -> list[Any]:
+    """
+    Function to run a function over some tasks in a process pool, or in
+    this process if processes is 1 or there is only one task.
+
+    The function must be defined at the top level of a module, so the
+    workers can import it.
+
+    Parameters
+    ----------
+    func : Callable
+        Function that receives one task.
+
+    tasks : Sequence[Any]
+        Tasks, they must be picklable.
+
+    processes : int | None = None
+        Number of worker processes, by default the number of CPUs.
+
+    initializer : Callable | None = None
+        Function called once by worker (or once in this process) before the
+        tasks, e.g. to keep big arrays that are sent once by worker.
+
+    initargs : tuple = ()
+        Arguments of the initializer.
+
+    Returns
+    -------
+    results : list[Any]
+        Result of every task, in the order of the tasks.
+    """
+    if processes == 1 or len(tasks) < 2:
+        if initializer is not None:
+            initializer(*initargs)
+
+        return [func(task) for task in tasks]
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=initializer, initargs=initargs) as pool:
+        return list(pool.map(func, tasks, chunksize=max(1, len(tasks) // 64)))
+
+
+def _run_site(func: Callable[[dict], Any], site: dict) -> tuple[Any, str | None]:
+    """
+    Run the function of one site and return the error instead of raising it.
+    """
+    try:
+        with span(site["key"], "site"):
+            return func(site), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def fan_out(
+    func: Callable[[dict], Any],
+    sites: dict[str, dict],
+    processes: int | None = None,
+) -> dict[str, Any]:
+    """
+    Function to run the processing of every site in a process pool. A
+    failure in one site doesn't stop the others, but after all sites finish
+    the errors are reported and an exception is raised, so the stage exits
+    with an error instead of saving partial outputs.
+
+    The function must be defined at the top level of a module and the
+    script that calls fan_out() must do it inside a main guard
+    (if __name__ == "__main__":), so the workers can import it.
+
+    Parameters
+    ----------
+    func : Callable[[dict], Any]
+        Function that receives the configuration of a site.
+
+    sites : dict[str, dict]
+        Sites from load_sites().
+
+    processes : int | None = None
+        Number of worker processes, by default the number of CPUs. If it is
+        1 the sites are processed in this process.
+
+    Returns
+    -------
+    results : dict[str, Any]
+        Result of every site, in the order of the sites.
+
+    Raises
+    ------
+    RuntimeError
+        If any site failed, after printing the traceback of every failure.
+    """
+    keys = list(sites)
+    configs = [sites[key] for key in keys]
+
+    outputs = pool_map(functools.partial(_run_site, func), configs, processes)
+
+    results, failed = {}, []
+
+    # Report all the failed sites before raising
+    for key, (result, error) in zip(keys, outputs):
+        if error is None:
+            results[key] = result
+        else:
+            failed.append(key)
+            print(f"{key}: failed", error, sep="\n")
+
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(keys)} sites failed: {', '.join(failed)}")
+
+    return results
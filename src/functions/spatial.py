@@ -0,0 +1,394 @@
+# %% Dependencies imports
+import functools
+import numpy as np
+from scipy import sparse, special
+
+from functions.sites import pool_map
+
+# %% Typing imports
+import numpy.typing as npt
+from typing import Any
+
+# %% Constants
+# Quadrants of the LISA maps (as PySAL), 0 are the pixels not significant
+QUADRANTS = {1: "High-High", 2: "Low-High", 3: "Low-Low", 4: "High-Low"}
+
+# Arrays shared with the workers of the permutations
+_shared = {}
+
+
+# %% Functions
+def _offsets(kind: str, radius: float) -> list[tuple[int, int]]:
+    """
+    Offsets (dy, dx) of the neighbours of a pixel.
+    """
+    r = int(np.floor(radius)) if kind == "distance" else 1
+    offsets = []
+
+    for dy in range(-r, r + 1):
+        for dx in range(-r, r + 1):
+            if (dy, dx) == (0, 0):
+                continue
+
+            match kind:
+                case "rook":
+                    keep = abs(dy) + abs(dx) == 1
+                case "queen":
+                    keep = True
+                case "distance":
+                    keep = dy ** 2 + dx ** 2 <= radius ** 2
+                case _:
+                    raise ValueError("kind must be 'rook', 'queen' or 'distance'")
+
+            if keep:
+                offsets.append((dy, dx))
+
+    return offsets
+
+
+@functools.lru_cache(maxsize=8)
+def grid_weights(ny: int, nx: int, kind: str = "queen", radius: float = 1.5) -> sparse.csr_matrix:
+    """
+    Function to build the binary weights of the pixels of a grid as a sparse
+    CSR matrix. The matrices are kept in memory, so the weights of a grid
+    are built once.
+
+    Parameters
+    ----------
+    ny, nx : int
+        Size of the grid.
+
+    kind : str = "queen"
+        Neighbours of a pixel: "rook" (4 sides), "queen" (8 sides and
+        corners) or "distance" (pixels inside the radius).
+
+    radius : float = 1.5
+        Radius of the distance band in pixels.
+
+    Returns
+    -------
+    weights : scipy.sparse.csr_matrix
+        Matrix (ny * nx, ny * nx) with 1 between neighbours, the pixels are
+        numbered by rows.
+    """
+    index = np.arange(ny * nx).reshape(ny, nx)
+    rows, cols = [], []
+
+    # Pairs of every offset inside the grid, all pixels at once
+    for dy, dx in _offsets(kind, radius):
+        source = index[max(0, -dy):ny - max(0, dy), max(0, -dx):nx - max(0, dx)]
+        target = index[max(0, dy):ny - max(0, -dy), max(0, dx):nx - max(0, -dx)]
+
+        rows.append(source.ravel())
+        cols.append(target.ravel())
+
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    weights = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(ny * nx, ny * nx))
+
+    # The cached matrix must not be modified by the callers
+    weights.data.flags.writeable = False
+
+    return weights
+
+
+def valid_weights(weights: sparse.csr_matrix, valid: npt.NDArray) -> sparse.csr_matrix:
+    """
+    Function to keep the weights between valid pixels and standardize them
+    by rows, so the spatial lag is the mean of the valid neighbours.
+
+    Parameters
+    ----------
+    weights : scipy.sparse.csr_matrix
+        Weights of the grid from grid_weights().
+
+    valid : numpy.ndarray
+        Mask of the valid pixels, flattened by rows.
+
+    Returns
+    -------
+    weights : scipy.sparse.csr_matrix
+        Row-standardized weights (valid, valid), the pixels without valid
+        neighbours have a row of zeros.
+    """
+    keep = np.flatnonzero(valid)
+    subset = weights[keep][:, keep].astype("float64")
+
+    neighbours = np.asarray(subset.sum(axis=1)).ravel()
+    scale = np.divide(1.0, neighbours, out=np.zeros_like(neighbours), where=neighbours > 0)
+
+    return sparse.diags(scale) @ subset
+
+
+def _init_worker(shared: dict[str, Any]) -> None:
+    """
+    Save the shared arrays in the worker.
+    """
+    _shared.clear()
+    _shared.update(shared)
+
+
+def _global_permutations(task: tuple[int, int]) -> npt.NDArray:
+    """
+    Moran's I of a batch of permutations of the standardized field.
+    """
+    seed, size = task
+    z, w = _shared["z"], _shared["w"]
+
+    rng = np.random.default_rng(seed)
+    permuted = rng.permuted(np.broadcast_to(z[:, None], (len(z), size)), axis=0)
+
+    return (permuted * (w @ permuted)).sum(axis=0) / (z @ z) * len(z) / w.sum()
+
+
+def morans_i(
+    field: npt.NDArray,
+    kind: str = "queen",
+    radius: float = 1.5,
+    permutations: int = 0,
+    batch: int = 64,
+    processes: int | None = None,
+    seed: int = 0,
+) -> dict[str, float]:
+    """
+    Function to calculate the global Moran's I of a 2D field with the
+    row-standardized weights of its valid pixels.
+
+    The p-value is the analytic one under normality, with permutations the
+    pseudo p-value is also calculated.
+
+    Parameters
+    ----------
+    field : numpy.ndarray
+        Field with shape (y, x) and NaN where there is no data.
+
+    kind : str = "queen"
+        Neighbours of a pixel (see grid_weights()).
+
+    radius : float = 1.5
+        Radius of the distance band in pixels.
+
+    permutations : int = 0
+        Number of random permutations of the field for the pseudo p-value.
+
+    batch : int = 64
+        Permutations calculated together as a matrix.
+
+    processes : int | None = None
+        Number of worker processes for the permutations, by default the
+        number of CPUs. If it is 1 they are calculated in this process.
+
+    seed : int = 0
+        Seed of the random generator.
+
+    Returns
+    -------
+    result : dict[str, float]
+        Moran's I ("I"), its expected value ("expected"), z-score ("z"),
+        p-value ("pvalue"), pseudo p-value ("pseudo_pvalue") if there are
+        permutations, and the number of valid pixels ("n").
+    """
+    ny, nx = field.shape
+    values = field.ravel()
+    valid = np.isfinite(values)
+
+    w = valid_weights(grid_weights(ny, nx, kind, radius), valid)
+    z = values[valid] - values[valid].mean()
+    n = len(z)
+
+    s0 = w.sum()
+    I = n / s0 * (z @ (w @ z)) / (z @ z)
+
+    # Moments of I under normality
+    s1 = 0.5 * ((w + w.T).power(2)).sum()
+    s2 = ((np.asarray(w.sum(axis=1)).ravel() + np.asarray(w.sum(axis=0)).ravel()) ** 2).sum()
+    expected = -1 / (n - 1)
+    variance = (n ** 2 * s1 - n * s2 + 3 * s0 ** 2) / ((n ** 2 - 1) * s0 ** 2) - expected ** 2
+
+    score = (I - expected) / np.sqrt(variance)
+    result = {
+        "I": I, "expected": expected, "z": score,
+        "pvalue": special.erfc(abs(score) / np.sqrt(2)), "n": n,
+    }
+
+    if permutations:
+        sizes = [min(batch, permutations - start) for start in range(0, permutations, batch)]
+        tasks = [(seed + i, size) for i, size in enumerate(sizes)]
+
+        simulated = np.concatenate(pool_map(_global_permutations, tasks, processes, _init_worker, ({"z": z, "w": w},)))
+
+        # Permutations as extreme as the observed value, on its side
+        extreme = (simulated >= I).sum() if I >= expected else (simulated <= I).sum()
+        result["pseudo_pvalue"] = (extreme + 1) / (permutations + 1)
+
+    return result
+
+
+def _local_permutations(task: tuple[int, int, int]) -> npt.NDArray:
+    """
+    Number of conditional permutations of a chunk of pixels with a local
+    Moran's I as extreme as the observed.
+    """
+    start, end, seed = task
+    z, w, observed, permutations = _shared["z"], _shared["w"], _shared["observed"], _shared["permutations"]
+
+    n = len(z)
+    rng = np.random.default_rng(seed)
+
+    chunk = w[start:end]
+    neighbours = np.diff(chunk.indptr)
+    k = max(1, neighbours.max(initial=0))
+
+    # Random neighbours of every pixel, as many as it has and without
+    # replacement, drawn from the other pixels with Floyd's algorithm so
+    # the memory does not grow with the size of the field
+    used = np.arange(k)[None, :] < neighbours[:, None]
+    draws = np.zeros((end - start, permutations, k), dtype="int64")
+
+    for s in range(k):
+        top = np.where(used[:, s], n - 1 - neighbours + s, 0)[:, None]
+        draw = rng.integers(0, top + 1, (end - start, permutations))
+        taken = (draws[:, :, :s] == draw[:, :, None]).any(axis=2)
+        draws[:, :, s] = np.where(taken, top, draw)
+
+    pixels = np.arange(start, end)[:, None, None]
+    draws = draws + (draws >= pixels)
+
+    # Only the neighbours of every pixel count, with their row weight
+    weight = np.divide(1.0, neighbours, out=np.zeros(len(neighbours)), where=neighbours > 0)
+
+    lag = (z[draws] * used[:, None, :]).sum(axis=2) * weight[:, None]
+    simulated = z[start:end, None] * lag
+
+    local = observed[start:end, None]
+
+    return np.where(local >= 0, simulated >= local, simulated <= local).sum(axis=1)
+
+
+def lisa(
+    field: npt.NDArray,
+    kind: str = "queen",
+    radius: float = 1.5,
+    permutations: int = 999,
+    significance: float = 0.05,
+    chunk: int = 512,
+    processes: int | None = None,
+    seed: int = 0,
+) -> dict[str, npt.NDArray]:
+    """
+    Function to calculate the local Moran's I (LISA) of every pixel of a 2D
+    field with conditional permutation inference: the neighbours of every
+    pixel are replaced by random pixels of the field (drawn with
+    replacement from the other pixels).
+
+    The permutations of a chunk of pixels are drawn and evaluated as arrays,
+    the chunks are calculated in a process pool.
+
+    Parameters
+    ----------
+    field : numpy.ndarray
+        Field with shape (y, x) and NaN where there is no data.
+
+    kind : str = "queen"
+        Neighbours of a pixel (see grid_weights()).
+
+    radius : float = 1.5
+        Radius of the distance band in pixels.
+
+    permutations : int = 999
+        Number of conditional permutations by pixel.
+
+    significance : float = 0.05
+        Pseudo p-value under which a pixel is assigned to its quadrant.
+
+    chunk : int = 512
+        Pixels by task of the pool, a task uses about
+        16 * chunk * permutations * neighbours bytes.
+
+    processes : int | None = None
+        Number of worker processes, by default the number of CPUs. If it is
+        1 the chunks are calculated in this process.
+
+    seed : int = 0
+        Seed of the random generator.
+
+    Returns
+    -------
+    maps : dict[str, numpy.ndarray]
+        Maps with shape (y, x): local Moran's I ("local_i"), pseudo p-value
+        ("pvalue") and quadrant of the significant pixels ("quadrant", see
+        QUADRANTS, 0 if not significant), NaN where there is no data.
+    """
+    ny, nx = field.shape
+    values = field.ravel()
+    valid = np.isfinite(values)
+
+    w = valid_weights(grid_weights(ny, nx, kind, radius), valid)
+    z = values[valid] - values[valid].mean()
+    z = z / np.sqrt((z ** 2).mean())
+    n = len(z)
+
+    lag = w @ z
+    local = z * lag
+
+    # Permutations by chunks of pixels
+    tasks = [(start, min(start + chunk, n), seed + i) for i, start in enumerate(range(0, n, chunk))]
+    shared = {"z": z, "w": w, "observed": local, "permutations": permutations}
+    extreme = np.concatenate(pool_map(_local_permutations, tasks, processes, _init_worker, (shared,))) if n else np.zeros(0)
+
+    pvalue = (extreme + 1) / (permutations + 1)
+
+    # Quadrant of the value and its spatial lag
+    quadrant = np.select(
+        [(z > 0) & (lag > 0), (z <= 0) & (lag > 0), (z <= 0) & (lag <= 0), (z > 0) & (lag <= 0)],
+        [1, 2, 3, 4],
+    )
+    quadrant = np.where(pvalue < significance, quadrant, 0)
+
+    maps = {}
+    for name, result in (("local_i", local), ("pvalue", pvalue), ("quadrant", quadrant)):
+        maps[name] = np.full(ny * nx, np.nan)
+        maps[name][valid] = result
+        maps[name] = maps[name].reshape(ny, nx)
+
+    return maps
+
+
+def morans_i_series(
+    cube: npt.NDArray, kind: str = "queen", radius: float = 1.5, min_pixels: int = 30,
+) -> dict[str, npt.NDArray]:
+    """
+    Function to calculate the global Moran's I of every time slice of a
+    cube, with its analytic p-value.
+
+    Parameters
+    ----------
+    cube : numpy.ndarray
+        Cube with shape (time, y, x) and NaN where there is no data.
+
+    kind : str = "queen"
+        Neighbours of a pixel (see grid_weights()).
+
+    radius : float = 1.5
+        Radius of the distance band in pixels.
+
+    min_pixels : int = 30
+        Minimum number of valid pixels of a slice, the others are NaN.
+
+    Returns
+    -------
+    series : dict[str, numpy.ndarray]
+        Moran's I ("I"), z-score ("z"), p-value ("pvalue") and valid
+        pixels ("n") of every slice.
+    """
+    series = {name: np.full(len(cube), np.nan) for name in ("I", "z", "pvalue", "n")}
+
+    for i, field in enumerate(cube):
+        if np.isfinite(field).sum() < min_pixels:
+            continue
+
+        result = morans_i(field, kind, radius)
+
+        for name in series:
+            series[name][i] = result[name]
+
+    return series
@@ -0,0 +1,626 @@
+# %% Dependencies imports
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.seasonal import seasonal_decompose
+import matplotlib.pyplot as plt
+from matplotlib.gridspec import GridSpec
+from matplotlib.ticker import MultipleLocator, NullLocator
+from matplotlib.dates import YearLocator
+
+from functions.stat_utils import corr_matrix
+from functions.telemetry import traced
+
+# %% Typing imports
+import numpy.typing as npt
+from typing import Sequence
+from matplotlib.figure import Figure
+
+# %% Functions
+@traced
+def plot_ts_components(
+    data: pd.DataFrame,
+    figsize: Sequence[float] = (7, 4),
+    ENSO: npt.ArrayLike | None = None,
+    ENSO_keys: Sequence = ["Nina", "Nino"],
+    ENSO_scale: float = 0.05,
+    titles: dict[str, str] | None = None,
+) -> Figure:
+    """
+    Function to plot the time series components of all variables in a dataframe.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        Dataframe with the variables and time at index
+
+    figsize : Sequence[width, height]
+        Size of the figure.
+
+    ENSO : numpy.ndarray | None = None
+        Array use to plot ENSO phases stripes on time series.
+
+    ENSO_keys : Sequence = ["Nina", "Nino"]
+        ENSO Keys for La Niña ENSO cold phase and EL Niño ENSO warm phase,
+        respectively.
+
+    ENSO_scale : float = 0.05
+        Scale to plot the stripes.
+
+    titles : dict[str, str] | None = None
+        Custom titles for the time series.
+
+    Returns
+    -------
+    fig : matplotlib.figure.Figure
+        Figure with the TS components.
+
+    """
+    # Dictionary to store decomposed dataframes
+    decomposed_data = {}
+
+    # For all variabels in the dataframe extract all the TS components
+    # and save it in the dictinary
+    for variable in data.columns:
+        try:
+            components = seasonal_decompose(data[variable], extrapolate_trend="freq")
+        except:
+            continue
+
+        decomposed_data[variable] = pd.DataFrame(
+            {
+                "Observed": components.observed,
+                "Trend": components.trend,
+                "Detrended": components.observed - components.trend,
+                "Seasonal": components.seasonal,
+                "Anomalies": components.resid,
+            }
+        )
+
+    # Get the variables to iterate them
+    variables = [k for k in decomposed_data.keys()]
+
+    # Create the figure and the axes
+    fig, axs = plt.subplots(figsize=figsize, nrows=5, ncols=len(variables), sharex=True)
+
+    # Iterate trought variables to plot them by column
+    for i, variable in enumerate(variables):
+        # Get the components
+        components = decomposed_data[variable].columns
+
+        # Iterate the components to plot the by row
+        for j, component in enumerate(components):
+            x = decomposed_data[variable].index
+            y = decomposed_data[variable][component]
+
+            # Plot ENSO Stripes if ENSO is an array
+            try:
+                ENSO.any()
+            except:
+                continue
+            else:
+                # Plot La Niña ENSO Phase stripes
+                axs[j, i].fill_between(
+                    x,
+                    np.min(y) - ENSO_scale * np.max(y),
+                    np.max(y) + ENSO_scale * np.max(y),
+                    where=ENSO == ENSO_keys[0],
+                    color="blue",
+                    alpha=0.2,
+                )
+
+                # Plot El Niño ENSO Phase stripes
+                axs[j, i].fill_between(
+                    x,
+                    np.min(y) - ENSO_scale * np.max(y),
+                    np.max(y) + ENSO_scale * np.max(y),
+                    where=ENSO == ENSO_keys[1],
+                    color="red",
+                    alpha=0.2,
+                )
+
+            # Plot data
+            axs[j, i].plot(x, y, color="black", lw=0.5)
+
+            # In the first row add the variable title
+            if j == 0:
+                if titles != None:
+                    axs[j, i].set_title(titles[variable], fontsize=8)
+                else:
+                    axs[j, i].set_title(variable, fontsize=8)
+
+            # In the first column add the component in the label
+            if i == 0:
+                axs[j, i].set_ylabel(component)
+
+            # In the last row add the time label
+            if j == 4:
+                axs[j, i].set_xlabel("Time [Y]")
+
+            # Set the x-ticks to multiples of 5 years and the minor ticks to 1 year
+            axs[j, i].xaxis.set_major_locator(YearLocator(5))
+            axs[j, i].xaxis.set_minor_locator(YearLocator(1))
+
+    # Align all the y-labels in the first column
+    fig.align_ylabels(axs[:, 0])
+
+    return fig
+
+
+@traced
+def plot_acf_ccf(
+    data: dict[str, npt.ArrayLike],
+    ci: float,
+    ylims: Sequence[float] = [-1, 1],
+    titles: dict[str, str] | None = None,
+) -> Figure:
+    """
+    Function to plot ACF and CCF data previously calculated.
+
+    Paramters
+    ---------
+    data : dict[str, numpy.ndarray]
+        Dictinary with autocorrelation or cross-correlation data
+
+    ci : float
+        Confidence interval of correlation.
+
+    ylims :  Sequence[bottom, top] = [-1, 1]
+        Limits of correlation for the plot.
+
+    titles : dict[str, str] | None = None
+        Custom titles for the plots.
+
+    Returns
+    -------
+    fig : matplotlib.figure.Figure
+        Figure with the correlations plots.
+
+    """
+    # Get the correlation tests from the data
+    tests = [t for t in data.keys()]
+    # Get how many there are to define the figure dimensions
+    n = len(tests)
+
+    # Show error if ylims is list don't have two elements
+    if len(ylims) != 2:
+        Exception("ylims must have lenght of 2")
+
+    # Create the figure and GridSpec for axes
+    fig = plt.figure()
+    grs = GridSpec(nrows=2, ncols=2, figure=fig)
+
+    # Define the figures axes based on n, where n more than 4 show error
+    match n:
+        case 1:
+            axs = [fig.add_subplot(grs[:, :])]
+            axs[0].set(xlabel="Lags [months]", ylabel="Correlation")
+        case 2:
+            axs = [fig.add_subplot(grs[0, :]), fig.add_subplot(grs[1, :])]
+            axs[0].set(ylabel="Correlation")
+            axs[1].set(xlabel="Lags [months]", ylabel="Correlation")
+        case 3:
+            axs = [
+                fig.add_subplot(grs[0, 0]),
+                fig.add_subplot(grs[1, :]),
+                fig.add_subplot(grs[0, 1]),
+            ]
+            axs[0].set(ylabel="Correlation")
+            axs[1].set(xlabel="Lags [months]", ylabel="Correlation")
+
+        case 4:
+            axs = [
+                fig.add_subplot(grs[0, 0]),
+                fig.add_subplot(grs[1, 0]),
+                fig.add_subplot(grs[0, 1]),
+                fig.add_subplot(grs[1, 1]),
+            ]
+            axs[0].set(ylabel="Correlation")
+            axs[1].set(xlabel="Lags [months]", ylabel="Correlation")
+            axs[3].set(xlabel="Lags [months]")
+
+        case _:
+            Exception("data must have a lenght lower or equal than 4")
+
+    # For loop to plot ACF o CCF by variable
+    for i, (test, ax) in enumerate(zip(tests, axs)):
+        # Plot correlation data as stem
+        ax.stem(data[test], basefmt=" ", markerfmt=" ")
+
+        # Add a line at 0 and the confidence intervals
+        ax.axhline(0, color="black")
+        ax.axhline(ci, color="black", linestyle="--")
+        ax.axhline(-ci, color="black", linestyle="--")
+
+        # If there are custon titles add them to the plot, else
+        # use the  default titles
+        if titles != None:
+            ax.set_title(titles[test], fontsize=8)
+        else:
+            ax.set_title(test, fontsize=8)
+
+        # Set ylims and ticks
+        ax.set_ylim(bottom=ylims[0], top=ylims[1])
+        ax.xaxis.set_major_locator(MultipleLocator(4))
+        ax.xaxis.set_minor_locator(MultipleLocator(1))
+
+    # Share all x and y axis
+    for ax in axs[1:]:
+        ax.sharex(axs[0])
+        ax.sharey(axs[0])
+
+    return fig
+
+
+@traced
+def plot_corr_matrix(
+    data: pd.DataFrame,
+    variables: npt.ArrayLike | None = None,
+    half: bool = False,
+    hide_insignificants: bool = False,
+    singificant_threshold: float = 0.05,
+    show_labels: bool = True,
+    show_colorbar: bool = False,
+    palette: str = "Spectral",
+    text_color: str = "black",
+) -> Figure:
+    """
+    Calculate the pearson correlation matrix of the variables in a dataframe.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Dataframe with the variables to evaluate their correlation.
+
+    variables : ArrayLike | None = None
+        The variables of interest, if it is not defined, all variables in
+        the dataframe will be evaluated.
+
+    half : bool = False
+        If True, only show the corerlation of the first half of the matrix,
+        excluding the repeated correlation.
+
+    hide_insignifcants : bool = False
+        If True, hide all the correlation with a p-value greater than the
+        significant threshold.
+
+    siginificant_threshold : float = 0.05
+        Threshold of significant correlation.
+
+    show_labels : bool = True
+        Show the correlation value.
+
+    show_colorbar : bool = False
+        Show colorbar.
+
+    palette : str = Spectral
+        Color palette for correlation plot.
+
+    text_color : str = black
+        Color of text correlation labels.
+
+    returns
+    -------
+    corr : pd.DataFrame
+        Dataframe with the correlation values.
+
+    """
+
+    # If variables are not defined get all columns from data
+    if variables == None:
+        variables = data.columns
+
+    # Get the number of variables
+    N = len(variables)
+
+    # Reverse variables for plot
+    reverse = variables[::-1]
+
+    # Get the correlation matrix
+    corr = corr_matrix(
+        data, variables, half, hide_insignificants, singificant_threshold
+    )
+
+    if show_colorbar:
+        fs = (4, 3)
+    else:
+        fs = (3, 3)
+
+    # Create the figure and the axes
+    fig = plt.figure(figsize=fs)
+    ax1 = plt.subplot(1, 1, 1)
+
+    # Plot matrix with pcolormesh
+    im1 = ax1.pcolormesh(
+        variables, reverse, corr, cmap=palette, edgecolor="w", vmin=-1, vmax=1
+    )
+
+    # Invert y axis
+    ax1.invert_yaxis()
+
+    # Add the colorbar
+    if show_colorbar:
+        cax = ax1.inset_axes([1.04, 0.1, 0.05, 0.8])
+        bar = plt.colorbar(im1, cax=cax, label="Correlation")
+
+    if show_labels:
+        x, y = np.meshgrid(np.arange(N), np.arange(N))
+        x = x.reshape(-1)
+        y = y.reshape(-1)
+        t = corr.values.reshape(-1)
+
+        for xi, yi, ti in zip(x, y, t):
+            if np.isfinite(ti):
+                ax1.text(
+                    xi,
+                    yi,
+                    round(ti, 2),
+                    color=text_color,
+                    size=8,
+                    ha="center",
+                    va="center",
+                )
+
+    # Rotate labels to improve their readability
+    ax1.set_xticklabels(variables, rotation=30)
+    ax1.xaxis.set_minor_locator(NullLocator())
+    ax1.yaxis.set_minor_locator(NullLocator())
+
+    return fig
+
+
+@traced
+def plot_stat_maps(
+    stat: "xarray.Dataset",
+    forest: "geopandas.GeoSeries",
+    layout: str = "vertical",
+    label: str = "Mean",
+    ndvi_lims: Sequence[float] = (0, 1),
+    temp_lims: Sequence[float] = (28, 42),
+) -> Figure:
+    """
+    Function to plot the maps of a statistic of the NDVI and the surface
+    temperature of a forest.
+
+    Parameters
+    ----------
+    stat : xarray.Dataset
+        Dataset with the "NDVI" and "Surface Temperature" maps.
+
+    forest : geopandas.GeoSeries
+        Boundary of the forest.
+
+    layout : str = "vertical"
+        "vertical" to plot the maps in two rows or "horizontal" to plot
+        them in two columns.
+
+    label : str = "Mean"
+        Name of the statistic for the colorbars labels.
+
+    ndvi_lims, temp_lims : Sequence[vmin, vmax]
+        Color limits of the NDVI and the temperature.
+
+    Returns
+    -------
+    fig : matplotlib.figure.Figure
+        Figure with the maps.
+    """
+    # Create figure and axes, the vertical forests are plotted in two rows
+    # and the horizontal forest in two columns
+    if layout == "vertical":
+        fig, (ax1, ax2) = plt.subplots(
+            figsize=(5, 4), nrows=2, ncols=1, sharex=True, sharey=True
+        )
+        width = 0.03
+    else:
+        fig, (ax1, ax2) = plt.subplots(
+            figsize=(5, 4), nrows=1, ncols=2, sharex=True, sharey=True
+        )
+        width = 0.07
+
+    # Add axes for colorbars
+    cax1 = ax1.inset_axes([1.05, 0.05, width, 0.90])
+    cax2 = ax2.inset_axes([1.05, 0.05, width, 0.90])
+
+    # Plot NDVI
+    stat["NDVI"].plot(
+        ax=ax1, cbar_ax=cax1, vmin=ndvi_lims[0], vmax=ndvi_lims[1],
+        extend="neither", cmap="RdYlGn"
+    )
+
+    # Plot Temperature
+    stat["Surface Temperature"].plot(
+        ax=ax2, cbar_ax=cax2, vmin=temp_lims[0], vmax=temp_lims[1],
+        extend="neither", cmap="Spectral_r"
+    )
+
+    # Hide some labels
+    ax1.set_title("")
+    ax2.set_title("")
+
+    if layout == "vertical":
+        ax1.set_xlabel("")
+    else:
+        ax2.set_ylabel("")
+
+    # Add the forest
+    forest.plot(ax=ax1, color="black", lw=1)
+    forest.plot(ax=ax2, color="black", lw=1)
+
+    # Edit colorbars labels
+    cax1.set_ylabel(f"{label} NDVI")
+    cax2.set_ylabel(f"{label} Surface Temperature [°C]")
+
+    # Align colorbars labels
+    fig.align_ylabels([cax1, cax2])
+
+    # Set the ticks
+    ax2.yaxis.set_major_locator(MultipleLocator(0.02))
+    ax2.yaxis.set_minor_locator(MultipleLocator(0.01))
+    ax2.xaxis.set_major_locator(MultipleLocator(0.02))
+    ax2.xaxis.set_minor_locator(MultipleLocator(0.01))
+
+    return fig
+
+
+@traced
+def plot_scatter_by_group(
+    data: pd.DataFrame,
+    variables: Sequence[str],
+    groups: Sequence[str],
+    colors: Sequence,
+    titles: dict[str, str],
+    y: str = "NDVI",
+    group_column: str = "Lagoon",
+) -> Figure:
+    """
+    Function to plot a variable against four others in a 2x2 grid, with the
+    points colored by group.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Dataframe with the variables and the group column.
+
+    variables : Sequence[str]
+        Four variables for the x axes.
+
+    groups : Sequence[str]
+        Groups to plot (e.g. the lagoons).
+
+    colors : Sequence
+        Color of every group.
+
+    titles : dict[str, str]
+        Titles of the variables for the axes labels.
+
+    y : str = "NDVI"
+        Variable for the y axes.
+
+    group_column : str = "Lagoon"
+        Column with the groups.
+
+    Returns
+    -------
+    fig : matplotlib.figure.Figure
+        Figure with the scatter plots.
+    """
+    # Create figure and axes
+    fig, axs = plt.subplots(figsize=(6, 6), nrows=2, ncols=2, sharey=True)
+
+    # Index for plot
+    xx = [0, 1, 0, 1]
+    yy = [0, 0, 1, 1]
+
+    # Iterate throught variables and axes to plot one variable by axes
+    for ix, iy, variable in zip(xx, yy, variables):
+        handles = []                            # Save handles for legend
+
+        # Iterate throught groups and color to plot data by group
+        for group, color in zip(groups, colors):
+
+            # If there is data in the variable, plot it
+            try:
+                l = axs[iy,ix].scatter(
+                    data[variable][data[group_column] == group],
+                    data[y][data[group_column] == group],
+                    label=group.capitalize(),
+                    color=color,
+                    alpha=0.5
+                )
+
+            except:
+                continue
+
+            else:
+                handles.append(l)               # Save handle
+
+                # Add x-label
+                axs[iy,ix].set_xlabel(titles[variable])
+
+        # If the axes is in the first column add the y-label
+        if ix == 0:
+            axs[iy,ix].set_ylabel(titles[y])
+
+    # Add the legend to one axes
+    axs[0,1].legend(handles=handles, title="Forest")
+
+    return fig
+
+
+@traced
+def plot_wavelet_coherence(
+    coherence: "xarray.Dataset",
+    titles: dict[str, str] | None = None,
+    arrows: Sequence[int] = (6, 4),
+) -> Figure:
+    """
+    Function to plot the wavelet coherence of NDVI with its drivers, with
+    the significant regions, the cone of influence and the phase arrows.
+
+    Parameters
+    ----------
+    coherence : xarray.Dataset
+        Dataset with the "coherence", "phase" and "significance" by driver,
+        period and time, and the "coi" by time.
+
+    titles : dict[str, str] | None = None
+        Custom titles of the drivers.
+
+    arrows : Sequence[int] = (6, 4)
+        Step of the phase arrows in time steps and in periods.
+
+    Returns
+    -------
+    fig : matplotlib.figure.Figure
+        Figure with one panel by driver.
+    """
+    drivers = coherence["driver"].values
+    time = coherence["time"].values
+    period = coherence["period"].values
+
+    fig, axs = plt.subplots(
+        figsize=(7, 2.5 * len(drivers)), nrows=len(drivers), ncols=1,
+        sharex=True, sharey=True, squeeze=False
+    )
+
+    for driver, ax in zip(drivers, axs[:, 0]):
+        subset = coherence.sel(driver=driver)
+        r2 = subset["coherence"].values
+
+        # Coherence and the contour of the significant regions
+        mesh = ax.contourf(time, period, r2, levels=np.linspace(0, 1, 11), cmap="viridis")
+        ax.contour(
+            time, period, r2 / subset["significance"].values[:, None],
+            levels=[1], colors="black", linewidths=1
+        )
+
+        # Phase arrows where the coherence is significant, right is in
+        # phase and up when the driver leads by a quarter of period
+        st, sp = arrows
+        phase = subset["phase"].values[::sp, ::st]
+        keep = (r2 >= subset["significance"].values[:, None])[::sp, ::st]
+        ax.quiver(
+            time[::st], period[::sp],
+            np.where(keep, np.cos(phase), np.nan), np.where(keep, np.sin(phase), np.nan),
+            pivot="middle", scale=40, width=0.003, headwidth=4
+        )
+
+        # Cone of influence
+        ax.fill_between(
+            time, subset["coi"].values, period.max(),
+            color="white", alpha=0.5, hatch="x", edgecolor="gray", linewidth=0
+        )
+
+        ax.set_yscale("log", base=2)
+        ax.set_ylim(period.max(), period.min())
+        ax.yaxis.set_major_formatter(lambda y, _: f"{y:g}")
+        ax.set_ylabel("Period [months]")
+        ax.set_title(titles[driver] if titles != None else f"NDVI ~ {driver}", fontsize=8)
+
+        # Add the colorbar
+        cax = ax.inset_axes([1.02, 0.0, 0.02, 1.0])
+        fig.colorbar(mesh, cax=cax, label="Squared coherence")
+
+    axs[-1, 0].xaxis.set_major_locator(YearLocator(2))
+
+    return fig
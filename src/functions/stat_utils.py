@@ -1,19 +1,19 @@
 # %% Dependencies imports
+# Only NumPy and pandas are imported with the module, statsmodels and scipy
+# are imported inside the functions that use them and the plots are in
+# functions.stat_plots, so the workers and the scripts that only compute
+# don't pay the import of matplotlib, statsmodels and scipy
+import importlib
 import numpy as np
 import pandas as pd
-from statsmodels.tsa.seasonal import seasonal_decompose
-from scipy.stats import pearsonr
-import matplotlib.pyplot as plt
-from matplotlib.gridspec import GridSpec
-from matplotlib.ticker import MultipleLocator, NullLocator
-from matplotlib.dates import YearLocator
+
+from functions.telemetry import traced
 
 # %% Typing imports
 import numpy.typing as npt
-from typing import Sequence
-from matplotlib.figure import Figure
 
 # %% Functions
+@traced
 def na_seadec(
     x: pd.Series, method: str = "linear", model: str = "additive"
 ) -> pd.Series:
@@ -60,6 +60,8 @@ def na_seadec(
     # Interpolate the original series
     interpolated = x.interpolate(method=method)
 
+    from statsmodels.tsa.seasonal import seasonal_decompose
+
     # Decompose the series with seasonal_decompose from statsmodels
     components = seasonal_decompose(interpolated, model=model, extrapolate_trend="freq")
 
@@ -91,6 +93,7 @@ def na_seadec(
     return x
 
 
+@traced
 def detrend_variables(
     data: pd.DataFrame, variables: npt.ArrayLike | None = None
 ) -> pd.DataFrame:
@@ -111,6 +114,8 @@ def detrend_variables(
         Dataframes with the variables detrended.
 
     """
+    from statsmodels.tsa.seasonal import seasonal_decompose
+
     # Create a copy of the original dataframe
     dat2 = data.copy()
 
@@ -129,317 +134,202 @@ def detrend_variables(
     return dat2
 
 
-def corr_matrix(
-    data: pd.DataFrame,
-    variables: npt.ArrayLike | None = None,
-    half: bool = False,
-    hide_insignificants: bool = False,
-    singificant_threshold: float = 0.05,
-) -> pd.DataFrame:
+def decimal_years(times: npt.ArrayLike) -> npt.NDArray:
     """
-    Calculate the pearson correlation matrix of the variables in a dataframe.
+    Function to convert dates to decimal years, so the slopes are in units
+    by year.
 
     Parameters
     ----------
-    data : pd.DataFrame
-        Dataframe with the variables to evaluate their correlation.
-
-    variables : ArrayLike | None = None
-        The variables of interest, if it is not defined, all variables in
-        the dataframe will be evaluated.
+    times : ArrayLike
+        Dates (numpy.datetime64 or convertible).
 
-    half : bool = False
-        If True, only show the corerlation of the first half of the matrix,
-        excluding the repeated correlation.
+    Returns
+    -------
+    years : numpy.ndarray
+        Dates as decimal years.
+    """
+    times = np.asarray(times, dtype="datetime64[D]")
+    years = times.astype("datetime64[Y]")
 
-    hide_insignifcants : bool = False
-        If True, hide all the correlation with a p-value greater than the
-        significant threshold.
+    start = years.astype("datetime64[D]")
+    length = (years + 1).astype("datetime64[D]") - start
 
-    siginificant_threshold : float = 0.05
-        Threshold of significant correlation.
+    return years.astype(int) + 1970 + (times - start) / length
 
-    returns
-    -------
-    corr : pd.DataFrame
-        Dataframe with the correlation values.
 
+def harmonic_design(t: npt.NDArray, order: int = 2) -> npt.NDArray:
     """
-    if variables == None:
-        variables = data.columns
+    Function to build the design matrix of a linear trend with an annual
+    cycle: intercept, time and the sines and cosines of the harmonics.
 
-    reverse = variables[::-1]
+    Parameters
+    ----------
+    t : numpy.ndarray
+        Time in decimal years.
 
-    N = len(variables)
+    order : int = 2
+        Number of harmonics of the annual cycle.
 
-    corr = np.empty((N, N))
-    pval = np.full((N, N), np.nan)
-    mask = np.full((N, N), np.nan)
+    Returns
+    -------
+    design : numpy.ndarray
+        Matrix with shape (time, 2 + 2 * order), the time is centred.
+    """
+    columns = [np.ones_like(t), t - t.mean()]
 
-    for i, iv in enumerate(variables):
-        for j, jv in enumerate(reverse):
-            c, p = pearsonr(data[iv], data[jv])
-            corr[j, i] = c
+    for k in range(1, order + 1):
+        columns += [np.sin(2 * np.pi * k * t), np.cos(2 * np.pi * k * t)]
 
-            if p <= singificant_threshold:
-                pval[j, i] = 1.0
+    return np.column_stack(columns)
 
-        mask[: N - i, i] = 1.0
 
-    if half:
-        corr *= mask
+def batched_inverse(gram: npt.NDArray, enough: npt.NDArray) -> npt.NDArray:
+    """
+    Function to invert a stack of Gram matrices at once, with the identity
+    in place of the matrices of the series without enough dates and the
+    pseudo-inverse if some matrix is singular.
 
-    if hide_insignificants:
-        corr *= pval
+    Parameters
+    ----------
+    gram : numpy.ndarray
+        Gram matrices with shape (series, k, k).
 
-    corr = pd.DataFrame(data=corr, index=reverse, columns=variables)
+    enough : numpy.ndarray
+        Boolean mask with shape (series,) of the series with enough dates.
 
-    return corr
+    Returns
+    -------
+    inverse : numpy.ndarray
+        Inverses with the shape of gram.
+    """
+    gram = gram.copy()
+    gram[~enough] = np.eye(gram.shape[-1])
 
+    try:
+        return np.linalg.inv(gram)
+    except np.linalg.LinAlgError:
+        return np.linalg.pinv(gram)
 
-def plot_ts_components(
-    data: pd.DataFrame,
-    figsize: Sequence[float] = (7, 4),
-    ENSO: npt.ArrayLike | None = None,
-    ENSO_keys: Sequence = ["Nina", "Nino"],
-    ENSO_scale: float = 0.05,
-    titles: dict[str, str] | None = None,
-) -> Figure:
+
+@traced
+def harmonic_regression(
+    y: npt.ArrayLike | pd.Series | pd.DataFrame,
+    times: npt.ArrayLike | None = None,
+    harmonics: int = 2,
+) -> dict:
     """
-    Function to plot the time series components of all variables in a dataframe.
+    Function to fit a linear trend plus the harmonics of the annual cycle to
+    many series at once by least squares, only with their valid values, and
+    fill their gaps with the fit. Unlike na_seadec() the series are not
+    interpolated before the fit.
+
+    The series with the same missing values share the pseudo-inverse of the
+    design matrix of their valid dates, so the fit of a group is a single
+    product of matrices. The series with a unique pattern (e.g. the pixels
+    of a cloudy image) are solved together with their normal equations.
 
     Parameters
     ----------
-    data : pandas.DataFrame
-        Dataframe with the variables and time at index
+    y : ArrayLike | pd.Series | pd.DataFrame
+        Series with the time in the first axis (time, series) and NaN where
+        there is no data, a Series or DataFrame uses its index as time.
 
-    figsize : Sequence[width, height]
-        Size of the figure.
+    times : ArrayLike | None = None
+        Dates of the series, needed if y is not a Series or DataFrame.
 
-    ENSO : numpy.ndarray | None = None
-        Array use to plot ENSO phases stripes on time series.
+    harmonics : int = 2
+        Number of harmonics of the annual cycle.
 
-    ENSO_keys : Sequence = ["Nina", "Nino"]
-        ENSO Keys for La Niña ENSO cold phase and EL Niño ENSO warm phase,
-        respectively.
+    Returns
+    -------
+    components : dict
+        "trend", "seasonal", "fitted" (trend + seasonal) and "filled" (the
+        series with the gaps filled by the fit), with the type and shape of
+        y, and "coefficients" (intercept, slope by year, and the sine and
+        cosine of every harmonic) with shape (coefficients, series). The
+        series with less valid values than coefficients are NaN.
+    """
+    frame = y if isinstance(y, (pd.Series, pd.DataFrame)) else None
 
-    ENSO_scale : float = 0.05
-        Scale to plot the stripes.
+    if frame is not None:
+        times = frame.index.values
 
-    titles : dict[str, str] | None = None
-        Custom titles for the time series.
+    values = np.asarray(y, dtype="float64")
+    shape = values.shape
+    values = values.reshape(shape[0], -1)
 
-    Returns
-    -------
-    fig : matplotlib.figure.Figure
-        Figure with the TS components.
+    x = harmonic_design(decimal_years(times), harmonics)
+    n_times, k = x.shape
 
-    """
-    # Dictionary to store decomposed dataframes
-    decomposed_data = {}
+    valid = np.isfinite(values)
+    coefficients = np.full((k, values.shape[1]), np.nan)
 
-    # For all variabels in the dataframe extract all the TS components
-    # and save it in the dictinary
-    for variable in data.columns:
-        try:
-            components = seasonal_decompose(data[variable], extrapolate_trend="freq")
-        except:
+    # Group the series by their pattern of valid dates, the series with
+    # less valid dates than coefficients keep NaN
+    _, group, sizes = np.unique(
+        np.packbits(valid, axis=0).T, axis=0, return_inverse=True, return_counts=True
+    )
+    group = group.ravel()
+    enough = valid.sum(axis=0) >= k
+
+    shared = enough & (sizes[group] > 1)
+    unique = np.flatnonzero(enough & (sizes[group] == 1))
+
+    # One pseudo-inverse for all the series of every shared pattern
+    order = np.flatnonzero(shared)[np.argsort(group[shared], kind="stable")]
+
+    for columns in np.split(order, np.flatnonzero(np.diff(group[order])) + 1):
+        if len(columns) == 0:
             continue
 
-        decomposed_data[variable] = pd.DataFrame(
-            {
-                "Observed": components.observed,
-                "Trend": components.trend,
-                "Detrended": components.observed - components.trend,
-                "Seasonal": components.seasonal,
-                "Anomalies": components.resid,
-            }
-        )
-
-    # Get the variables to iterate them
-    variables = [k for k in decomposed_data.keys()]
-
-    # Create the figure and the axes
-    fig, axs = plt.subplots(figsize=figsize, nrows=5, ncols=len(variables), sharex=True)
-
-    # Iterate trought variables to plot them by column
-    for i, variable in enumerate(variables):
-        # Get the components
-        components = decomposed_data[variable].columns
-
-        # Iterate the components to plot the by row
-        for j, component in enumerate(components):
-            x = decomposed_data[variable].index
-            y = decomposed_data[variable][component]
-
-            # Plot ENSO Stripes if ENSO is an array
-            try:
-                ENSO.any()
-            except:
-                continue
-            else:
-                # Plot La Niña ENSO Phase stripes
-                axs[j, i].fill_between(
-                    x,
-                    np.min(y) - ENSO_scale * np.max(y),
-                    np.max(y) + ENSO_scale * np.max(y),
-                    where=ENSO == ENSO_keys[0],
-                    color="blue",
-                    alpha=0.2,
-                )
-
-                # Plot El Niño ENSO Phase stripes
-                axs[j, i].fill_between(
-                    x,
-                    np.min(y) - ENSO_scale * np.max(y),
-                    np.max(y) + ENSO_scale * np.max(y),
-                    where=ENSO == ENSO_keys[1],
-                    color="red",
-                    alpha=0.2,
-                )
-
-            # Plot data
-            axs[j, i].plot(x, y, color="black", lw=0.5)
-
-            # In the first row add the variable title
-            if j == 0:
-                if titles != None:
-                    axs[j, i].set_title(titles[variable], fontsize=8)
-                else:
-                    axs[j, i].set_title(variable, fontsize=8)
-
-            # In the first column add the component in the label
-            if i == 0:
-                axs[j, i].set_ylabel(component)
-
-            # In the last row add the time label
-            if j == 4:
-                axs[j, i].set_xlabel("Time [Y]")
-
-            # Set the x-ticks to multiples of 5 years and the minor ticks to 1 year
-            axs[j, i].xaxis.set_major_locator(YearLocator(5))
-            axs[j, i].xaxis.set_minor_locator(YearLocator(1))
-
-    # Align all the y-labels in the first column
-    fig.align_ylabels(axs[:, 0])
-
-    return fig
-
-
-def plot_acf_ccf(
-    data: dict[str, npt.ArrayLike],
-    ci: float,
-    ylims: Sequence[float] = [-1, 1],
-    titles: dict[str, str] | None = None,
-) -> Figure:
-    """
-    Function to plot ACF and CCF data previously calculated.
+        rows = valid[:, columns[0]]
+        coefficients[:, columns] = np.linalg.pinv(x[rows]) @ values[np.ix_(rows, columns)]
 
-    Paramters
-    ---------
-    data : dict[str, numpy.ndarray]
-        Dictinary with autocorrelation or cross-correlation data
+    # Normal equations of the series with a unique pattern, all at once
+    if len(unique):
+        w = valid[:, unique].astype("float64")
+        y0 = np.where(valid[:, unique], values[:, unique], 0.0)
 
-    ci : float
-        Confidence interval of correlation.
+        gram = (w.T @ (x[:, :, None] * x[:, None, :]).reshape(n_times, -1)).reshape(-1, k, k)
+        xy = (y0.T @ x)[:, :, None]
 
-    ylims :  Sequence[bottom, top] = [-1, 1]
-        Limits of correlation for the plot.
+        try:
+            coefficients[:, unique] = np.linalg.solve(gram, xy)[:, :, 0].T
+        except np.linalg.LinAlgError:
+            coefficients[:, unique] = (np.linalg.pinv(gram) @ xy)[:, :, 0].T
 
-    titles : dict[str, str] | None = None
-        Custom titles for the plots.
+    trend = x[:, :2] @ coefficients[:2]
+    seasonal = x[:, 2:] @ coefficients[2:]
+    fitted = trend + seasonal
+    filled = np.where(valid, values, fitted)
 
-    Returns
-    -------
-    fig : matplotlib.figure.Figure
-        Figure with the correlations plots.
+    components = {"trend": trend, "seasonal": seasonal, "fitted": fitted, "filled": filled}
 
-    """
-    # Get the correlation tests from the data
-    tests = [t for t in data.keys()]
-    # Get how many there are to define the figure dimensions
-    n = len(tests)
-
-    # Show error if ylims is list don't have two elements
-    if len(ylims) != 2:
-        Exception("ylims must have lenght of 2")
-
-    # Create the figure and GridSpec for axes
-    fig = plt.figure()
-    grs = GridSpec(nrows=2, ncols=2, figure=fig)
-
-    # Define the figures axes based on n, where n more than 4 show error
-    match n:
-        case 1:
-            axs = [fig.add_subplot(grs[:, :])]
-            axs[0].set(xlabel="Lags [months]", ylabel="Correlation")
-        case 2:
-            axs = [fig.add_subplot(grs[0, :]), fig.add_subplot(grs[1, :])]
-            axs[0].set(ylabel="Correlation")
-            axs[1].set(xlabel="Lags [months]", ylabel="Correlation")
-        case 3:
-            axs = [
-                fig.add_subplot(grs[0, 0]),
-                fig.add_subplot(grs[1, :]),
-                fig.add_subplot(grs[0, 1]),
-            ]
-            axs[0].set(ylabel="Correlation")
-            axs[1].set(xlabel="Lags [months]", ylabel="Correlation")
-
-        case 4:
-            axs = [
-                fig.add_subplot(grs[0, 0]),
-                fig.add_subplot(grs[1, 0]),
-                fig.add_subplot(grs[0, 1]),
-                fig.add_subplot(grs[1, 1]),
-            ]
-            axs[0].set(ylabel="Correlation")
-            axs[1].set(xlabel="Lags [months]", ylabel="Correlation")
-            axs[3].set(xlabel="Lags [months]")
-
-        case _:
-            Exception("data must have a lenght lower or equal than 4")
-
-    # For loop to plot ACF o CCF by variable
-    for i, (test, ax) in enumerate(zip(tests, axs)):
-        # Plot correlation data as stem
-        ax.stem(data[test], basefmt=" ", markerfmt=" ")
-
-        # Add a line at 0 and the confidence intervals
-        ax.axhline(0, color="black")
-        ax.axhline(ci, color="black", linestyle="--")
-        ax.axhline(-ci, color="black", linestyle="--")
-
-        # If there are custon titles add them to the plot, else
-        # use the  default titles
-        if titles != None:
-            ax.set_title(titles[test], fontsize=8)
-        else:
-            ax.set_title(test, fontsize=8)
-
-        # Set ylims and ticks
-        ax.set_ylim(bottom=ylims[0], top=ylims[1])
-        ax.xaxis.set_major_locator(MultipleLocator(4))
-        ax.xaxis.set_minor_locator(MultipleLocator(1))
-
-    # Share all x and y axis
-    axs[0].get_shared_x_axes().join(*axs)
-    axs[0].get_shared_y_axes().join(*axs)
-
-    return fig
-
-
-def plot_corr_matrix(
+    # Back to the type and shape of the input
+    for name, component in components.items():
+        component = component.reshape(shape)
+
+        if isinstance(frame, pd.Series):
+            component = pd.Series(component, index=frame.index, name=frame.name)
+        elif isinstance(frame, pd.DataFrame):
+            component = pd.DataFrame(component, index=frame.index, columns=frame.columns)
+
+        components[name] = component
+
+    components["coefficients"] = coefficients
+
+    return components
+
+
+@traced
+def corr_matrix(
     data: pd.DataFrame,
     variables: npt.ArrayLike | None = None,
     half: bool = False,
     hide_insignificants: bool = False,
     singificant_threshold: float = 0.05,
-    show_labels: bool = True,
-    show_colorbar: bool = False,
-    palette: str = "Spectral",
-    text_color: str = "black",
-) -> Figure:
+) -> pd.DataFrame:
     """
     Calculate the pearson correlation matrix of the variables in a dataframe.
 
@@ -463,83 +353,57 @@ def plot_corr_matrix(
     siginificant_threshold : float = 0.05
         Threshold of significant correlation.
 
-    show_labels : bool = True
-        Show the correlation value.
-
-    show_colorbar : bool = False
-        Show colorbar.
-
-    palette : str = Spectral
-        Color palette for correlation plot.
-
-    text_color : str = black
-        Color of text correlation labels.
-
     returns
     -------
     corr : pd.DataFrame
         Dataframe with the correlation values.
 
     """
+    from scipy.stats import pearsonr
 
-    # If variables are not defined get all columns from data
     if variables == None:
         variables = data.columns
 
-    # Get the number of variables
+    reverse = variables[::-1]
+
     N = len(variables)
 
-    # Reverse variables for plot
-    reverse = variables[::-1]
+    corr = np.empty((N, N))
+    pval = np.full((N, N), np.nan)
+    mask = np.full((N, N), np.nan)
 
-    # Get the correlation matrix
-    corr = corr_matrix(
-        data, variables, half, hide_insignificants, singificant_threshold
-    )
+    for i, iv in enumerate(variables):
+        for j, jv in enumerate(reverse):
+            c, p = pearsonr(data[iv], data[jv])
+            corr[j, i] = c
 
-    if show_colorbar:
-        fs = (4, 3)
-    else:
-        fs = (3, 3)
+            if p <= singificant_threshold:
+                pval[j, i] = 1.0
 
-    # Create the figure and the axes
-    fig = plt.figure(figsize=fs)
-    ax1 = plt.subplot(1, 1, 1)
+        mask[: N - i, i] = 1.0
 
-    # Plot matrix with pcolormesh
-    im1 = ax1.pcolormesh(
-        variables, reverse, corr, cmap=palette, edgecolor="w", vmin=-1, vmax=1
-    )
+    if half:
+        corr *= mask
+
+    if hide_insignificants:
+        corr *= pval
+
+    corr = pd.DataFrame(data=corr, index=reverse, columns=variables)
+
+    return corr
+
+
+# %% Plots moved to functions.stat_plots
+_PLOTS = ("plot_ts_components", "plot_acf_ccf", "plot_corr_matrix")
+
+
+def __getattr__(name: str):
+    """
+    Import the plots from functions.stat_plots only when they are requested,
+    to keep working the scripts that import them from this module.
+    """
+    if name in _PLOTS:
+        module = importlib.import_module("functions.stat_plots")
+        return getattr(module, name)
 
-    # Invert y axis
-    ax1.invert_yaxis()
-
-    # Add the colorbar
-    if show_colorbar:
-        cax = ax1.inset_axes([1.04, 0.1, 0.05, 0.8])
-        bar = plt.colorbar(im1, cax=cax, label="Correlation")
-
-    if show_labels:
-        x, y = np.meshgrid(np.arange(N), np.arange(N))
-        x = x.reshape(-1)
-        y = y.reshape(-1)
-        t = corr.values.reshape(-1)
-
-        for xi, yi, ti in zip(x, y, t):
-            if np.isfinite(ti):
-                ax1.text(
-                    xi,
-                    yi,
-                    round(ti, 2),
-                    color=text_color,
-                    size=8,
-                    ha="center",
-                    va="center",
-                )
-
-    # Rotate labels to improve their readability
-    ax1.set_xticklabels(variables, rotation=30)
-    ax1.xaxis.set_minor_locator(NullLocator())
-    ax1.yaxis.set_minor_locator(NullLocator())
-
-    return fig
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
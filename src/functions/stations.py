@@ -0,0 +1,178 @@
+# %% Dependencies imports
+import os
+import pickle
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from functions.geometries import shapefile_stamp
+
+# %% Typing imports
+import numpy.typing as npt
+from typing import Sequence
+
+# %% Functions
+def build_station_index(
+    stations_path: str,
+    epsg: int = 32618,
+    cache_path: str = "data/processed/cache",
+) -> tuple[gpd.GeoDataFrame, shapely.STRtree]:
+    """
+    Function to load the gauge stations reprojected to a metric CRS and
+    build a STRtree spatial index over them.
+
+    The stations and the index are saved in a cache and reused until the
+    stations file or any of its sidecar files (.dbf, .prj, ...) changes.
+
+    Parameters
+    ----------
+    stations_path : str
+        Path of the stations file (e.g. CNE_IDEAM.shp).
+
+    epsg : int = 32618
+        EPSG code of the metric CRS to measure the distances.
+
+    cache_path : str = "data/processed/cache"
+        Folder to save the index.
+
+    Returns
+    -------
+    stations : geopandas.GeoDataFrame
+        Stations reprojected, in the same order of the index.
+
+    tree : shapely.STRtree
+        Spatial index over the stations geometries.
+    """
+    name = os.path.splitext(os.path.basename(stations_path))[0]
+    stamp = shapefile_stamp(stations_path)
+    index_path = os.path.join(cache_path, f"{name}_{epsg}_index.pkl")
+
+    # Reuse the index if it was built from the same file
+    if os.path.exists(index_path):
+        with open(index_path, "rb") as f:
+            cached = pickle.load(f)
+
+        if cached["stamp"] == stamp:
+            return cached["stations"], cached["tree"]
+
+    stations = gpd.read_file(stations_path).to_crs(epsg=epsg).reset_index(drop=True)
+    tree = shapely.STRtree(stations.geometry.values)
+
+    os.makedirs(cache_path, exist_ok=True)
+    with open(index_path, "wb") as f:
+        pickle.dump({"stamp": stamp, "stations": stations, "tree": tree}, f)
+
+    return stations, tree
+
+
+def _pairs(
+    geoms: npt.NDArray, stations: gpd.GeoDataFrame, tree: shapely.STRtree,
+    distance: float, allowed: npt.NDArray,
+) -> pd.DataFrame:
+    """
+    Query all the pairs (geometry, station) closer than a distance.
+    """
+    i, j = tree.query(geoms, predicate="dwithin", distance=distance)
+
+    keep = allowed[j]
+    i, j = i[keep], j[keep]
+
+    return pd.DataFrame({
+        "geom": i,
+        "station": j,
+        "distance": shapely.distance(geoms[i], stations.geometry.values[j]),
+    })
+
+
+def query_stations(
+    forests: gpd.GeoDataFrame,
+    stations: gpd.GeoDataFrame,
+    tree: shapely.STRtree,
+    k: int | None = None,
+    radius: float | None = None,
+    categories: Sequence[str] | None = None,
+    category_column: str = "CATEGORIA",
+    key_column: str = "key",
+) -> gpd.GeoDataFrame:
+    """
+    Function to find the stations near every forest in batch, the k nearest,
+    the ones inside a radius or the k nearest inside a radius.
+
+    Parameters
+    ----------
+    forests : geopandas.GeoDataFrame
+        Forests (or any polygons) in the CRS of the stations.
+
+    stations : geopandas.GeoDataFrame
+        Stations from build_station_index().
+
+    tree : shapely.STRtree
+        Index from build_station_index().
+
+    k : int | None = None
+        Number of nearest stations by forest. By default all inside the radius.
+
+    radius : float | None = None
+        Maximum distance to the forests in the units of the CRS. By default
+        there is no limit, so k must be defined.
+
+    categories : Sequence[str] | None = None
+        Categories of stations of interest. By default all.
+
+    category_column : str = "CATEGORIA"
+        Column of the stations with the category.
+
+    key_column : str = "key"
+        Column of the forests with their key.
+
+    Returns
+    -------
+    selected : geopandas.GeoDataFrame
+        One row by forest and station with the stations attributes, the key
+        of the forest, the distance to the forest and the rank by distance.
+    """
+    if k is None and radius is None:
+        raise ValueError("k or radius must be defined")
+
+    geoms = forests.geometry.values
+
+    # Stations of the categories of interest
+    if categories is None:
+        allowed = np.ones(len(stations), dtype=bool)
+    else:
+        allowed = stations[category_column].isin(categories).values
+
+    if radius is not None:
+        pairs = _pairs(geoms, stations, tree, radius, allowed)
+
+    # Without radius, search in a growing distance until every forest has k
+    # stations or the distance covers all the stations
+    else:
+        bounds = np.vstack([stations.total_bounds, forests.total_bounds])
+        limit = np.hypot(*(bounds[:, 2:].max(axis=0) - bounds[:, :2].min(axis=0)))
+        distance = limit / 64
+
+        while True:
+            pairs = _pairs(geoms, stations, tree, distance, allowed)
+            counts = pairs.groupby("geom").size().reindex(range(len(geoms)), fill_value=0)
+
+            if (counts >= min(k, allowed.sum())).all() or distance >= limit:
+                break
+
+            distance *= 2
+
+    # Rank the stations by distance to every forest and keep the k nearest
+    pairs = pairs.sort_values(["geom", "distance"])
+    pairs["rank"] = pairs.groupby("geom").cumcount() + 1
+
+    if k is not None:
+        pairs = pairs[pairs["rank"] <= k]
+
+    # Join the stations attributes with the forests keys
+    selected = stations.iloc[pairs.station.values].copy()
+    selected[key_column] = forests[key_column].values[pairs.geom.values]
+    selected["distance"] = pairs.distance.values
+    selected["rank"] = pairs["rank"].values
+
+    return selected.reset_index(drop=True)
@@ -0,0 +1,226 @@
+# %% Dependencies imports
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from functions.telemetry import span
+
+# %% Typing imports
+from typing import Any, Sequence
+
+# %% Constants
+# Categories of the ENSO phases
+ENSO_PHASES = ["Nina", "Neutral", "Nino"]
+
+# Schema of the tables handed between the stages, the lagoons take their
+# categories from the data. The NDVI and the pixel percentage don't need
+# more precision than float32, the measures not defined here (the gauges,
+# the temperature and the SOI) are saved as float64 to keep the models
+SCHEMA = {
+    "Time": "datetime64[ns]",
+    "Lagoon": "category",
+    "ENSO": pd.CategoricalDtype(ENSO_PHASES),
+    "NDVI": "float32",
+    "PixelPercentage": "float32",
+}
+
+# Rows by row group, small groups let the readers skip more data
+ROW_GROUP_SIZE = 4096
+
+# CRS of the cubes and the maps of the sites
+CRS = "EPSG:4326"
+
+
+# %% Functions
+def apply_schema(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Function to cast a dataframe to the schema of the intermediate tables:
+    datetime64 Time, categorical Lagoon and ENSO, float32 NDVI and pixel
+    percentage and float64 for the other measures.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Dataframe with a Time and a Lagoon column.
+
+    Returns
+    -------
+    data : pd.DataFrame
+        Dataframe casted, sorted by lagoon and time and without index.
+    """
+    data = data.copy()
+
+    for column in data.columns:
+        if column in SCHEMA:
+            data[column] = data[column].astype(SCHEMA[column])
+        elif pd.api.types.is_numeric_dtype(data[column]):
+            data[column] = data[column].astype("float64")
+
+    # Sort the rows so the statistics of the row groups allow to skip them
+    # when the data is filtered by lagoon and time
+    data = data.sort_values(["Lagoon", "Time"]).reset_index(drop=True)
+
+    return data
+
+
+def write_table(data: pd.DataFrame, path: str) -> None:
+    """
+    Function to save a dataframe as a Parquet table with the schema of the
+    intermediate tables.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Dataframe with a Time and a Lagoon column.
+
+    path : str
+        Path of the Parquet file.
+    """
+    table = pa.Table.from_pandas(apply_schema(data), preserve_index=False)
+
+    pq.write_table(table, path, row_group_size=ROW_GROUP_SIZE, compression="zstd")
+
+
+def read_table(
+    path: str,
+    columns: Sequence[str] | None = None,
+    lagoons: Sequence[str] | None = None,
+    start: str | np.datetime64 | None = None,
+    end: str | np.datetime64 | None = None,
+) -> pd.DataFrame:
+    """
+    Function to read a Parquet table of the intermediate data, only with the
+    columns and the rows of interest.
+
+    The file is memory mapped and the filters are pushed down to the reader,
+    so the row groups outside the lagoons and the time range are not read.
+
+    Parameters
+    ----------
+    path : str
+        Path of the Parquet file.
+
+    columns : Sequence[str] | None = None
+        Columns of interest, Time and Lagoon are always read. By default all.
+
+    lagoons : Sequence[str] | None = None
+        Lagoons of interest. By default all.
+
+    start : str | numpy.datetime64 | None = None
+        First date of interest.
+
+    end : str | numpy.datetime64 | None = None
+        Date after the last date of interest.
+
+    Returns
+    -------
+    data : pd.DataFrame
+        Dataframe with the columns and rows of interest.
+    """
+    if columns is not None:
+        columns = ["Time", "Lagoon"] + [c for c in columns if c not in ("Time", "Lagoon")]
+
+    # Define the filters to push down to the reader
+    filters = []
+    if lagoons is not None:
+        filters.append(("Lagoon", "in", list(lagoons)))
+    if start is not None:
+        filters.append(("Time", ">=", pd.Timestamp(start)))
+    if end is not None:
+        filters.append(("Time", "<", pd.Timestamp(end)))
+
+    table = pq.read_table(
+        path, columns=columns, filters=filters or None, memory_map=True
+    )
+
+    data = table.to_pandas()
+
+    # Remove the categories of the lagoons filtered out
+    data["Lagoon"] = data["Lagoon"].cat.remove_unused_categories()
+
+    return data
+
+
+def save_netcdf(data, path: str, attrs: dict[str, Any] | None = None, site: str | None = None) -> str:
+    """
+    Function to save a cube or the maps of a site as a NetCDF file, with the
+    CRS and the spatial dimensions of the cubes.
+
+    Parameters
+    ----------
+    data : xarray.Dataset
+        Dataset with the latitude and longitude dimensions.
+
+    path : str
+        Path of the NetCDF file.
+
+    attrs : dict[str, Any] | None = None
+        Attributes added to the dataset, e.g. its description and units.
+
+    site : str | None = None
+        Key of the site, for the trace.
+
+    Returns
+    -------
+    path : str
+        Path of the NetCDF file.
+    """
+    # Only the stages that save cubes need rioxarray, it registers .rio
+    import rioxarray
+
+    data = data.rio.write_crs(CRS)
+    data = data.rio.set_spatial_dims(x_dim="longitude", y_dim="latitude")
+    data.attrs.update(attrs or {})
+
+    with span("save netcdf", site=site):
+        data.to_netcdf(path)
+
+    return path
+
+
+def write_maps(
+    maps: dict[str, Any],
+    like,
+    path: str,
+    attrs: dict[str, Any] | None = None,
+    site: str | None = None,
+) -> str:
+    """
+    Function to save the maps of a site as a NetCDF file with the
+    coordinates and the CRS of its cube.
+
+    Parameters
+    ----------
+    maps : dict[str, Any]
+        Maps by name, as arrays with shape (latitude, longitude) that are
+        saved as float32, or as (dims, values) for other variables.
+
+    like : xarray.Dataset
+        Cube of the site, the coordinates of the dimensions of the maps are
+        taken from it.
+
+    path : str
+        Path of the NetCDF file.
+
+    attrs : dict[str, Any] | None = None
+        Attributes of the dataset.
+
+    site : str | None = None
+        Key of the site, for the trace.
+
+    Returns
+    -------
+    path : str
+        Path of the NetCDF file.
+    """
+    import xarray
+
+    variables = {
+        name: values if isinstance(values, tuple) else (("latitude", "longitude"), np.asarray(values, dtype=np.float32))
+        for name, values in maps.items()
+    }
+    dims = {dim for dims, _ in variables.values() for dim in dims}
+    coords = {dim: like[dim] for dim in like.coords if dim in dims}
+
+    return save_netcdf(xarray.Dataset(variables, coords=coords), path, attrs, site)
@@ -0,0 +1,340 @@
+# %% Dependencies imports
+import os
+import numpy as np
+import pandas as pd
+import rasterio
+import shapely
+from shapely import affinity
+from rasterio.transform import from_bounds
+
+# %% Typing imports
+import numpy.typing as npt
+
+# %% Constants
+# Value used by 2_download_rasters.py to unmask the images
+NODATA = -3e5
+
+
+# %% Functions
+def _seasonal_signal(
+    n_months: int, rng: np.random.Generator, amplitude: float, trend: float, noise: float,
+) -> npt.NDArray:
+    """
+    Monthly signal with an annual cycle of random phase, a linear trend and
+    gaussian noise.
+    """
+    t = np.arange(n_months)
+    phase = rng.uniform(0, 2 * np.pi)
+
+    return (
+        amplitude * np.sin(2 * np.pi * t / 12 + phase)
+        + trend * t / 12
+        + rng.normal(0, noise, n_months)
+    )
+
+
+def _gaps(n: int, rng: np.random.Generator, gap_fraction: float, max_gap: int) -> npt.NDArray:
+    """
+    Mask with runs of missing values of random length until the fraction of
+    gaps is reached.
+    """
+    mask = np.zeros(n, dtype=bool)
+
+    while mask.mean() < gap_fraction:
+        start = rng.integers(0, n)
+        mask[start:start + rng.integers(1, max_gap + 1)] = True
+
+    return mask
+
+
+def synthetic_series(
+    n_months: int = 312,
+    start: str = "1996-01-01",
+    gap_fraction: float = 0.1,
+    max_gap: int = 3,
+    seed: int = 0,
+) -> pd.Series:
+    """
+    Function to create a monthly series with seasonality, trend, noise and
+    runs of missing values, like the precipitation of the gauges.
+
+    Parameters
+    ----------
+    n_months : int = 312
+        Length of the series, by default 1996 to 2021.
+
+    start : str = "1996-01-01"
+        First month of the series.
+
+    gap_fraction : float = 0.1
+        Fraction of missing values.
+
+    max_gap : int = 3
+        Maximum length of a run of missing values in months.
+
+    seed : int = 0
+        Seed of the random generator, the same seed creates the same series.
+
+    Returns
+    -------
+    series : pd.Series
+        Series indexed by the first day of every month.
+    """
+    rng = np.random.default_rng(seed)
+
+    values = 100 + _seasonal_signal(n_months, rng, 60, 1.0, 15)
+    values[_gaps(n_months, rng, gap_fraction, max_gap)] = np.nan
+
+    time = pd.date_range(start, periods=n_months, freq="MS", name="Time")
+
+    return pd.Series(values, index=time, name="Precipitation")
+
+
+def synthetic_table(
+    n_months: int = 312,
+    n_variables: int = 4,
+    start: str = "1996-01-01",
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Function to create a table of monthly variables with seasonality, trend
+    and noise, without missing values, like the detrended data by lagoon.
+
+    Parameters
+    ----------
+    n_months : int = 312
+        Length of the series.
+
+    n_variables : int = 4
+        Number of variables (columns).
+
+    start : str = "1996-01-01"
+        First month of the series.
+
+    seed : int = 0
+        Seed of the random generator.
+
+    Returns
+    -------
+    table : pd.DataFrame
+        Variables named Variable0, Variable1, ... indexed by month.
+    """
+    rng = np.random.default_rng(seed)
+    time = pd.date_range(start, periods=n_months, freq="MS", name="Time")
+
+    # Every variable shares part of a common signal, so they are correlated
+    common = _seasonal_signal(n_months, rng, 1.0, 0.0, 0.2)
+    table = {
+        f"Variable{i}": rng.uniform(0.2, 1.0) * common + _seasonal_signal(n_months, rng, 1.0, 0.05, 0.5)
+        for i in range(n_variables)
+    }
+
+    return pd.DataFrame(table, index=time)
+
+
+def synthetic_cube(
+    n_times: int = 312,
+    ny: int = 128,
+    nx: int = 128,
+    cloud_fraction: float = 0.2,
+    seed: int = 0,
+) -> tuple[npt.NDArray, npt.NDArray]:
+    """
+    Function to create (time, y, x) cubes of NDVI and surface temperature
+    with an annual cycle and pixels masked with the nodata value.
+
+    Parameters
+    ----------
+    n_times : int = 312
+        Number of monthly images.
+
+    ny, nx : int = 128
+        Size of the images in pixels.
+
+    cloud_fraction : float = 0.2
+        Fraction of pixels masked with the nodata value in every image.
+
+    seed : int = 0
+        Seed of the random generator.
+
+    Returns
+    -------
+    ndvi : numpy.ndarray
+        NDVI cube.
+
+    temperature : numpy.ndarray
+        Surface temperature cube in Kelvin.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Annual cycle shared by all pixels and a fixed spatial pattern
+    cycle = np.sin(2 * np.pi * np.arange(n_times) / 12)[:, None, None]
+    pattern = rng.uniform(0.2, 0.8, (1, ny, nx))
+
+    ndvi = pattern + 0.1 * cycle + rng.normal(0, 0.05, (n_times, ny, nx))
+    temperature = 305 + 4 * cycle - 6 * pattern + rng.normal(0, 1, (n_times, ny, nx))
+
+    clouds = rng.random((n_times, ny, nx)) < cloud_fraction
+    ndvi[clouds] = NODATA
+    temperature[clouds] = NODATA
+
+    return ndvi, temperature
+
+
+def write_scenes(
+    folder: str,
+    ndvi: npt.NDArray,
+    temperature: npt.NDArray,
+    start: str = "1996-01-01",
+    bounds: tuple[float, float, float, float] = (-74.92, 11.02, -74.82, 11.07),
+    seed: int = 0,
+) -> list[str]:
+    """
+    Function to write cubes as monthly GeoTIFFs with the layout of
+    2_download_rasters.py: bands BLUE, GREEN, RED, NIR, TEMPERATURE and NDVI,
+    the nodata value -3e5 and names YYYY-MM-DD.tif.
+
+    Parameters
+    ----------
+    folder : str
+        Folder to save the images.
+
+    ndvi, temperature : numpy.ndarray
+        Cubes (time, y, x) from synthetic_cube().
+
+    start : str = "1996-01-01"
+        Month of the first image.
+
+    bounds : tuple[west, south, east, north]
+        Extent of the images in EPSG:4326.
+
+    seed : int = 0
+        Seed of the random generator of the reflectances.
+
+    Returns
+    -------
+    paths : list[str]
+        Paths of the images.
+    """
+    rng = np.random.default_rng(seed)
+    n_times, ny, nx = ndvi.shape
+
+    profile = {
+        "driver": "GTiff", "width": nx, "height": ny, "count": 6,
+        "dtype": "float64", "crs": "EPSG:4326", "nodata": NODATA,
+        "transform": from_bounds(*bounds, nx, ny),
+    }
+
+    os.makedirs(folder, exist_ok=True)
+    dates = pd.date_range(start, periods=n_times, freq="MS")
+    paths = []
+
+    for i, date in enumerate(dates):
+        # Reflectances masked where the NDVI is masked
+        reflectances = rng.uniform(0.0, 0.3, (4, ny, nx))
+        reflectances[:, ndvi[i] == NODATA] = NODATA
+
+        path = os.path.join(folder, f"{date:%Y-%m-%d}.tif")
+
+        with rasterio.open(path, "w", **profile) as dst:
+            dst.write(reflectances, [1, 2, 3, 4])
+            dst.write(temperature[i], 5)
+            dst.write(ndvi[i], 6)
+
+        paths.append(path)
+
+    return paths
+
+
+def _clouds(
+    n_times: int, ny: int, nx: int, cloud_fraction: float, rng: np.random.Generator, cell: int = 8,
+) -> npt.NDArray:
+    """
+    Mask of clouds as blobs of cells of pixels, the fraction covered changes
+    from image to image around the cloud fraction.
+    """
+    coarse = rng.random((n_times, -(-ny // cell), -(-nx // cell)))
+    field = np.repeat(np.repeat(coarse, cell, axis=1), cell, axis=2)[:, :ny, :nx]
+
+    fractions = np.clip(rng.uniform(0, 2 * cloud_fraction, n_times), 0, 1)
+
+    return field < fractions[:, None, None]
+
+
+def synthetic_site(
+    folder: str,
+    bounds: tuple[float, float, float, float] = (-74.92, 11.02, -74.82, 11.07),
+    years: tuple[int, int] = (1996, 2021),
+    size: int = 128,
+    cloud_fraction: float = 0.3,
+    amplitude: float = 0.1,
+    seed: int = 0,
+) -> shapely.Polygon:
+    """
+    Function to write the monthly images of a synthetic site with the layout
+    of 2_download_rasters.py, and get the forest polygon that matches them.
+
+    The forest is an ellipse in the centre of the extent with a high NDVI
+    and a seasonal cycle, outside the forest the NDVI is low and the
+    surface is warmer.
+
+    Parameters
+    ----------
+    folder : str
+        Folder to save the images (e.g. data/raster/{key}/).
+
+    bounds : tuple[west, south, east, north]
+        Extent of the images in EPSG:4326.
+
+    years : tuple[int, int] = (1996, 2021)
+        First and last year of the images.
+
+    size : int = 128
+        Width of the images in pixels, the height keeps the aspect of the extent.
+
+    cloud_fraction : float = 0.3
+        Mean fraction of every image masked by clouds.
+
+    amplitude : float = 0.1
+        Amplitude of the seasonal cycle of the NDVI in the forest.
+
+    seed : int = 0
+        Seed of the random generator.
+
+    Returns
+    -------
+    forest : shapely.Polygon
+        Forest polygon in EPSG:4326.
+    """
+    rng = np.random.default_rng(seed)
+
+    west, south, east, north = bounds
+    nx = size
+    ny = max(1, round(size * (north - south) / (east - west)))
+    n_times = 12 * (years[1] - years[0] + 1)
+
+    # Forest as an ellipse that covers the centre of the extent
+    centre = shapely.Point((west + east) / 2, (south + north) / 2)
+    forest = affinity.scale(centre.buffer(1.0, 64), 0.35 * (east - west), 0.35 * (north - south))
+
+    # Pixels of the forest
+    x = west + (np.arange(nx) + 0.5) * (east - west) / nx
+    y = north - (np.arange(ny) + 0.5) * (north - south) / ny
+    inside = shapely.contains_xy(forest, *np.meshgrid(x, y))[None, :, :]
+
+    # Annual cycle with a random phase and a weak trend
+    t = np.arange(n_times)[:, None, None]
+    cycle = np.sin(2 * np.pi * t / 12 + rng.uniform(0, 2 * np.pi))
+    trend = 0.002 * t / 12
+
+    noise = rng.normal(0, 0.05, (n_times, ny, nx))
+    ndvi = np.where(inside, 0.7 + amplitude * cycle + trend, 0.1 + 0.02 * cycle) + noise
+    temperature = np.where(inside, 303.0, 309.0) + 3 * cycle + 20 * noise
+
+    clouds = _clouds(n_times, ny, nx, cloud_fraction, rng)
+    ndvi[clouds] = NODATA
+    temperature[clouds] = NODATA
+
+    write_scenes(folder, ndvi, temperature, f"{years[0]}-01-01", bounds, seed)
+
+    return forest
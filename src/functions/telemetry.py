@@ -0,0 +1,297 @@
+# %% Dependencies imports
+import os
+import json
+import time
+import atexit
+import functools
+import threading
+import contextlib
+import tracemalloc
+
+# resource only exists in Unix, without it the peak RSS isn't recorded
+try:
+    import resource
+except ModuleNotFoundError:
+    resource = None
+
+# %% Typing imports
+from typing import Any, Callable, Iterator
+
+# %% Constants
+# Environment variables to switch on the trace, they are inherited by the
+# stages run by run_pipeline.py and by the workers of the process pools
+TRACE_ENV = "PIPELINE_TRACE"
+MEMORY_ENV = "PIPELINE_TRACE_MEMORY"
+
+# Context manager returned by span() when the trace is off
+_NULL = contextlib.nullcontext()
+
+# State of the trace in this process, the spans open are tracked by thread
+_state = {"path": None, "memory": False, "events": []}
+_local = threading.local()
+_lock = threading.Lock()
+
+
+# %% Functions
+def enable(path: str, memory: bool = False, new: bool = False) -> None:
+    """
+    Function to switch on the trace of this process and of the processes it
+    starts.
+
+    The events are appended to a JSON file in the trace-event format, that
+    can be opened with chrome://tracing, Perfetto or speedscope.
+
+    Parameters
+    ----------
+    path : str
+        Path of the trace file, every process appends its events to it.
+
+    memory : bool = False
+        If True, trace the peak of memory allocated by every span with
+        tracemalloc (NumPy arrays included), it slows down the processing.
+
+    new : bool = False
+        If True, empty the trace file first, so it only has the events of
+        this run. Only the process that starts the run must do it, the
+        processes it starts append to the same file.
+    """
+    if new:
+        open(path, "w").close()
+
+    os.environ[TRACE_ENV] = path
+    os.environ[MEMORY_ENV] = "1" if memory else ""
+
+    _state["path"] = path
+    _state["memory"] = memory
+
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def enabled() -> bool:
+    """
+    Function to know if the trace is on in this process.
+    """
+    return _state["path"] is not None
+
+
+def _usage() -> dict[str, float]:
+    """
+    Current CPU time, peak RSS and bytes read and written by this process.
+    """
+    usage = {"cpu_s": time.process_time()}
+
+    if resource is not None:
+        # ru_maxrss is in KiB in Linux
+        usage["max_rss_mib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    # Bytes read and written by the system calls, only in Linux
+    try:
+        with open("/proc/self/io") as f:
+            io = dict(line.split(": ") for line in f.read().splitlines())
+        usage["read_mib"] = int(io["rchar"]) / 2**20
+        usage["written_mib"] = int(io["wchar"]) / 2**20
+    except (OSError, KeyError, ValueError):
+        pass
+
+    return usage
+
+
+def _stack() -> list[dict]:
+    """
+    Spans open in this thread.
+    """
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+
+    return _local.stack
+
+
+def _flush() -> None:
+    """
+    Append the events of this process to the trace file.
+    """
+    with _lock:
+        events, _state["events"] = _state["events"], []
+
+    if not events or _state["path"] is None:
+        return
+
+    # The file is a JSON array without the closing bracket, the format
+    # allows it, so several processes can append their events to it
+    text = "".join(json.dumps(event) + ",\n" for event in events)
+
+    fd = os.open(_state["path"], os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+    try:
+        if os.fstat(fd).st_size == 0:
+            text = "[\n" + text
+        os.write(fd, text.encode())
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def _span(name: str, category: str, args: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    """
+    Record a complete event with the resources used inside the block.
+    """
+    before = _usage()
+    start = time.time_ns()
+
+    # Spans open in this thread, with the peak of memory of the spans inside.
+    # The peak of the outer span is kept before the reset
+    stack = _stack()
+
+    if _state["memory"]:
+        if stack:
+            outer = stack[-1]
+            outer["peak"] = max(outer["peak"], tracemalloc.get_traced_memory()[1])
+
+        tracemalloc.reset_peak()
+
+    # The peak is reported over the memory already allocated at the start
+    frame = {"peak": 0, "base": tracemalloc.get_traced_memory()[0] if _state["memory"] else 0}
+    stack.append(frame)
+
+    try:
+        yield args
+
+    finally:
+        end = time.time_ns()
+        after = _usage()
+
+        for key, value in after.items():
+            # The peak RSS is the value at the end, the others are differences
+            args[key] = round(value if key == "max_rss_mib" else value - before.get(key, 0.0), 3)
+
+        stack.pop()
+
+        # The peak of a span includes the peaks of the spans inside it
+        if _state["memory"]:
+            peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            args["alloc_peak_mib"] = round((peak - frame["base"]) / 2**20, 3)
+
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+
+            tracemalloc.reset_peak()
+
+        event = {
+            "name": name, "cat": category, "ph": "X",
+            "ts": start / 1e3, "dur": (end - start) / 1e3,
+            "pid": os.getpid(), "tid": threading.get_ident(), "args": args,
+        }
+
+        with _lock:
+            _state["events"].append(event)
+
+        # Save the events when the outer span ends, the workers of the
+        # process pools don't run the exit functions
+        if not stack:
+            _flush()
+
+
+def span(name: str, category: str = "phase", **args: Any) -> contextlib.AbstractContextManager:
+    """
+    Context manager to trace a phase of a stage: its wall time, CPU time,
+    peak RSS, bytes read and written and, if it is enabled, the peak of
+    memory allocated. It does nothing when the trace is off.
+
+    Parameters
+    ----------
+    name : str
+        Name of the phase.
+
+    category : str = "phase"
+        Category of the event, to filter them in the viewer.
+
+    **args : Any
+        Extra values saved with the event (e.g. the site).
+
+    Returns
+    -------
+    context : contextlib.AbstractContextManager
+        Context manager that yields the dictionary of values of the event,
+        to add values from inside the block.
+    """
+    if _state["path"] is None:
+        return _NULL
+
+    return _span(name, category, args)
+
+
+def traced(func: Callable | None = None, *, name: str | None = None, category: str = "function") -> Callable:
+    """
+    Decorator to trace every call of a function with span().
+
+    Parameters
+    ----------
+    func : Callable
+        Function to trace.
+
+    name : str | None = None
+        Name of the events, by default the name of the function.
+
+    category : str = "function"
+        Category of the events.
+    """
+    if func is None:
+        return functools.partial(traced, name=name, category=category)
+
+    label = name or func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _state["path"] is None:
+            return func(*args, **kwargs)
+
+        with _span(label, category, {}):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def record_array(name: str, array: Any) -> None:
+    """
+    Function to record the size of an array as a counter event, to follow
+    the size of the cubes in the viewer. It does nothing when the trace is off.
+
+    Parameters
+    ----------
+    name : str
+        Name of the array.
+
+    array : Any
+        Array with the nbytes attribute (NumPy, xarray).
+    """
+    if _state["path"] is None:
+        return
+
+    event = {
+        "name": name, "ph": "C", "ts": time.time_ns() / 1e3,
+        "pid": os.getpid(), "tid": threading.get_ident(),
+        "args": {"mib": round(array.nbytes / 2**20, 3)},
+    }
+
+    with _lock:
+        _state["events"].append(event)
+
+    if not _stack():
+        _flush()
+
+
+def load_trace(path: str) -> list[dict]:
+    """
+    Function to read the events of a trace file.
+    """
+    with open(path) as f:
+        text = f.read().rstrip().rstrip(",")
+
+    return json.loads(text + "]") if not text.endswith("]") else json.loads(text)
+
+
+# %% Switch on the trace if it was requested by the environment
+if os.environ.get(TRACE_ENV):
+    enable(os.environ[TRACE_ENV], bool(os.environ.get(MEMORY_ENV)))
+
+atexit.register(_flush)
@@ -0,0 +1,296 @@
+# %% Dependencies imports
+import warnings
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy import special, stats
+
+from functions.stat_utils import decimal_years
+
+# %% Typing imports
+import numpy.typing as npt
+from typing import Sequence
+
+# %% Constants
+# Methods of trend_maps() and the maps they produce
+METHODS = {
+    "ols": ["ols_slope", "ols_pvalue"],
+    "theil_sen": ["theil_sen_slope"],
+    "mann_kendall": ["mann_kendall_s", "mann_kendall_pvalue"],
+}
+
+
+# %% Functions
+def deseasonalize(y: npt.NDArray, times: npt.ArrayLike) -> npt.NDArray:
+    """
+    Function to remove the mean of every calendar month from the series of
+    every pixel.
+
+    Parameters
+    ----------
+    y : numpy.ndarray
+        Series with the time in the first axis and NaN where there is no data.
+
+    times : ArrayLike
+        Dates of the series.
+
+    Returns
+    -------
+    anomalies : numpy.ndarray
+        Series without the monthly climatology.
+    """
+    months = np.asarray(times, dtype="datetime64[M]").astype(int) % 12
+    anomalies = np.array(y, dtype="float64")
+
+    for month in np.unique(months):
+        rows = months == month
+
+        # Months without data keep NaN, without a warning
+        with np.errstate(invalid="ignore"):
+            counts = np.isfinite(y[rows]).sum(axis=0)
+            means = np.nansum(y[rows], axis=0) / np.where(counts > 0, counts, np.nan)
+
+        anomalies[rows] -= means
+
+    return anomalies
+
+
+def ols_trend(y: npt.NDArray, t: npt.NDArray) -> tuple[npt.NDArray, npt.NDArray]:
+    """
+    Function to fit a least squares line to the series of every pixel at
+    once, ignoring the missing values of every series.
+
+    Parameters
+    ----------
+    y : numpy.ndarray
+        Series with shape (time, pixels).
+
+    t : numpy.ndarray
+        Time of the series (e.g. decimal years).
+
+    Returns
+    -------
+    slope : numpy.ndarray
+        Slope by pixel in units of y by unit of t.
+
+    pvalue : numpy.ndarray
+        Two-sided p-value of the slope (t-test).
+    """
+    valid = np.isfinite(y)
+    n = valid.sum(axis=0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # Means of every pixel using only its valid dates
+        tm = (t[:, None] * valid).sum(axis=0) / n
+        ym = np.where(valid, y, 0.0).sum(axis=0) / n
+
+        dt = np.where(valid, t[:, None] - tm, 0.0)
+        dy = np.where(valid, y - ym, 0.0)
+
+        sxx = (dt ** 2).sum(axis=0)
+        slope = (dt * dy).sum(axis=0) / sxx
+
+        # Standard error of the slope from the residuals
+        residuals = np.where(valid, dy - slope * dt, 0.0)
+        se = np.sqrt((residuals ** 2).sum(axis=0) / (n - 2) / sxx)
+
+        pvalue = 2 * stats.t.sf(np.abs(slope / se), n - 2)
+
+    slope[n < 3] = np.nan
+    pvalue[n < 3] = np.nan
+
+    return slope, pvalue
+
+
+def pairwise_trend(
+    y: npt.NDArray, t: npt.NDArray, max_bytes: int = 2**27
+) -> tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+    """
+    Function to calculate the Theil-Sen slope and the Mann-Kendall test of
+    the series of every pixel, from the differences of all pairs of dates.
+
+    The pixels are processed in chunks, so the differences of a chunk use
+    less than max_bytes.
+
+    Parameters
+    ----------
+    y : numpy.ndarray
+        Series with shape (time, pixels), NaN where there is no data.
+
+    t : numpy.ndarray
+        Time of the series in increasing order (e.g. decimal years).
+
+    max_bytes : int = 128 MiB
+        Memory for the differences of the pairs of every chunk.
+
+    Returns
+    -------
+    slope : numpy.ndarray
+        Theil-Sen slope by pixel (median of the pairwise slopes).
+
+    s : numpy.ndarray
+        Mann-Kendall S statistic by pixel.
+
+    pvalue : numpy.ndarray
+        Two-sided p-value of the Mann-Kendall test, without ties correction.
+    """
+    n_times, n_pixels = y.shape
+    i, j = np.triu_indices(n_times, k=1)
+    dt = (t[j] - t[i])[:, None]
+
+    slope = np.full(n_pixels, np.nan)
+    s = np.full(n_pixels, np.nan)
+
+    chunk = max(1, int(max_bytes // (8 * len(i))))
+
+    for start in range(0, n_pixels, chunk):
+        block = y[:, start:start + chunk]
+        dy = block[j] - block[i]
+
+        # Pixels without pairs give an All-NaN slice warning
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            slope[start:start + chunk] = np.nanmedian(dy / dt, axis=0)
+
+        s[start:start + chunk] = np.nansum(np.sign(dy), axis=0)
+
+    # Variance of S without ties, with the number of valid dates by pixel
+    n = np.isfinite(y).sum(axis=0)
+    var = n * (n - 1) * (2 * n + 5) / 18
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = (s - np.sign(s)) / np.sqrt(var)
+        pvalue = special.erfc(np.abs(z) / np.sqrt(2))
+
+    s[n < 3] = np.nan
+    pvalue[n < 3] = np.nan
+
+    return slope, s, pvalue
+
+
+def trend_block(
+    block: npt.NDArray,
+    times: npt.ArrayLike,
+    methods: Sequence[str] = ("ols", "theil_sen", "mann_kendall"),
+    seasonal: bool = False,
+    max_bytes: int = 2**27,
+) -> dict[str, npt.NDArray]:
+    """
+    Function to calculate the trend maps of a block of the cube.
+
+    Parameters
+    ----------
+    block : numpy.ndarray
+        Block with shape (time, y, x).
+
+    times : ArrayLike
+        Dates of the block.
+
+    methods : Sequence[str] = ("ols", "theil_sen", "mann_kendall")
+        Methods to calculate, keys of METHODS.
+
+    seasonal : bool = False
+        If True, remove the monthly climatology before the trends.
+
+    max_bytes : int = 128 MiB
+        Memory for the pairwise differences.
+
+    Returns
+    -------
+    maps : dict[str, numpy.ndarray]
+        Maps with shape (y, x) by name (see METHODS).
+    """
+    n_times, ny, nx = block.shape
+    y = block.reshape(n_times, ny * nx).astype("float64")
+    t = decimal_years(times)
+
+    if seasonal:
+        y = deseasonalize(y, times)
+
+    maps = {}
+
+    if "ols" in methods:
+        maps["ols_slope"], maps["ols_pvalue"] = ols_trend(y, t)
+
+    if "theil_sen" in methods or "mann_kendall" in methods:
+        slope, s, pvalue = pairwise_trend(y, t, max_bytes)
+
+        if "theil_sen" in methods:
+            maps["theil_sen_slope"] = slope
+
+        if "mann_kendall" in methods:
+            maps["mann_kendall_s"], maps["mann_kendall_pvalue"] = s, pvalue
+
+    return {name: values.reshape(ny, nx) for name, values in maps.items()}
+
+
+def trend_maps(
+    cube: npt.NDArray,
+    times: npt.ArrayLike,
+    methods: Sequence[str] = ("ols", "theil_sen", "mann_kendall"),
+    seasonal: bool = False,
+    tile: int = 64,
+    processes: int | None = None,
+    max_bytes: int = 2**27,
+) -> dict[str, npt.NDArray]:
+    """
+    Function to calculate the per-pixel trend maps of a cube, by tiles in a
+    process pool.
+
+    The script that calls this function must do it inside a main guard
+    (if __name__ == "__main__":), so the workers can import it.
+
+    Parameters
+    ----------
+    cube : numpy.ndarray
+        Cube with shape (time, y, x) and NaN where there is no data.
+
+    times : ArrayLike
+        Dates of the cube.
+
+    methods : Sequence[str] = ("ols", "theil_sen", "mann_kendall")
+        Methods to calculate: "ols" (slope and t-test p-value), "theil_sen"
+        (slope) and "mann_kendall" (S and p-value).
+
+    seasonal : bool = False
+        If True, remove the monthly climatology of every pixel before the trends.
+
+    tile : int = 64
+        Size of the tiles in pixels.
+
+    processes : int | None = None
+        Number of worker processes, by default the number of CPUs. If it is
+        1 the tiles are processed in this process.
+
+    max_bytes : int = 128 MiB
+        Memory for the pairwise differences of every worker.
+
+    Returns
+    -------
+    maps : dict[str, numpy.ndarray]
+        Maps with shape (y, x) by name, the slopes are in units by year.
+    """
+    n_times, ny, nx = cube.shape
+    times = np.asarray(times, dtype="datetime64[D]")
+
+    windows = [
+        (slice(y0, min(y0 + tile, ny)), slice(x0, min(x0 + tile, nx)))
+        for y0 in range(0, ny, tile) for x0 in range(0, nx, tile)
+    ]
+    blocks = [cube[:, wy, wx] for wy, wx in windows]
+    options = (times, methods, seasonal, max_bytes)
+
+    if processes == 1:
+        results = [trend_block(block, *options) for block in blocks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(trend_block, blocks, *[[o] * len(blocks) for o in options]))
+
+    # Assemble the maps from the tiles
+    names = [name for method in methods for name in METHODS[method]]
+    maps = {name: np.full((ny, nx), np.nan) for name in names}
+
+    for (wy, wx), result in zip(windows, results):
+        for name in names:
+            maps[name][wy, wx] = result[name]
+
+    return maps
@@ -0,0 +1,453 @@
+# %% Dependencies imports
+import functools
+import numpy as np
+from scipy import ndimage, signal
+
+from functions.sites import pool_map
+from functions.lagged import _standardize, _chunks
+
+# %% Typing imports
+import numpy.typing as npt
+
+
+# %% Functions
+def wavelet_scales(
+    n: int, dt: float = 1.0, dj: float = 1 / 12, s0: float | None = None, j: int | None = None
+) -> npt.NDArray:
+    """
+    Function to get the scales of a continuous wavelet transform, as powers
+    of two from the smallest scale (Torrence and Compo, 1998).
+
+    Parameters
+    ----------
+    n : int
+        Length of the series.
+
+    dt : float = 1.0
+        Time step of the series (e.g. 1 month).
+
+    dj : float = 1 / 12
+        Spacing between scales in octaves.
+
+    s0 : float | None = None
+        Smallest scale, by default 2 * dt.
+
+    j : int | None = None
+        Number of scales after the smallest, by default until the scale of
+        the length of the series.
+
+    Returns
+    -------
+    scales : numpy.ndarray
+        Scales in the units of dt.
+    """
+    s0 = 2 * dt if s0 is None else s0
+    j = int(np.log2(n * dt / s0) / dj) if j is None else j
+
+    return s0 * 2.0 ** (dj * np.arange(j + 1))
+
+
+def fourier_factor(omega0: float = 6.0) -> float:
+    """
+    Function to get the ratio between the Fourier period and the scale of
+    the Morlet wavelet.
+    """
+    return 4 * np.pi / (omega0 + np.sqrt(2 + omega0 ** 2))
+
+
+def cone_of_influence(n: int, dt: float = 1.0, omega0: float = 6.0) -> npt.NDArray:
+    """
+    Function to get the cone of influence of the Morlet wavelet, the period
+    of every time step above which the edges of the series affect the
+    transform.
+
+    Parameters
+    ----------
+    n : int
+        Length of the series.
+
+    dt : float = 1.0
+        Time step of the series.
+
+    omega0 : float = 6.0
+        Nondimensional frequency of the Morlet wavelet.
+
+    Returns
+    -------
+    coi : numpy.ndarray
+        Period of the cone of influence of every time step.
+    """
+    steps = np.minimum(np.arange(n), np.arange(n)[::-1]).astype("float64")
+    steps[steps == 0] = 1e-5
+
+    return fourier_factor(omega0) / np.sqrt(2) * dt * steps
+
+
+def _frequencies(n: int, dt: float) -> npt.NDArray:
+    """
+    Angular frequencies of the FFT of a series of length n.
+    """
+    return 2 * np.pi * np.fft.fftfreq(n, dt)
+
+
+def _padded_length(n: int) -> int:
+    """
+    Length of the series padded with zeros to the next power of two, to
+    avoid the wrap around of the circular convolution.
+    """
+    return int(2 ** np.ceil(np.log2(2 * n)))
+
+
+def cwt(
+    x: npt.NDArray, scales: npt.NDArray, dt: float = 1.0, omega0: float = 6.0
+) -> npt.NDArray:
+    """
+    Function to calculate the continuous wavelet transform with the Morlet
+    wavelet of many series at once.
+
+    The convolution with the wavelet of every scale is a product in the
+    Fourier space, so the series are transformed once and all scales and
+    series are calculated with a single inverse FFT.
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        Series with shape (time,) or (time, series), without NaN.
+
+    scales : numpy.ndarray
+        Scales of the transform (see wavelet_scales()).
+
+    dt : float = 1.0
+        Time step of the series.
+
+    omega0 : float = 6.0
+        Nondimensional frequency of the Morlet wavelet.
+
+    Returns
+    -------
+    transform : numpy.ndarray
+        Complex transform with shape (series, scales, time), or (scales,
+        time) if x is 1D.
+    """
+    x = np.asarray(x, dtype="float64")
+    single = x.ndim == 1
+    x = x.reshape(len(x), -1)
+
+    n = len(x)
+    npad = _padded_length(n)
+
+    # Series without their mean and padded with zeros
+    spectrum = np.fft.fft(x - x.mean(axis=0), n=npad, axis=0).T
+
+    # Morlet wavelet of every scale in the Fourier space, normalized to unit
+    # energy, only the positive frequencies
+    k = _frequencies(npad, dt)
+    sk = scales[:, None] * k[None, :]
+    daughter = (
+        np.sqrt(2 * np.pi * scales[:, None] / dt) * np.pi ** -0.25
+        * np.exp(-0.5 * (sk - omega0) ** 2) * (k > 0)
+    )
+
+    transform = np.fft.ifft(spectrum[:, None, :] * daughter[None], axis=-1)[..., :n]
+
+    return transform[0] if single else transform
+
+
+def smooth(
+    values: npt.NDArray, scales: npt.NDArray, dt: float = 1.0, dj: float = 1 / 12
+) -> npt.NDArray:
+    """
+    Function to smooth a wavelet spectrum in time and scale, as the
+    smoothing operator of the Morlet wavelet coherence (Torrence and
+    Webster, 1999; Grinsted et al., 2004).
+
+    The time smoothing is a Gaussian with the width of every scale applied
+    in the Fourier space, the scale smoothing a boxcar of 0.6 octaves.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Spectrum with shape (..., scales, time), real or complex.
+
+    scales : numpy.ndarray
+        Scales of the spectrum.
+
+    dt : float = 1.0
+        Time step of the series.
+
+    dj : float = 1 / 12
+        Spacing between scales in octaves.
+
+    Returns
+    -------
+    smoothed : numpy.ndarray
+        Spectrum smoothed with the same shape.
+    """
+    n = values.shape[-1]
+    npad = _padded_length(n)
+
+    # Gaussian of every scale in the Fourier space
+    k = _frequencies(npad, 1.0)
+    gaussian = np.exp(-0.5 * (scales[:, None] / dt) ** 2 * k[None, :] ** 2)
+
+    smoothed = np.fft.ifft(np.fft.fft(values, n=npad, axis=-1) * gaussian, axis=-1)[..., :n]
+
+    if np.isrealobj(values):
+        smoothed = smoothed.real
+
+    # Boxcar of 0.6 octaves with fractional weights in its edges
+    steps = 0.6 / (2 * dj)
+    edge = steps % 1
+    window = np.r_[edge, np.ones(2 * int(round(steps)) - 1), edge]
+    window = window[window > 0] / window.sum()
+
+    if np.iscomplexobj(smoothed):
+        return (
+            ndimage.convolve1d(smoothed.real, window, axis=-2, mode="nearest")
+            + 1j * ndimage.convolve1d(smoothed.imag, window, axis=-2, mode="nearest")
+        )
+
+    return ndimage.convolve1d(smoothed, window, axis=-2, mode="nearest")
+
+
+def _coherence(
+    x: npt.NDArray, y: npt.NDArray, scales: npt.NDArray, dt: float, dj: float, omega0: float
+) -> tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+    """
+    Squared coherence, smoothed cross spectrum and cross spectrum of
+    standardized series.
+    """
+    wx = cwt(x, scales, dt, omega0)
+    wy = cwt(y, scales, dt, omega0)
+
+    # The spectra are divided by the scale before the smoothing
+    inverse = 1 / scales[:, None]
+    sx = smooth(np.abs(wx) ** 2 * inverse, scales, dt, dj)
+    sy = smooth(np.abs(wy) ** 2 * inverse, scales, dt, dj)
+    sxy = smooth(wx * np.conj(wy) * inverse, scales, dt, dj)
+
+    return np.clip(np.abs(sxy) ** 2 / (sx * sy), 0.0, 1.0), sxy, wx * np.conj(wy)
+
+
+def wavelet_coherence(
+    x: npt.NDArray,
+    y: npt.NDArray,
+    dt: float = 1.0,
+    dj: float = 1 / 12,
+    s0: float | None = None,
+    j: int | None = None,
+    omega0: float = 6.0,
+    max_bytes: int = 2**28,
+) -> dict[str, npt.NDArray]:
+    """
+    Function to calculate the cross wavelet spectrum and the wavelet
+    coherence with its phase of many pairs of series at once (Grinsted et
+    al., 2004). The series are standardized, so the cross spectrum is in
+    units of their variances.
+
+    Parameters
+    ----------
+    x, y : numpy.ndarray
+        Pairs of series with shape (time,) or (time, series), without NaN.
+
+    dt : float = 1.0
+        Time step of the series (e.g. 1 month).
+
+    dj : float = 1 / 12
+        Spacing between scales in octaves.
+
+    s0 : float | None = None
+        Smallest scale, by default 2 * dt.
+
+    j : int | None = None
+        Number of scales after the smallest (see wavelet_scales()).
+
+    omega0 : float = 6.0
+        Nondimensional frequency of the Morlet wavelet.
+
+    max_bytes : int = 2**28
+        Approximate memory of the transforms calculated at a time, the
+        series are split to keep it.
+
+    Returns
+    -------
+    result : dict[str, numpy.ndarray]
+        "coherence" (squared, from 0 to 1), "phase" (radians, positive if x
+        leads y) and "cross power" (modulus of the cross wavelet spectrum)
+        with shape (series, scales, time), and "scales", "period" and "coi"
+        (period of the cone of influence of every time step).
+    """
+    x, y = _standardize(x)[0], _standardize(y)[0]
+
+    if x.shape != y.shape:
+        raise ValueError(f"x and y must have the same shape, {x.shape} != {y.shape}")
+
+    n, n_series = x.shape
+    scales = wavelet_scales(n, dt, dj, s0, j)
+
+    coherence = np.empty((n_series, len(scales), n))
+    phase = np.empty((n_series, len(scales), n))
+    power = np.empty((n_series, len(scales), n))
+
+    # About ten complex arrays of (scales, padded time) by series
+    for chunk in _chunks(n_series, 10 * 16 * len(scales) * _padded_length(n), max_bytes):
+        r2, sxy, wxy = _coherence(x[:, chunk], y[:, chunk], scales, dt, dj, omega0)
+
+        coherence[chunk] = r2
+        phase[chunk] = np.angle(sxy)
+        power[chunk] = np.abs(wxy)
+
+    return {
+        "coherence": coherence,
+        "phase": phase,
+        "cross power": power,
+        "scales": scales,
+        "period": scales * fourier_factor(omega0),
+        "coi": cone_of_influence(n, dt, omega0),
+    }
+
+
+def ar1(x: npt.NDArray) -> npt.NDArray:
+    """
+    Function to estimate the lag-1 autocorrelation of series, the parameter
+    of their red noise.
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        Series with shape (time,) or (time, series), without NaN.
+
+    Returns
+    -------
+    alpha : numpy.ndarray
+        Lag-1 autocorrelation of every series.
+    """
+    z, _ = _standardize(x)
+
+    return (z[1:] * z[:-1]).sum(axis=0) / (z ** 2).sum(axis=0)
+
+
+def _red_noise(rng: np.random.Generator, alpha: float, n: int, size: int) -> npt.NDArray:
+    """
+    Series of an AR(1) process with shape (n, size), started in its
+    stationary distribution.
+    """
+    noise = rng.standard_normal((n, size))
+    noise[0] /= np.sqrt(1 - alpha ** 2)
+
+    return signal.lfilter([1.0], [1.0, -alpha], noise, axis=0)
+
+
+def _surrogate_histograms(task: tuple) -> npt.NDArray:
+    """
+    Histograms by scale of the coherence of a batch of pairs of red noise
+    series, inside the cone of influence.
+    """
+    seed, size, n, alpha_x, alpha_y, dt, dj, scales, omega0, bins = task
+    rng = np.random.default_rng(seed)
+
+    x = _red_noise(rng, alpha_x, n, size)
+    y = _red_noise(rng, alpha_y, n, size)
+    r2, _, _ = _coherence(_standardize(x)[0], _standardize(y)[0], scales, dt, dj, omega0)
+
+    # The scales without any time inside the cone use all times
+    inside = (scales * fourier_factor(omega0))[:, None] <= cone_of_influence(n, dt, omega0)[None, :]
+    inside[~inside.any(axis=1)] = True
+
+    index = np.minimum((r2 * bins).astype(int), bins - 1)
+    histograms = np.zeros((len(scales), bins))
+
+    for s in range(len(scales)):
+        histograms[s] = np.bincount(index[:, s][:, inside[s]].ravel(), minlength=bins)
+
+    return histograms
+
+
+@functools.lru_cache(maxsize=32)
+def _significance(
+    n: int, alpha_x: float, alpha_y: float, dt: float, dj: float, s0: float | None,
+    j: int | None, omega0: float, surrogates: int, level: float, batch: int,
+    processes: int | None, seed: int,
+) -> npt.NDArray:
+    scales = wavelet_scales(n, dt, dj, s0, j)
+    bins = 1000
+
+    # Independent seeds for every batch, the result doesn't depend on the
+    # number of processes
+    seeds = np.random.SeedSequence(seed).spawn(-(-surrogates // batch))
+    tasks = [
+        (s, min(batch, surrogates - i * batch), n, alpha_x, alpha_y, dt, dj, scales, omega0, bins)
+        for i, s in enumerate(seeds)
+    ]
+
+    histograms = sum(pool_map(_surrogate_histograms, tasks, processes))
+
+    # Smallest coherence above the level of the surrogates of every scale
+    cumulative = np.cumsum(histograms, axis=1) / histograms.sum(axis=1, keepdims=True)
+    threshold = (np.argmax(cumulative >= level, axis=1) + 1) / bins
+
+    threshold.flags.writeable = False
+
+    return threshold
+
+
+def coherence_significance(
+    n: int,
+    alpha_x: float,
+    alpha_y: float,
+    dt: float = 1.0,
+    dj: float = 1 / 12,
+    s0: float | None = None,
+    j: int | None = None,
+    omega0: float = 6.0,
+    surrogates: int = 1000,
+    level: float = 0.95,
+    batch: int = 50,
+    processes: int | None = None,
+    seed: int = 0,
+) -> npt.NDArray:
+    """
+    Function to get the coherence of every scale above which it is
+    significant against pairs of red noise series, with Monte Carlo
+    surrogates calculated in parallel (Grinsted et al., 2004).
+
+    The lag-1 autocorrelations are rounded to two decimals and the
+    thresholds are kept in memory, so the series with similar red noise
+    (e.g. the zones of a lagoon) share their surrogates.
+
+    Parameters
+    ----------
+    n : int
+        Length of the series.
+
+    alpha_x, alpha_y : float
+        Lag-1 autocorrelation of the series (see ar1()).
+
+    dt, dj, s0, j, omega0
+        Options of the transform, as in wavelet_coherence().
+
+    surrogates : int = 1000
+        Number of pairs of red noise series.
+
+    level : float = 0.95
+        Significance level.
+
+    batch : int = 50
+        Pairs of series calculated together by every task.
+
+    processes : int | None = None
+        Number of worker processes, by default the number of CPUs. If it is
+        1 the surrogates are calculated in this process.
+
+    seed : int = 0
+        Seed of the random generator.
+
+    Returns
+    -------
+    threshold : numpy.ndarray
+        Significant squared coherence of every scale (read-only).
+    """
+    return _significance(
+        int(n), round(float(alpha_x), 2), round(float(alpha_y), 2), float(dt), float(dj),
+        s0, j, float(omega0), int(surrogates), float(level), int(batch), processes, int(seed),
+    )
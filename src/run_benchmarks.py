@@ -0,0 +1,121 @@
+# %% Imports
+import os
+import sys
+import argparse
+import tempfile
+
+from functions.benchmarks import (
+    check_import, measure, load_stage, load_baseline, save_baseline, compare_baseline,
+    calibration, normalize,
+)
+from functions.synthetic import synthetic_series, synthetic_table, synthetic_cube, write_scenes
+
+# %% Define the import budgets
+# Modules imported by the pool workers and the short scripts, with the
+# maximum import time in seconds and the packages they must not load
+imports = {
+    "functions.stat_utils": (1.0, ["matplotlib", "statsmodels", "scipy"]),
+    "functions.store": (1.0, ["matplotlib"]),
+    "functions.sites": (0.2, ["numpy", "pandas", "matplotlib"]),
+}
+
+# %% Define the path of the baseline
+baseline_path = "benchmarks/baseline.json"
+
+# %% Read the options of the command line
+parser = argparse.ArgumentParser(
+    description="Benchmark the functions and the stages with synthetic data"
+)
+parser.add_argument(
+    "suites", nargs="*", default=["imports", "stat_utils", "rasters"],
+    help="suites to run: imports, stat_utils and rasters (by default all)",
+)
+parser.add_argument("--scale", type=int, default=1, help="size of the synthetic data")
+parser.add_argument("--repeats", type=int, default=5, help="times every benchmark is measured")
+parser.add_argument("--tolerance", type=float, default=0.5, help="relative increase accepted")
+parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline")
+args = parser.parse_args()
+
+# %% Functions to run every suite
+def bench_imports() -> tuple[dict, list[str]]:
+    results, errors = {}, []
+
+    for module, (budget, forbidden) in imports.items():
+        result, found = check_import(module, budget, forbidden, args.repeats)
+        results[f"import {module}"] = {"seconds": result["seconds"], "peak_mib": 0.0}
+        errors += found
+
+    return results, errors
+
+
+def bench_stat_utils() -> tuple[dict, list[str]]:
+    from functions.stat_utils import na_seadec, detrend_variables, corr_matrix
+
+    # Monthly series with gaps, and a wide table of variables
+    n_months = 312 * args.scale
+    series = synthetic_series(n_months, gap_fraction=0.1)
+    table = synthetic_table(n_months, n_variables=8 * args.scale)
+    variables = list(table.columns)
+
+    results = {
+        f"na_seadec[{n_months}]": measure(lambda: na_seadec(series.copy()), repeats=args.repeats),
+        f"detrend_variables[{n_months}x{len(variables)}]": measure(
+            detrend_variables, table, variables, repeats=args.repeats
+        ),
+        f"corr_matrix[{n_months}x{len(variables)}]": measure(
+            corr_matrix, table, variables, repeats=args.repeats
+        ),
+    }
+
+    return results, []
+
+
+def bench_rasters() -> tuple[dict, list[str]]:
+    stage = load_stage("src/3_process_rasters.py")
+    size = 64 * args.scale
+    n_times = 120
+
+    with tempfile.TemporaryDirectory() as folder:
+        # Write the synthetic images where the stage reads them, and save
+        # its output in the same folder
+        ndvi, temperature = synthetic_cube(n_times, size, size)
+        write_scenes(os.path.join(folder, "raster", "synthetic"), ndvi, temperature)
+
+        stage.path = os.path.join(folder, "raster", "{}") + os.sep
+        stage.save_path = os.path.join(folder, "{}_{}")
+
+        name = f"3_process_rasters[{n_times}x{size}x{size}]"
+        results = {name: measure(stage.process_site, {"key": "synthetic"}, repeats=args.repeats)}
+
+    return results, []
+
+
+suites = {"imports": bench_imports, "stat_utils": bench_stat_utils, "rasters": bench_rasters}
+
+# %% Run the suites and compare them with the baseline
+results, errors = {}, []
+
+# Speed of the machine before and after the suites, the fastest is used
+# as the unit of the relative times
+unit = calibration()
+
+for suite in args.suites:
+    found_results, found_errors = suites[suite]()
+    results.update(found_results)
+    errors += found_errors
+
+unit = min(unit, calibration())
+normalize(results, unit)
+
+print(f"calibration loop: {unit:.4f} s")
+for name, result in results.items():
+    print(f"{name}: {result['seconds']:.4f} s ({result['relative']:.2f} loops), {result['peak_mib']:.1f} MiB")
+
+if args.save_baseline:
+    save_baseline(baseline_path, results)
+else:
+    errors += compare_baseline(results, load_baseline(baseline_path), args.tolerance)
+
+if errors:
+    print(*errors, sep="\n")
+    sys.exit(1)
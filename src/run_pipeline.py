@@ -0,0 +1,192 @@
+# %% Imports
+import sys
+import argparse
+
+from functions.pipeline import run_pipeline
+from functions.telemetry import enable
+
+# %% Define the stages with their inputs and outputs as glob patterns
+# The dependencies between stages are found matching the inputs of every
+# stage with the outputs of the others
+stages = [
+    {
+        "name": "1_download_shapefiles",
+        "script": "src/1_download_shapefiles.py",
+        "inputs": [],
+        "outputs": ["data/shapefile/mangrove_forests.shp"],
+    },
+    {
+        "name": "2_download_rasters",
+        "script": "src/2_download_rasters.py",
+        "inputs": [],
+        "outputs": ["data/raster/*/*.tif"],
+    },
+    {
+        "name": "3_process_rasters",
+        "script": "src/3_process_rasters.py",
+        "inputs": ["src/sites.toml", "data/raster/*/*.tif"],
+        "outputs": ["data/processed/*_ndvi_temperature.nc"],
+    },
+    {
+        "name": "4_make_dataframes",
+        "script": "src/4_make_dataframes.py",
+        "inputs": [
+            "src/sites.toml",
+            "data/raw/*.csv",
+            "data/processed/*_ndvi_temperature.nc",
+            "data/processed/simple_soi.csv",
+            "data/shapefile/mangrove_forests.*",
+        ],
+        "outputs": ["data/processed/hydrological_spectral_mean_data.parquet"],
+    },
+    {
+        "name": "5_detrend_data",
+        "script": "src/5_detrend_data.py",
+        "inputs": ["src/sites.toml", "data/processed/hydrological_spectral_mean_data.parquet"],
+        "outputs": [
+            "data/processed/detrended_hydrological_spectral_mean_data.parquet",
+            "images/*_time_series_components.svg",
+        ],
+    },
+    {
+        "name": "6_acf_and_ccf",
+        "script": "src/6_acf_and_ccf.py",
+        "inputs": ["src/sites.toml", "data/processed/detrended_hydrological_spectral_mean_data.parquet"],
+        "outputs": ["images/*_acf_plot.svg", "images/*_ccf_plot.svg"],
+    },
+    {
+        "name": "7_prepare_lm_data",
+        "script": "src/7_prepare_lm_data.py",
+        "inputs": ["src/sites.toml", "data/processed/detrended_hydrological_spectral_mean_data.parquet"],
+        "outputs": ["data/processed/lm_data_*_interpolations.parquet", "images/*_corr_matrix_*.svg"],
+    },
+    {
+        "name": "8_linear_regression",
+        "script": "src/8_linear_regression.py",
+        "inputs": ["src/sites.toml", "data/processed/lm_data_without_interpolations.parquet"],
+        "outputs": ["models/*_model.pkl", "models/*_model.txt", "images/*_linear_model_scatterplots.svg"],
+    },
+    {
+        "name": "9_spatial_variations",
+        "script": "src/9_spatial_variations.py",
+        "inputs": ["src/sites.toml", "data/processed/*_ndvi_temperature.nc", "data/shapefile/mangrove_forests.*"],
+        "outputs": ["images/*_mean.svg", "images/*_std.svg"],
+    },
+    {
+        "name": "10_pixel_trends",
+        "script": "src/10_pixel_trends.py",
+        "inputs": ["src/sites.toml", "data/processed/*_ndvi_temperature.nc"],
+        "outputs": ["data/processed/*_trends.nc"],
+    },
+    {
+        "name": "11_pixel_correlations",
+        "script": "src/11_pixel_correlations.py",
+        "inputs": [
+            "src/sites.toml",
+            "data/processed/*_ndvi_temperature.nc",
+            "data/processed/hydrological_spectral_mean_data.parquet",
+        ],
+        "outputs": ["data/processed/*_correlations.nc"],
+    },
+    {
+        "name": "12_pixel_breaks",
+        "script": "src/12_pixel_breaks.py",
+        "inputs": ["src/sites.toml", "data/processed/*_ndvi_temperature.nc"],
+        "outputs": ["data/processed/*_breaks.nc"],
+    },
+    {
+        "name": "13_monthly_climatology",
+        "script": "src/13_monthly_climatology.py",
+        "inputs": ["src/sites.toml", "data/processed/*_ndvi_temperature.nc"],
+        "outputs": ["data/processed/*_climatology.nc"],
+    },
+    {
+        "name": "14_monthly_update",
+        "script": "src/14_monthly_update.py",
+        "inputs": ["src/sites.toml", "data/processed/hydrological_spectral_mean_data.parquet"],
+        "outputs": ["data/processed/*_monthly_state.json"],
+    },
+    {
+        "name": "15_phenology_clusters",
+        "script": "src/15_phenology_clusters.py",
+        "inputs": [
+            "src/sites.toml",
+            "data/processed/*_ndvi_temperature.nc",
+            "data/processed/*_climatology.nc",
+            "data/processed/*_trends.nc",
+            "data/processed/*_correlations.nc",
+        ],
+        "outputs": ["data/processed/*_clusters.nc", "data/processed/cluster_mean_data.parquet"],
+    },
+    {
+        "name": "16_spatial_autocorrelation",
+        "script": "src/16_spatial_autocorrelation.py",
+        "inputs": ["src/sites.toml", "data/processed/*_ndvi_temperature.nc"],
+        "outputs": ["data/processed/*_lisa.nc"],
+    },
+    {
+        "name": "17_wavelet_coherence",
+        "script": "src/17_wavelet_coherence.py",
+        "inputs": ["src/sites.toml", "data/processed/hydrological_spectral_mean_data.parquet"],
+        "outputs": ["data/processed/*_wavelet_coherence.nc", "images/*_wavelet_coherence.svg"],
+    },
+    {
+        "name": "18_forecast_ndvi",
+        "script": "src/18_forecast_ndvi.py",
+        "inputs": [
+            "src/sites.toml",
+            "data/processed/hydrological_spectral_mean_data.parquet",
+            "data/processed/cluster_mean_data.parquet",
+        ],
+        "outputs": ["data/processed/sarimax_models.json", "data/processed/ndvi_forecasts.parquet"],
+    },
+    {
+        "name": "A1_plot_images",
+        "script": "src/A1_plot_images.py",
+        "inputs": ["src/sites.toml", "data/raster/*/*.tif"],
+        "outputs": ["appendix/all_images/*.png"],
+    },
+    {
+        "name": "A2_view_gaps",
+        "script": "src/A2_view_gaps.py",
+        "inputs": ["data/processed/hydrological_spectral_mean_data.parquet"],
+        "outputs": ["appendix/gaps/*.svg"],
+    },
+    {
+        "name": "A3_select_stations",
+        "script": "src/A3_select_stations.py",
+        "inputs": ["data/shapefile/mangrove_forests.*", "data/shapefile/CNE_IDEAM.*"],
+        "outputs": ["appendix/gauge_stations/stations_of_interest.shp"],
+    },
+]
+
+# %% Read the options of the command line
+parser = argparse.ArgumentParser(
+    description="Run the stages whose inputs changed since their last run"
+)
+parser.add_argument("targets", nargs="*", help="stages to run with the stages they need (default all)")
+parser.add_argument("--force", action="store_true", help="run the stages even if their inputs didn't change")
+parser.add_argument("--jobs", type=int, default=None, help="maximum number of stages running at the same time")
+parser.add_argument("--trace", default=None, help="trace-event JSON file to save the profile of the stages")
+parser.add_argument("--trace-memory", action="store_true", help="also trace the memory allocated (slower)")
+args = parser.parse_args()
+
+# %% Switch on the trace of the stages and their workers, the trace of a
+# previous run is replaced
+if args.trace:
+    enable(args.trace, args.trace_memory, new=True)
+
+# %% Run the pipeline
+try:
+    state, failed = run_pipeline(stages, args.targets or None, force=args.force, jobs=args.jobs)
+except ValueError as error:
+    parser.error(str(error))
+
+# %% Report the timings of the last run of every stage
+for name, info in state.items():
+    print(f"{name}: {info['status']} {info['seconds']:0.1f} s ({info['finished']})")
+
+# A failed or blocked stage fails the run
+if failed:
+    print(f"{len(failed)} stages failed or blocked: {', '.join(failed)}")
+    sys.exit(1)
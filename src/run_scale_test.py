@@ -0,0 +1,113 @@
+# %% Imports
+import os
+import shutil
+import argparse
+import tempfile
+import time
+
+import rasterio
+import pandas as pd
+import geopandas as gpd
+
+from functions.benchmarks import load_stage
+from functions.synthetic import synthetic_site
+from functions.render import render_figures
+
+# %% Define the paths
+# Stages run on the synthetic sites, with the function that processes a site
+src_path = os.path.dirname(os.path.abspath(__file__))
+stages = {
+    "3_process_rasters": "process_site",
+    "4_make_dataframes": "read_spectral",
+    "9_spatial_variations": "site_jobs",
+    "10_pixel_trends": "site_trends",
+    "12_pixel_breaks": "site_breaks",
+}
+
+# %% Read the options of the command line
+parser = argparse.ArgumentParser(
+    description="Run the raster stages on synthetic sites of growing size and report their throughput"
+)
+parser.add_argument("--sizes", type=int, nargs="+", default=[64, 128, 256], help="width of the images in pixels")
+parser.add_argument("--sites", type=int, default=3, help="number of synthetic sites")
+parser.add_argument("--years", type=int, nargs=2, default=[1996, 2021], help="first and last year of the images")
+parser.add_argument("--cloud-fraction", type=float, default=0.3, help="mean fraction of the images with clouds")
+parser.add_argument("--amplitude", type=float, default=0.1, help="amplitude of the seasonal cycle of the NDVI")
+parser.add_argument("--output", default="benchmarks/scaling.csv", help="file to save the results")
+args = parser.parse_args()
+
+# %% Function to create a synthetic project with the layout of the repository
+def make_project(root: str, size: int) -> list[dict]:
+    # The stages read and save with paths relative to the root of the repository
+    for folder in ("data/processed", "data/shapefile", "images", "src"):
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
+
+    shutil.copy(os.path.join(src_path, "style.mplstyle"), os.path.join(root, "src"))
+
+    sites, forests = [], []
+
+    # One site by forest, displaced to not overlap
+    for i in range(args.sites):
+        key = f"synthetic{i}"
+        bounds = (-75.0 + 0.2 * i, 10.9, -74.9 + 0.2 * i, 10.95)
+
+        forest = synthetic_site(
+            os.path.join(root, "data", "raster", key), bounds, tuple(args.years),
+            size, args.cloud_fraction, args.amplitude, seed=i,
+        )
+
+        forests.append({"key": key, "geometry": forest})
+        sites.append({"key": key, "geometry": key, "layout": "horizontal", "number": 2 * i})
+
+    forests = gpd.GeoDataFrame(forests, crs="EPSG:4326")
+    forests.to_file(os.path.join(root, "data", "shapefile", "mangrove_forests.shp"))
+
+    return sites
+
+# %% Run the stages by size and measure their throughput
+results = []
+cwd = os.getcwd()
+
+for size in args.sizes:
+    with tempfile.TemporaryDirectory() as root:
+        sites = make_project(root, size)
+
+        try:
+            os.chdir(root)
+
+            for stage, function in stages.items():
+                process = getattr(load_stage(os.path.join(src_path, f"{stage}.py")), function)
+
+                start = time.perf_counter()
+                outputs = [process(site) for site in sites]
+
+                # The maps of stage 9 are rendered together
+                if stage == "9_spatial_variations":
+                    render_figures([job for jobs in outputs for job in jobs], manifest_path=None)
+
+                seconds = time.perf_counter() - start
+
+                # Pixels processed by all the images of all sites
+                pixels = 0
+                for site in sites:
+                    folder = os.path.join("data", "raster", site["key"])
+                    images = sorted(os.listdir(folder))
+
+                    with rasterio.open(os.path.join(folder, images[0])) as src:
+                        pixels += src.width * src.height * len(images)
+
+                results.append({
+                    "stage": stage, "size": size, "pixels": pixels, "seconds": seconds,
+                    "mpixels_per_second": pixels / seconds / 1e6,
+                })
+                print(f"{stage} [{size} px]: {seconds:.2f} s, {pixels / seconds / 1e6:.1f} Mpx/s")
+
+        finally:
+            os.chdir(cwd)
+
+# %% Show the scaling curves by stage and save them
+results = pd.DataFrame(results)
+print(results.pivot(index="size", columns="stage", values="mpixels_per_second").round(2))
+
+os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+results.to_csv(args.output, index=False)